@@ -0,0 +1,180 @@
+import argparse
+import time
+
+import numpy as np
+
+import bitboard
+import heuristic
+
+# Lockstep engine: N packed boards in one uint64 array, every operation applied
+# to all of them at once with the bitboard/heuristic row tables as NumPy
+# lookups. One call to BatchGame.step advances every live game by one move.
+# Needs NumPy; the rest of the tool stays dependency-free.
+
+MOVES = bitboard.MOVES # Action i means MOVES[i]
+
+ROW_LEFT = np.array(bitboard.ROW_LEFT, dtype=np.uint64)
+ROW_RIGHT = np.array(bitboard.ROW_RIGHT, dtype=np.uint64)
+ROW_MERGE_SCORE = np.array(bitboard.ROW_SCORE, dtype=np.int64)
+
+ROW_SCORE = [np.array(table, dtype=np.int64) for table in heuristic.ROW_SCORE]
+LINE_SMOOTH = np.array(heuristic.LINE_SMOOTH, dtype=np.int64)
+MONO_LEFT = np.array(heuristic.MONO_LEFT, dtype=np.int64)
+MONO_RIGHT = np.array(heuristic.MONO_RIGHT, dtype=np.int64)
+
+MASK16 = np.uint64(0xFFFF)
+NIBBLE = np.uint64(0xF)
+ROW_SHIFTS = [np.uint64(16 * i) for i in range(4)]
+CELL_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+
+def transpose(boards):
+    a1 = boards & np.uint64(0xF0F00F0FF0F00F0F)
+    a2 = boards & np.uint64(0x0000F0F00000F0F0)
+    a3 = boards & np.uint64(0x0F0F00000F0F0000)
+    a = a1 | (a2 << np.uint64(12)) | (a3 >> np.uint64(12))
+    b1 = a & np.uint64(0xFF00FF0000FF00FF)
+    b2 = a & np.uint64(0x00FF00FF00000000)
+    b3 = a & np.uint64(0x00000000FF00FF00)
+    return b1 | (b2 >> np.uint64(24)) | (b3 << np.uint64(24))
+
+def _rows(boards):
+    return [(boards >> s) & MASK16 for s in ROW_SHIFTS]
+
+def _apply_rows(boards, table):
+    out = np.zeros_like(boards)
+    for s, row in zip(ROW_SHIFTS, _rows(boards)):
+        out |= table[row] << s
+    return out
+
+def _line_score(boards):
+    rows = _rows(boards)
+    return sum(ROW_MERGE_SCORE[row] for row in rows)
+
+def all_moves(boards):
+    # (4, N) array of the boards after each of MOVES, plus the points scored
+    t = transpose(boards)
+    results = np.stack([
+        transpose(_apply_rows(t, ROW_LEFT)),
+        transpose(_apply_rows(t, ROW_RIGHT)),
+        _apply_rows(boards, ROW_LEFT),
+        _apply_rows(boards, ROW_RIGHT),
+    ])
+    vertical = _line_score(t)
+    horizontal = _line_score(boards)
+    scores = np.stack([vertical, vertical, horizontal, horizontal])
+    return results, scores
+
+def cells(boards):
+    # (N, 16) nibble exponents, cell r * 4 + c
+    return ((boards[:, None] >> CELL_SHIFTS) & NIBBLE).astype(np.uint8)
+
+def evaluate(boards):
+    # Vectorized heuristic.evaluate
+    rows = _rows(boards)
+    cols = _rows(transpose(boards))
+    score = sum(ROW_SCORE[r][row] for r, row in enumerate(rows))
+    score = score + sum(LINE_SMOOTH[col] for col in cols)
+    horizontal = np.maximum(sum(MONO_LEFT[row] for row in rows), sum(MONO_RIGHT[row] for row in rows))
+    vertical = np.maximum(sum(MONO_LEFT[col] for col in cols), sum(MONO_RIGHT[col] for col in cols))
+    return score + (horizontal + vertical) * heuristic.MONO_WEIGHT
+
+class BatchGame:
+    def __init__(self, n, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros(n, dtype=np.uint64)
+        self.scores = np.zeros(n, dtype=np.int64)
+        self.moves = np.zeros(n, dtype=np.int64)
+        self.alive = np.ones(n, dtype=bool)
+        everyone = np.ones(n, dtype=bool)
+        self.spawn(everyone)
+        self.spawn(everyone)
+        self.refresh()
+
+    def refresh(self):
+        # Cache every move's result; policies and step() both need them
+        self.next_boards, self.next_scores = all_moves(self.boards)
+        self.valid = (self.next_boards != self.boards[None, :]) & self.alive[None, :]
+        self.alive = self.valid.any(axis=0)
+
+    def spawn(self, mask):
+        # One tile in a random empty cell of every board selected by mask
+        empty = cells(self.boards) == 0
+        keys = self.rng.random(empty.shape)
+        keys[~empty] = -1.0
+        pos = keys.argmax(axis=1).astype(np.uint64)
+        value = np.where(self.rng.random(len(self.boards)) < 0.9, 1, 2).astype(np.uint64)
+        mask = mask & empty.any(axis=1)
+        self.boards[mask] |= value[mask] << (np.uint64(4) * pos[mask])
+
+    def step(self, actions):
+        # actions: int array indexing MOVES, one per board. Dead boards and
+        # invalid moves are left untouched. Returns which boards moved.
+        idx = np.arange(len(self.boards))
+        moved = self.valid[actions, idx]
+        self.boards = np.where(moved, self.next_boards[actions, idx], self.boards)
+        self.scores += np.where(moved, self.next_scores[actions, idx], 0)
+        self.moves += moved
+        self.spawn(moved)
+        self.refresh()
+        return moved
+
+    def max_tiles(self):
+        exps = cells(self.boards).max(axis=1).astype(np.int64)
+        return np.where(exps > 0, 1 << exps, 0)
+
+    def play(self, policy, max_steps=None):
+        steps = 0
+        while self.alive.any() and (max_steps is None or steps < max_steps):
+            self.step(policy(self))
+            steps += 1
+        return steps
+
+def random_policy(game):
+    # Uniform over each board's valid moves
+    keys = game.rng.random(game.valid.shape)
+    keys[~game.valid] = -1.0
+    return keys.argmax(axis=0)
+
+def greedy_policy(game):
+    # One ply: the valid move with the best heuristic.evaluate afterwards
+    values = evaluate(game.next_boards.reshape(-1)).reshape(game.next_boards.shape).astype(np.float64)
+    values[~game.valid] = -np.inf
+    return values.argmax(axis=0)
+
+POLICIES = {"random": random_policy, "greedy": greedy_policy}
+
+def verify(trials=2000, seed=0):
+    # Cross-check against the scalar bitboard engine and heuristic tables
+    rng = np.random.default_rng(seed)
+    exps = rng.integers(0, 12, size=(trials, 16)).astype(np.uint64)
+    exps[rng.random((trials, 16)) < 0.3] = 0
+    boards = (exps << CELL_SHIFTS).sum(axis=1, dtype=np.uint64)
+    results, scores = all_moves(boards)
+    values = evaluate(boards)
+    for i, board in enumerate(boards.tolist()):
+        for m, move in enumerate(MOVES):
+            expected, _ = bitboard.simulate_move(board, move)
+            if int(results[m, i]) != expected or int(scores[m, i]) != bitboard.score_move(board, move):
+                raise AssertionError(f"{move} mismatch for board {board:#018x}")
+        if int(values[i]) != heuristic.evaluate(board):
+            raise AssertionError(f"evaluate mismatch for board {board:#018x}")
+    return trials
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play many games in lockstep")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Vectorized engine matches bitboard on {verify()} random boards")
+
+    game = BatchGame(args.games, args.seed)
+    start = time.time()
+    steps = game.play(POLICIES[args.policy])
+    elapsed = time.time() - start
+    total = int(game.moves.sum())
+    tiles = game.max_tiles()
+    print(f"{args.games} games, {args.policy} policy: {steps} steps, {total} moves in {elapsed:.2f}s "
+          f"({total / elapsed * 60:,.0f} moves/min)")
+    print(f"Average Max Tile: {tiles.mean():.1f}, Best: {tiles.max()}, Average Score: {game.scores.mean():.1f}")
@@ -0,0 +1,355 @@
+import argparse
+import json
+import os
+import platform
+import random
+import time
+
+import bitboard
+import heuristic
+import search
+from test_ai import Game2048Simulator
+
+# Search performance benchmark over a fixed, checked-in position corpus
+# (bench_positions.json). Measures throughput of simulate_move, evaluate and
+# expectimax plus get_best_move latency percentiles, writes the results as
+# JSON and can compare them against a stored baseline.
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_positions.json")
+
+# Higher is better for throughput, lower is better for latency
+HIGHER_IS_BETTER = ("_per_sec",)
+
+def phase_of(grid):
+    empty = sum(row.count(0) for row in grid)
+    if empty >= 8: return "early"
+    if empty >= 2: return "mid"
+    return "near_full"
+
+def make_corpus(seed=2048, per_phase=8):
+    # Positions from seeded AI games, bucketed by how full the board is.
+    # Near-full boards (the depth-7 case) are the rarest, so keep playing
+    # until every bucket is filled.
+    buckets = {"early": [], "mid": [], "near_full": []}
+    game_seed = seed
+    while any(len(b) < per_phase for b in buckets.values()):
+        sim = Game2048Simulator(seed=game_seed)
+        rng = random.Random(game_seed)
+        while True:
+            move = sim.get_best_move()
+            if move == "None": break
+            phase = phase_of(sim.grid)
+            if len(buckets[phase]) < per_phase and rng.random() < 0.05:
+                buckets[phase].append([row[:] for row in sim.grid])
+            sim.grid, _ = sim.simulate_move(sim.grid, move)
+            sim.spawn_tile()
+        game_seed += 1
+    return [{"phase": phase, "grid": grid} for phase, grids in buckets.items() for grid in grids]
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path) as f:
+        return json.load(f)["positions"]
+
+def percentile(values, p):
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+def timed_rate(fn, items, min_time):
+    # Calls fn on every item repeatedly until min_time has passed; calls/sec
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for item in items:
+            fn(item)
+        count += len(items)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return count / elapsed
+
+def bench_simulate_move(grids, min_time):
+    sim = Game2048Simulator(seed=0)
+    pairs = [(g, m) for g in grids for m in bitboard.MOVES]
+    boards = [(bitboard.from_grid(g), m) for g, m in pairs]
+    return {
+        "list_moves_per_sec": timed_rate(lambda p: sim.simulate_move(p[0], p[1]), pairs, min_time),
+        "bitboard_moves_per_sec": timed_rate(lambda p: bitboard.simulate_move(p[0], p[1]), boards, min_time),
+    }
+
+def bench_evaluate(grids, min_time):
+    sim = Game2048Simulator(seed=0)
+    boards = [bitboard.from_grid(g) for g in grids]
+    return {
+        "list_evals_per_sec": timed_rate(sim.evaluate, grids, min_time),
+        "table_evals_per_sec": timed_rate(heuristic.evaluate, boards, min_time),
+    }
+
+def bench_expectimax(grids, depth):
+    # Fixed-depth expectimax from each root board, nodes/sec
+    s = search.ExpectimaxSearch(rng=random.Random(0))
+    nodes = 0
+    start = time.perf_counter()
+    for grid in grids:
+        s.tt.clear()
+        s.nodes = 0
+        s.expectimax(bitboard.from_grid(grid), depth, True)
+        nodes += s.nodes
+    elapsed = time.perf_counter() - start
+    return {"depth": depth, "nodes": nodes, "nodes_per_sec": nodes / elapsed}
+
+def bench_incremental(positions, depths=(5, 6, 7), prob_threshold=None, repeat=3):
+    # Fixed-depth search with and without incremental leaf scoring, nodes/sec
+    # (best of repeat) per depth. Both must give identical root scores and
+    # node counts.
+    results = {}
+    boards = [bitboard.from_grid(p["grid"]) for p in positions]
+    for depth in depths:
+        rates = {}
+        scores = {}
+        counts = {}
+        for incremental in (False, True) * repeat:
+            s = search.ExpectimaxSearch(prob_threshold=prob_threshold)
+            s.incremental = incremental
+            nodes = 0
+            found = []
+            start = time.perf_counter()
+            for i, board in enumerate(boards):
+                s.rng = random.Random(i)
+                s.tt.clear()
+                s.nodes = 0
+                s.search_root(board, depth)
+                nodes += s.nodes
+                found.append(s.root_scores)
+            rate = nodes / (time.perf_counter() - start)
+            rates[incremental] = max(rates.get(incremental, 0.0), rate)
+            scores[incremental] = found
+            counts[incremental] = nodes
+        if scores[False] != scores[True] or counts[False] != counts[True]:
+            raise AssertionError(f"incremental leaves changed the root scores or node count at depth {depth}")
+        results[f"depth_{depth}"] = {
+            "full_nodes_per_sec": rates[False],
+            "incremental_nodes_per_sec": rates[True],
+            "speedup": rates[True] / rates[False],
+        }
+    return results
+
+def bench_bounded(positions, repeat=1):
+    # Star1 bounded search against the full one with default settings
+    # (sampling, transposition table) and with the deterministic expansion:
+    # nodes, time and how often the root move agreed. search.verify_bounded
+    # is the exact check; with a table the two can differ by transpositions.
+    boards = [bitboard.from_grid(p["grid"]) for p in positions]
+    results = {}
+    for label, prob_threshold in (("sampled", None), ("prob_threshold_1e-4", 1e-4)):
+        nodes = [0, 0]
+        elapsed = [0.0, 0.0]
+        agreed = 0
+        for _ in range(repeat):
+            for i, board in enumerate(boards):
+                moves = []
+                for bounded in (False, True):
+                    s = search.ExpectimaxSearch(prob_threshold=prob_threshold, rng=random.Random(i), bounded=bounded)
+                    start = time.perf_counter()
+                    moves.append(s.get_best_move(bitboard.to_grid(board)))
+                    elapsed[bounded] += time.perf_counter() - start
+                    nodes[bounded] += s.nodes
+                agreed += moves[0] == moves[1]
+        results[label] = {
+            "full_nodes": nodes[0],
+            "bounded_nodes": nodes[1],
+            "node_reduction": 1 - nodes[1] / nodes[0],
+            "full_ms": elapsed[0] * 1000,
+            "bounded_ms": elapsed[1] * 1000,
+            "same_move": agreed / (len(boards) * repeat),
+        }
+    return results
+
+def bench_get_best_move(positions, repeat):
+    # Hint latency on the default GUI/simulator settings, split by phase
+    s = search.ExpectimaxSearch(rng=random.Random(0))
+    latencies = {"all": []}
+    for _ in range(repeat):
+        for pos in positions:
+            start = time.perf_counter()
+            s.get_best_move(pos["grid"])
+            ms = (time.perf_counter() - start) * 1000
+            latencies["all"].append(ms)
+            latencies.setdefault(pos["phase"], []).append(ms)
+
+    results = {}
+    for phase, values in latencies.items():
+        results[phase] = {
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99),
+            "max_ms": max(values),
+            "hints_per_sec": len(values) / (sum(values) / 1000),
+        }
+    return results
+
+def _deepen(s, board, depth):
+    # get_best_move's iterative deepening, run to a fixed depth instead of a
+    # deadline so both searches do the same job; returns the nodes it took
+    if s.persistent:
+        s.rebase(board)
+    else:
+        s.tt.clear()
+    s.nodes = 0
+    for d in range(1, depth + 1):
+        s.search_root(board, d)
+    return s.nodes
+
+def bench_search_reuse(seed=0, max_moves=None):
+    # Nodes per move with and without a persistent search context, over one
+    # seeded game played by the persistent search. Every position is searched
+    # by both, fixed-depth (the simulator default) and deepening one ply at a
+    # time to the same depth (what a deadline search does).
+    sim = Game2048Simulator(seed=seed)
+    fresh = search.ExpectimaxSearch(rng=random.Random(seed))
+    persistent = search.ExpectimaxSearch(rng=random.Random(seed), persistent=True)
+    deepen_fresh = search.ExpectimaxSearch(rng=random.Random(seed))
+    deepen_persistent = search.ExpectimaxSearch(rng=random.Random(seed), persistent=True)
+    nodes = {"fixed_fresh": 0, "fixed_persistent": 0, "deepen_fresh": 0, "deepen_persistent": 0}
+    times = {"fixed_fresh": 0.0, "fixed_persistent": 0.0}
+    carried = pruned = moves = 0
+    while max_moves is None or moves < max_moves:
+        grid = [row[:] for row in sim.grid]
+        board = bitboard.from_grid(grid)
+        start = time.perf_counter()
+        fresh.get_best_move(grid)
+        times["fixed_fresh"] += time.perf_counter() - start
+        nodes["fixed_fresh"] += fresh.nodes
+
+        start = time.perf_counter()
+        move = persistent.get_best_move(grid)
+        times["fixed_persistent"] += time.perf_counter() - start
+        nodes["fixed_persistent"] += persistent.nodes
+        carried += persistent.carried
+        pruned += persistent.pruned
+
+        depth = search.pick_depth(bitboard.count_empty(board))
+        nodes["deepen_fresh"] += _deepen(deepen_fresh, board, depth)
+        nodes["deepen_persistent"] += _deepen(deepen_persistent, board, depth)
+
+        if move == "None": break
+        sim.grid, _ = sim.simulate_move(sim.grid, move)
+        sim.spawn_tile()
+        moves += 1
+
+    moves = max(1, moves)
+    results = {"moves": moves, "max_tile": max(max(row) for row in sim.grid),
+               "carried_entries_per_move": carried / moves, "pruned_entries_per_move": pruned / moves}
+    for mode in ("fixed", "deepen"):
+        before, after = nodes[mode + "_fresh"], nodes[mode + "_persistent"]
+        results[mode] = {
+            "fresh_nodes_per_move": before / moves,
+            "persistent_nodes_per_move": after / moves,
+            "saved_nodes_per_move": (before - after) / moves,
+            "saved_fraction": (before - after) / max(1, before),
+        }
+    results["fixed"]["fresh_ms_per_move"] = times["fixed_fresh"] * 1000 / moves
+    results["fixed"]["persistent_ms_per_move"] = times["fixed_persistent"] * 1000 / moves
+    return results
+
+def run_benchmarks(positions, min_time=1.0, depth=4, repeat=3):
+    grids = [p["grid"] for p in positions]
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "positions": len(positions),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "simulate_move": bench_simulate_move(grids, min_time),
+        "evaluate": bench_evaluate(grids, min_time),
+        "expectimax": bench_expectimax(grids, depth),
+        "get_best_move": bench_get_best_move(positions, repeat),
+    }
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if key == "meta": continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, float):
+            flat[name] = value
+    return flat
+
+def compare(results, baseline, tolerance=0.10):
+    # Returns (metric, baseline, current, change) for every metric that got
+    # worse by more than tolerance
+    current = flatten(results)
+    regressions = []
+    for name, old in flatten(baseline).items():
+        new = current.get(name)
+        if new is None or old == 0: continue
+        change = (new - old) / old
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        if worse > tolerance:
+            regressions.append((name, old, new, change))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark move generation, evaluation and search")
+    parser.add_argument("--out", default=None, help="write results JSON here")
+    parser.add_argument("--compare", default=None, help="baseline results JSON to check against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown (0.10 = 10%%)")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds per throughput benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the corpus for latency")
+    parser.add_argument("--make-corpus", action="store_true", help="regenerate bench_positions.json")
+    parser.add_argument("--reuse", action="store_true",
+                        help="only measure the nodes a persistent search context saves over one full game")
+    parser.add_argument("--seed", type=int, default=0, help="game seed for --reuse")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only compare incremental and full leaf evaluation at depths 5-7")
+    parser.add_argument("--bounded", action="store_true",
+                        help="only prove bounded (Star1) search picks the same moves and report its node reduction")
+    args = parser.parse_args()
+
+    if args.bounded:
+        positions = load_corpus()
+        full, bounded = search.verify_bounded([bitboard.from_grid(p["grid"]) for p in positions])
+        print(f"Bounded search made the same decision at the same score on all {len(positions)} positions "
+              f"({full} -> {bounded} nodes, {1 - bounded / full:.1%} fewer)")
+        print(json.dumps(bench_bounded(positions), indent=2))
+        raise SystemExit(0)
+
+    if args.incremental:
+        positions = load_corpus()
+        print(json.dumps({"sampled": bench_incremental(positions),
+                          "prob_threshold_1e-4": bench_incremental(positions, prob_threshold=1e-4)}, indent=2))
+        raise SystemExit(0)
+
+    if args.reuse:
+        print(json.dumps(bench_search_reuse(args.seed), indent=2))
+        raise SystemExit(0)
+
+    if args.make_corpus:
+        positions = make_corpus()
+        with open(CORPUS_PATH, "w") as f:
+            f.write('{"positions": [\n')
+            f.write(",\n".join(json.dumps(p) for p in positions))
+            f.write("\n]}\n")
+        print(f"Wrote {len(positions)} positions to {CORPUS_PATH}")
+
+    positions = load_corpus()
+    results = run_benchmarks(positions, args.min_time, repeat=args.repeat)
+    print(json.dumps(results, indent=2))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, old, new, change in regressions:
+            print(f"REGRESSION {name}: {old:.3f} -> {new:.3f} ({change:+.1%})")
+        if regressions:
+            raise SystemExit(1)
+        print("No regressions against baseline")
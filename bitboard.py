@@ -0,0 +1,181 @@
+import random
+
+# Packed board: 16 nibbles in one int, each nibble is log2 of the tile (0 = empty).
+# Cell (r, c) lives at nibble r * 4 + c, so row r is bits 16*r .. 16*r + 15.
+# Nibbles cap at 15 (32768). Two 32768 tiles merging saturate at 32768 instead
+# of overflowing into the next cell; grids with bigger tiles can't be packed.
+
+MOVES = ["Up", "Down", "Left", "Right"]
+SIZE = 4
+CELL_BITS = 4 # As nboard.BoardEngine, which stands in for this module on other sizes
+MAX_EXPONENT = 15
+ROW_MASK = 0xFFFF
+
+def _slide_row_left(cells):
+    # Same rules as simulate_move: each tile merges at most once per move
+    out = [c for c in cells if c != 0]
+    result = []
+    i = 0
+    while i < len(out):
+        if i + 1 < len(out) and out[i] == out[i + 1]:
+            result.append(min(out[i] + 1, MAX_EXPONENT))
+            i += 2
+        else:
+            result.append(out[i])
+            i += 1
+    return result + [0] * (4 - len(result))
+
+def _merge_score(cells):
+    # Points scored by sliding one line. Equal neighbours (ignoring gaps) pair
+    # up the same number of times whichever end they slide to, so this is the
+    # same for left and right.
+    out = [c for c in cells if c != 0]
+    score = 0
+    i = 0
+    while i < len(out):
+        if i + 1 < len(out) and out[i] == out[i + 1]:
+            score += 1 << min(out[i] + 1, MAX_EXPONENT)
+            i += 2
+        else:
+            i += 1
+    return score
+
+def _build_row_tables():
+    left = [0] * 65536
+    right = [0] * 65536
+    score = [0] * 65536
+    for row in range(65536):
+        cells = [(row >> (4 * i)) & 0xF for i in range(4)]
+        score[row] = _merge_score(cells)
+
+        moved = _slide_row_left(cells)
+        left[row] = moved[0] | (moved[1] << 4) | (moved[2] << 8) | (moved[3] << 12)
+
+        moved = _slide_row_left(cells[::-1])[::-1]
+        right[row] = moved[0] | (moved[1] << 4) | (moved[2] << 8) | (moved[3] << 12)
+    return left, right, score
+
+# Built once at import, ~65k entries each
+ROW_LEFT, ROW_RIGHT, ROW_SCORE = _build_row_tables()
+# Sum of the tile values in a row
+ROW_SUM = [sum(1 << ((row >> (4 * i)) & 0xF) for i in range(4) if (row >> (4 * i)) & 0xF) for row in range(65536)]
+
+def transpose(board):
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+def move_left(board):
+    return (ROW_LEFT[board & ROW_MASK]
+            | (ROW_LEFT[(board >> 16) & ROW_MASK] << 16)
+            | (ROW_LEFT[(board >> 32) & ROW_MASK] << 32)
+            | (ROW_LEFT[(board >> 48) & ROW_MASK] << 48))
+
+def move_right(board):
+    return (ROW_RIGHT[board & ROW_MASK]
+            | (ROW_RIGHT[(board >> 16) & ROW_MASK] << 16)
+            | (ROW_RIGHT[(board >> 32) & ROW_MASK] << 32)
+            | (ROW_RIGHT[(board >> 48) & ROW_MASK] << 48))
+
+def move_up(board):
+    return transpose(move_left(transpose(board)))
+
+def move_down(board):
+    return transpose(move_right(transpose(board)))
+
+MOVE_FUNCS = {
+    "Up": move_up,
+    "Down": move_down,
+    "Left": move_left,
+    "Right": move_right,
+}
+
+def simulate_move(board, direction):
+    # Packed counterpart of simulate_move(grid, direction)
+    new_board = MOVE_FUNCS[direction](board)
+    return new_board, new_board != board
+
+def score_move(board, direction):
+    # Points the move would score (sum of the merged tiles)
+    if direction in ("Up", "Down"):
+        board = transpose(board)
+    return (ROW_SCORE[board & ROW_MASK] + ROW_SCORE[(board >> 16) & ROW_MASK]
+            + ROW_SCORE[(board >> 32) & ROW_MASK] + ROW_SCORE[(board >> 48) & ROW_MASK])
+
+def can_pack(grid):
+    return all(v <= 2 ** MAX_EXPONENT for row in grid for v in row)
+
+def from_grid(grid):
+    board = 0
+    for r in range(4):
+        for c in range(4):
+            v = grid[r][c]
+            if v:
+                exp = v.bit_length() - 1
+                if exp > MAX_EXPONENT or v != 1 << exp:
+                    raise ValueError(f"Tile {v} can't be packed")
+                board |= exp << (4 * (r * 4 + c))
+    return board
+
+def to_grid(board):
+    grid = [[0] * 4 for _ in range(4)]
+    for r in range(4):
+        for c in range(4):
+            exp = (board >> (4 * (r * 4 + c))) & 0xF
+            if exp:
+                grid[r][c] = 1 << exp
+    return grid
+
+def empty_positions(board):
+    # Nibble indices (r * 4 + c) of empty cells
+    return [i for i in range(16) if not (board >> (4 * i)) & 0xF]
+
+def count_empty(board):
+    count = 0
+    for i in range(16):
+        if not (board >> (4 * i)) & 0xF:
+            count += 1
+    return count
+
+def tile_sum(board):
+    # Moves keep it (short of saturating 32768s) and every spawn adds 2 or 4
+    return (ROW_SUM[board & ROW_MASK] + ROW_SUM[(board >> 16) & ROW_MASK]
+            + ROW_SUM[(board >> 32) & ROW_MASK] + ROW_SUM[(board >> 48) & ROW_MASK])
+
+def max_tile(board):
+    exp = max((board >> (4 * i)) & 0xF for i in range(16))
+    return 1 << exp if exp else 0
+
+def verify_against(reference_move, trials=20000, seed=0):
+    # Exact-equivalence check of the packed engine vs. a list-based simulate_move
+    rng = random.Random(seed)
+    for _ in range(trials):
+        # Small exponent ranges give lots of merges, wide ones cover big tiles.
+        # Stay below 32768 so the saturating merge never kicks in.
+        top = rng.choice([2, 4, 14])
+        grid = [[0] * 4 for _ in range(4)]
+        for r in range(4):
+            for c in range(4):
+                if rng.random() < 0.7:
+                    grid[r][c] = 2 ** rng.randint(1, top)
+        board = from_grid(grid)
+        if to_grid(board) != grid:
+            raise AssertionError(f"Pack/unpack mismatch for {grid}")
+        for move in MOVES:
+            expected_grid, expected_moved = reference_move([row[:] for row in grid], move)
+            new_board, moved = simulate_move(board, move)
+            if to_grid(new_board) != expected_grid or moved != expected_moved:
+                raise AssertionError(f"{move} mismatch for {grid}: "
+                                     f"got {to_grid(new_board)}, expected {expected_grid}")
+    return trials
+
+if __name__ == "__main__":
+    from test_ai import Game2048Simulator
+
+    checked = verify_against(Game2048Simulator().simulate_move)
+    print(f"Bitboard engine matches simulate_move on {checked} random boards")
@@ -0,0 +1,228 @@
+import argparse
+import bisect
+import mmap
+import multiprocessing
+import struct
+import sys
+import time
+from array import array
+
+import bitboard
+import search
+
+# Endgame table: precomputed best move and value for near-full boards (fewer
+# than 2 empty cells), the positions where get_best_move goes to depth 7 and
+# hints are slowest. Built offline from the positions seeded AI games
+# actually reach, each solved with a deterministic (prob_threshold) search.
+#
+# File layout, little-endian: a 32-byte header (magic "2048EGDB", version,
+# count, search depth, reserved, prob_threshold), then count sorted uint64
+# board keys, count float64 values and count uint8 move indices. Lookups
+# binary-search the keys straight from a memory map, so opening a table
+# costs nothing however big it is.
+#
+# Values are on the scale of the evaluator the table was built with
+# (heuristic.evaluate); only pass a table to a search using the same one.
+# Nothing plays with a table yet (ExpectimaxSearch(endgame=...) is the hook):
+# it only hits on positions from the games it was built from. Held-out games
+# score 0 hits, with or without folding the 8 board symmetries into one key
+# (and the heuristic isn't symmetric, so a mirrored entry wouldn't be the
+# move the search picks anyway). The check below reports this.
+
+MAGIC = b"2048EGDB"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIId")
+KEY = struct.Struct("<Q")
+VALUE = struct.Struct("<d")
+CRITICAL_EMPTY = 2 # Boards with fewer empty cells than this are stored
+
+def is_critical(board):
+    return bitboard.count_empty(board) < CRITICAL_EMPTY
+
+class _Keys:
+    # Sequence view of the mapped key array, for bisect
+    def __init__(self, data, count):
+        self.data = data
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return KEY.unpack_from(self.data, HEADER.size + 8 * i)[0]
+
+class EndgameTable:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} endgame table")
+        magic, version, self.count, self.depth, _, self.prob_threshold = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} endgame table")
+        if len(self.map) != HEADER.size + 17 * self.count:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+        self.critical_empty = CRITICAL_EMPTY
+        self.keys = _Keys(self.map, self.count)
+        self.values_at = HEADER.size + 8 * self.count
+        self.moves_at = self.values_at + 8 * self.count
+        self.lookups = 0
+        self.hits = 0
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, board):
+        # (move, value) for a stored board, else None
+        self.lookups += 1
+        i = bisect.bisect_left(self.keys, board)
+        if i == self.count or self.keys[i] != board:
+            return None
+        self.hits += 1
+        value = VALUE.unpack_from(self.map, self.values_at + 8 * i)[0]
+        return bitboard.MOVES[self.map[self.moves_at + i]], value
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+def write_table(path, entries, depth, prob_threshold):
+    # entries: {board: (move, value)}
+    keys = array('Q', sorted(entries))
+    values = array('d', (entries[k][1] for k in keys))
+    moves = bytes(bitboard.MOVES.index(entries[k][0]) for k in keys)
+    if sys.byteorder != "little":
+        keys.byteswap()
+        values.byteswap()
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys), depth, 0, prob_threshold))
+        keys.tofile(f)
+        values.tofile(f)
+        f.write(moves)
+
+def collect_positions(games, seed, deadline_ms=5, expand=False):
+    # Critical boards seen (player to move) in seeded AI games. With expand,
+    # also every critical board one move and spawn further on, since those
+    # are where a game that reached this position goes next.
+    from test_ai import Game2048Simulator # Only needed to build or check a table
+    boards = set()
+    for game in range(games):
+        sim = Game2048Simulator(deadline_ms=deadline_ms, seed=seed + game)
+        while True:
+            board = bitboard.from_grid(sim.grid)
+            if is_critical(board):
+                boards.add(board)
+            move = sim.get_best_move(deadline_ms)
+            if move == "None": break
+            sim.grid, _ = sim.simulate_move(sim.grid, move)
+            sim.spawn_tile()
+            if not bitboard.can_pack(sim.grid): break
+
+    if expand:
+        for board in list(boards):
+            for move in bitboard.MOVES:
+                after, moved = bitboard.simulate_move(board, move)
+                if not moved: continue
+                for pos in bitboard.empty_positions(after):
+                    for tile in (1, 2):
+                        child = after | (tile << (4 * pos))
+                        if is_critical(child):
+                            boards.add(child)
+    return boards
+
+_solver = None
+
+def _init_solver(depth, prob_threshold):
+    global _solver
+    _solver = (search.ExpectimaxSearch(prob_threshold=prob_threshold), depth)
+
+def _solve(board):
+    s, depth = _solver
+    s.tt.clear()
+    move = s.search_root(board, depth)
+    if move == "None":
+        return board, None
+    return board, (move, s.root_scores[move])
+
+def solve_positions(boards, depth=7, prob_threshold=1e-4, workers=1):
+    entries = {}
+    args = (depth, prob_threshold)
+    pool = multiprocessing.Pool(workers, initializer=_init_solver, initargs=args) if workers > 1 else None
+    try:
+        if pool:
+            results = pool.imap_unordered(_solve, boards, chunksize=8)
+        else:
+            _init_solver(*args)
+            results = map(_solve, boards)
+        for board, entry in results:
+            if entry is not None:
+                entries[board] = entry
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return entries
+
+def check(table, games, seed, deadline_ms=5, boards=None):
+    # Hit rate on games that weren't used to build the table, and how the
+    # lookup compares with the fixed-depth search it replaces. Pass boards to
+    # time a given set of positions instead of playing games.
+    if boards is None:
+        boards = collect_positions(games, seed, deadline_ms)
+    plain = search.ExpectimaxSearch()
+    with_table = search.ExpectimaxSearch(endgame=table)
+    grids = [bitboard.to_grid(b) for b in sorted(boards)]
+    found = sum(1 for b in boards if table.lookup(b) is not None)
+
+    start = time.perf_counter()
+    for grid in grids:
+        plain.get_best_move(grid)
+    plain_time = time.perf_counter() - start
+
+    table.lookups = table.hits = 0
+    start = time.perf_counter()
+    for grid in grids:
+        with_table.get_best_move(grid)
+    table_time = time.perf_counter() - start
+    # found: root positions in the table; table.hits adds those met inside the tree
+    return len(grids), found, table.hits, plain_time, table_time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or check the near-full-board endgame table")
+    parser.add_argument("path", help="table file to write (or, with --check-only, to read)")
+    parser.add_argument("--games", type=int, default=20, help="seeded AI games to collect positions from")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--depth", type=int, default=7, help="search depth each position is solved to")
+    parser.add_argument("--threshold", type=float, default=1e-4, help="probability cutoff of the solving search")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--expand", action="store_true", help="also store critical boards one move further on")
+    parser.add_argument("--check-games", type=int, default=3, help="held-out games for the hit-rate check")
+    parser.add_argument("--check-only", action="store_true", help="skip building, just check an existing table")
+    args = parser.parse_args()
+
+    if not args.check_only:
+        start = time.time()
+        boards = collect_positions(args.games, args.seed, expand=args.expand)
+        print(f"Collected {len(boards)} critical positions from {args.games} games in {time.time() - start:.1f}s")
+        start = time.time()
+        entries = solve_positions(boards, args.depth, args.threshold, args.workers)
+        write_table(args.path, entries, args.depth, args.threshold)
+        print(f"Solved {len(entries)} positions at depth {args.depth} in {time.time() - start:.1f}s -> {args.path}")
+
+    table = EndgameTable(args.path)
+    try:
+        if args.check_games:
+            # Held-out seeds start right after the ones the table was built from
+            stored = [table.keys[i] for i in range(0, len(table), max(1, len(table) // 20))]
+            held_out = check(table, args.check_games, args.seed + args.games)
+            for label, (count, found, hits, plain_time, table_time) in (
+                    ("Stored positions", check(table, 0, 0, boards=stored)), ("Held-out games", held_out)):
+                print(f"{label}: {found}/{count} critical positions in the table ({found / max(1, count):.1%}), "
+                      f"{hits} table hits including inside the tree")
+                print(f"  fixed-depth search {plain_time / max(1, count) * 1000:.1f} ms/position, "
+                      f"with table {table_time / max(1, count) * 1000:.1f} ms/position")
+    finally:
+        table.close()
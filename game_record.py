@@ -0,0 +1,242 @@
+import argparse
+import mmap
+import random
+import struct
+from array import array
+from collections import Counter
+
+import bitboard
+
+# Compact binary game records. A file is a 16-byte header followed by games
+# back to back; each game is a fixed 24-byte header and then one byte per
+# event:
+#
+#   file header: magic "2048GREC", version u32, reserved u32
+#   game header: seed i64 (-1 if unseeded), score i64, turns u32, max tile u32
+#   events:      2 initial spawns, then one byte per turn (move + the spawn after it)
+#
+# An event byte is  bits 0-3 spawn cell (r * 4 + c), bit 4 spawn is a 4,
+# bits 5-6 index into bitboard.MOVES (0 for the initial spawns). Moves and
+# spawns determine the game completely, so any position can be rebuilt by
+# replaying from the start. Everything is little-endian.
+
+MAGIC = b"2048GREC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<8sII")
+GAME_HEADER = struct.Struct("<qqII")
+MOVE_INDEX = {m: i for i, m in enumerate(bitboard.MOVES)}
+
+def encode_event(move, cell, exponent):
+    return (move << 5) | ((exponent - 1) << 4) | cell
+
+def decode_event(byte):
+    # (move index, cell, tile exponent)
+    return byte >> 5, byte & 0xF, ((byte >> 4) & 1) + 1
+
+def encode_game(seed, score, max_tile, moves, spawns):
+    # moves: directions as in bitboard.MOVES; spawns: (cell, exponent) with
+    # two more entries than moves (the opening tiles)
+    if len(spawns) != len(moves) + 2:
+        raise ValueError("a game needs exactly one spawn per move plus two opening spawns")
+    events = bytearray(encode_event(0, cell, exp) for cell, exp in spawns[:2])
+    events.extend(encode_event(MOVE_INDEX[m], cell, exp) for m, (cell, exp) in zip(moves, spawns[2:]))
+    seed = -1 if seed is None else seed
+    return GAME_HEADER.pack(seed, score, len(moves), max_tile) + bytes(events)
+
+class RecordWriter:
+    def __init__(self, path, append=False):
+        self.file = open(path, "ab" if append else "wb")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION, 0))
+        self.games = 0
+
+    def write(self, game_bytes):
+        self.file.write(game_bytes)
+        self.games += 1
+
+    def write_game(self, seed, score, max_tile, moves, spawns):
+        self.write(encode_game(seed, score, max_tile, moves, spawns))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class GameView:
+    # One game inside a mapped file: the header plus a copy of its event
+    # bytes; boards are only rebuilt when asked for
+    def __init__(self, data, offset):
+        self.seed, self.score, self.turns, self.max_tile = GAME_HEADER.unpack_from(data, offset)
+        start = offset + GAME_HEADER.size
+        self.events = data[start:start + self.turns + 2]
+
+    def start_board(self):
+        board = 0
+        for byte in self.events[:2]:
+            _, cell, exp = decode_event(byte)
+            board |= exp << (4 * cell)
+        return board
+
+    def positions(self):
+        # (board before the move, move, score so far) for every turn
+        board = self.start_board()
+        score = 0
+        for byte in self.events[2:]:
+            move_index, cell, exp = decode_event(byte)
+            move = bitboard.MOVES[move_index]
+            yield board, move, score
+            score += bitboard.score_move(board, move)
+            board, _ = bitboard.simulate_move(board, move)
+            board |= exp << (4 * cell)
+
+    def board_at(self, turn):
+        # Packed board after `turn` moves (0 = opening position) and the score then
+        if not 0 <= turn <= self.turns:
+            raise IndexError(f"turn {turn} out of range 0..{self.turns}")
+        for i, (board, _, score) in enumerate(self.positions()):
+            if i == turn:
+                return board, score
+        return self.final_board()
+
+    def final_board(self):
+        board, score = self.start_board(), 0
+        for board, move, score in self.positions():
+            pass
+        if self.turns:
+            score += bitboard.score_move(board, move)
+            board, _ = bitboard.simulate_move(board, move)
+            _, cell, exp = decode_event(self.events[-1])
+            board |= exp << (4 * cell)
+        return board, score
+
+class RecordReader:
+    # Memory-maps a record file; games are found by hopping from header to
+    # header, so only the offset index (8 bytes a game) lives in memory
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < FILE_HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a game record file")
+        magic, version, _ = FILE_HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} game record file")
+        self.offsets = None
+
+    def index(self):
+        if self.offsets is None:
+            offsets = array('Q')
+            offset = FILE_HEADER.size
+            end = len(self.map)
+            while offset + GAME_HEADER.size <= end:
+                offsets.append(offset)
+                turns = GAME_HEADER.unpack_from(self.map, offset)[2]
+                offset += GAME_HEADER.size + turns + 2
+            if offset != end:
+                raise ValueError("record file is truncated")
+            self.offsets = offsets
+        return self.offsets
+
+    def __len__(self):
+        return len(self.index())
+
+    def __getitem__(self, i):
+        return GameView(self.map, self.index()[i])
+
+    def __iter__(self):
+        for offset in self.index():
+            yield GameView(self.map, offset)
+
+    def positions(self):
+        # (game number, turn, board, move, score) over every game in the file
+        for g, game in enumerate(self):
+            for turn, (board, move, score) in enumerate(game.positions()):
+                yield g, turn, board, move, score
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def random_game(seed):
+    # A quick seeded game with a uniformly random policy, for self-checks
+    rng = random.Random(seed)
+    board, score = 0, 0
+    moves, spawns = [], []
+    for _ in range(2):
+        cell = rng.choice(bitboard.empty_positions(board))
+        exp = 1 if rng.random() < 0.9 else 2
+        board |= exp << (4 * cell)
+        spawns.append((cell, exp))
+    while True:
+        options = [(m, b) for m, (b, moved) in ((m, bitboard.simulate_move(board, m)) for m in bitboard.MOVES) if moved]
+        if not options: break
+        move, nxt = rng.choice(options)
+        score += bitboard.score_move(board, move)
+        cell = rng.choice(bitboard.empty_positions(nxt))
+        exp = 1 if rng.random() < 0.9 else 2
+        board = nxt | (exp << (4 * cell))
+        moves.append(move)
+        spawns.append((cell, exp))
+    return board, score, moves, spawns
+
+def verify(path, games=200, seed=0):
+    # Record seeded random games, then check every replayed final board and
+    # score against the one the game actually reached
+    finals = []
+    with RecordWriter(path) as writer:
+        for i in range(games):
+            board, score, moves, spawns = random_game(seed + i)
+            writer.write_game(seed + i, score, bitboard.max_tile(board), moves, spawns)
+            finals.append((board, score))
+    with RecordReader(path) as reader:
+        assert len(reader) == games
+        for game, expected in zip(reader, finals):
+            assert game.final_board() == expected, game.seed
+            assert game.board_at(game.turns) == expected, game.seed
+    return games
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or self-check binary game records")
+    parser.add_argument("path", nargs="?", help="record file written by test_ai.py --record")
+    parser.add_argument("--game", type=int, default=None, help="print one game (1-based)")
+    parser.add_argument("--turn", type=int, default=None, help="with --game, print the board after this many moves")
+    parser.add_argument("--selftest", action="store_true", help="record random games and check the replays")
+    args = parser.parse_args()
+
+    if args.selftest or not args.path:
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "games.rec")
+            checked = verify(path)
+            size = os.path.getsize(path)
+            with RecordReader(path) as reader:
+                positions = sum(1 for _ in reader.positions())
+        print(f"Replayed {checked} recorded games exactly ({positions} positions, {size / positions:.2f} bytes/position)")
+
+    if args.path:
+        with RecordReader(args.path) as reader:
+            if args.game is not None:
+                game = reader[args.game - 1]
+                turn = game.turns if args.turn is None else args.turn
+                board, score = game.board_at(turn)
+                print(f"Game {args.game} (seed {game.seed}), after {turn}/{game.turns} moves, score {score}:")
+                for row in bitboard.to_grid(board):
+                    print(" ".join(f"{v:5d}" for v in row))
+            else:
+                tiles = Counter(game.max_tile for game in reader)
+                turns = sum(game.turns for game in reader)
+                print(f"{len(reader)} games, {turns} positions")
+                for tile, count in sorted(tiles.items()):
+                    print(f"  max tile {tile:6d}: {count}")
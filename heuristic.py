@@ -0,0 +1,309 @@
+import random
+
+import bitboard
+
+# Table-driven version of evaluate(grid) for packed boards.
+# Every term of the heuristic is a sum over rows and columns, so each one is
+# precomputed per 16-bit row and a leaf costs a few lookups plus a transpose:
+#   rows:    empty count, horizontal smoothness, left/right monotonicity, snake
+#   columns: vertical smoothness, up/down monotonicity (rows of the transpose)
+
+SNAKE_WEIGHTS = [
+    [2**15, 2**14, 2**13, 2**12],
+    [2**8,  2**9,  2**10, 2**11],
+    [2**7,  2**6,  2**5,  2**4],
+    [2**0,  2**1,  2**2,  2**3]
+]
+
+EMPTY_WEIGHT = 10000
+MONO_WEIGHT = 100
+SMOOTH_WEIGHT = 10
+
+def snake_weights(n):
+    # SNAKE_WEIGHTS for an n x n board: powers of two running down from
+    # 2^(n*n - 1) in the top-left corner along a boustrophedon path (right
+    # along the top row, back along the next, and so on)
+    weights = []
+    for r in range(n):
+        row = [2 ** ((n - r) * n - 1 - c) for c in range(n)]
+        weights.append(row if r % 2 == 0 else row[::-1])
+    return weights
+
+def _build_tables():
+    # Row r of the board: snake + empties + horizontal smoothness, all pre-weighted
+    row_score = [[0] * 65536 for _ in range(4)]
+    # Columns only add smoothness (empties are already counted by rows)
+    line_smooth = [0] * 65536
+    mono_left = [0] * 65536
+    mono_right = [0] * 65536
+
+    for row in range(65536):
+        exps = [(row >> (4 * i)) & 0xF for i in range(4)]
+        vals = [1 << e if e else 0 for e in exps]
+
+        empty = exps.count(0)
+        smooth = 0
+        left = 0
+        right = 0
+        for c in range(3):
+            if exps[c] and exps[c + 1]:
+                smooth -= abs(exps[c] - exps[c + 1])
+            if vals[c] > vals[c + 1]:
+                left += vals[c + 1] - vals[c]
+            else:
+                right += vals[c] - vals[c + 1]
+
+        line_smooth[row] = smooth * SMOOTH_WEIGHT
+        mono_left[row] = left
+        mono_right[row] = right
+        for r in range(4):
+            snake = sum(vals[c] * SNAKE_WEIGHTS[r][c] for c in range(4))
+            row_score[r][row] = snake + empty * EMPTY_WEIGHT + smooth * SMOOTH_WEIGHT
+
+    return row_score, line_smooth, mono_left, mono_right
+
+ROW_SCORE, LINE_SMOOTH, MONO_LEFT, MONO_RIGHT = _build_tables()
+ROW_SCORE_0, ROW_SCORE_1, ROW_SCORE_2, ROW_SCORE_3 = ROW_SCORE
+
+def evaluate(board):
+    r0 = board & 0xFFFF
+    r1 = (board >> 16) & 0xFFFF
+    r2 = (board >> 32) & 0xFFFF
+    r3 = board >> 48
+
+    t = bitboard.transpose(board)
+    c0 = t & 0xFFFF
+    c1 = (t >> 16) & 0xFFFF
+    c2 = (t >> 32) & 0xFFFF
+    c3 = t >> 48
+
+    score = (ROW_SCORE_0[r0] + ROW_SCORE_1[r1] + ROW_SCORE_2[r2] + ROW_SCORE_3[r3]
+             + LINE_SMOOTH[c0] + LINE_SMOOTH[c1] + LINE_SMOOTH[c2] + LINE_SMOOTH[c3])
+
+    horizontal = max(MONO_LEFT[r0] + MONO_LEFT[r1] + MONO_LEFT[r2] + MONO_LEFT[r3],
+                     MONO_RIGHT[r0] + MONO_RIGHT[r1] + MONO_RIGHT[r2] + MONO_RIGHT[r3])
+    vertical = max(MONO_LEFT[c0] + MONO_LEFT[c1] + MONO_LEFT[c2] + MONO_LEFT[c3],
+                   MONO_RIGHT[c0] + MONO_RIGHT[c1] + MONO_RIGHT[c2] + MONO_RIGHT[c3])
+
+    return score + (horizontal + vertical) * MONO_WEIGHT
+
+# Snake weights from the heaviest cell down, for upper_bound
+_SNAKE_ORDER = sorted((w for row in SNAKE_WEIGHTS for w in row), reverse=True)
+
+def upper_bound(total):
+    # No board whose tiles add up to total evaluates higher than this.
+    # Smoothness and monotonicity never go above 0. For the snake term,
+    # merging two equal tiles into the heavier of their slots never lowers
+    # it, so the tiles can't beat total's binary digits laid on the weights
+    # largest first. Those digits are also the fewest tiles, so the most empties.
+    digits = [1 << b for b in range(total.bit_length() - 1, -1, -1) if total >> b & 1]
+    snake = sum(d * w for d, w in zip(digits, _SNAKE_ORDER))
+    return snake + max(0, 16 - len(digits)) * EMPTY_WEIGHT
+
+def spawn_scores(board, cells):
+    # evaluate(board | tile << 4 * cell) for a 2 and a 4 spawned on each of
+    # cells, as two lists. A spawn changes one row and one column, so the
+    # parent's row and column terms are summed once and each child swaps in
+    # only the two lines it touches. Integer sums, so exactly evaluate.
+    rows = [board & 0xFFFF, (board >> 16) & 0xFFFF, (board >> 32) & 0xFFFF, board >> 48]
+    t = bitboard.transpose(board)
+    cols = [t & 0xFFFF, (t >> 16) & 0xFFFF, (t >> 32) & 0xFFFF, t >> 48]
+
+    base = (ROW_SCORE_0[rows[0]] + ROW_SCORE_1[rows[1]] + ROW_SCORE_2[rows[2]] + ROW_SCORE_3[rows[3]]
+            + LINE_SMOOTH[cols[0]] + LINE_SMOOTH[cols[1]] + LINE_SMOOTH[cols[2]] + LINE_SMOOTH[cols[3]])
+    left = MONO_LEFT[rows[0]] + MONO_LEFT[rows[1]] + MONO_LEFT[rows[2]] + MONO_LEFT[rows[3]]
+    right = MONO_RIGHT[rows[0]] + MONO_RIGHT[rows[1]] + MONO_RIGHT[rows[2]] + MONO_RIGHT[rows[3]]
+    up = MONO_LEFT[cols[0]] + MONO_LEFT[cols[1]] + MONO_LEFT[cols[2]] + MONO_LEFT[cols[3]]
+    down = MONO_RIGHT[cols[0]] + MONO_RIGHT[cols[1]] + MONO_RIGHT[cols[2]] + MONO_RIGHT[cols[3]]
+
+    twos = []
+    fours = []
+    for cell in cells:
+        r = cell >> 2
+        c = cell & 3
+        row = rows[r]
+        col = cols[c]
+        row_table = ROW_SCORE[r]
+        # The parent's terms without this row and column
+        rest = base - row_table[row] - LINE_SMOOTH[col]
+        rest_left = left - MONO_LEFT[row]
+        rest_right = right - MONO_RIGHT[row]
+        rest_up = up - MONO_LEFT[col]
+        rest_down = down - MONO_RIGHT[col]
+        for tile, out in ((1, twos), (2, fours)):
+            new_row = row | (tile << (4 * c))
+            new_col = col | (tile << (4 * r))
+            horizontal = max(rest_left + MONO_LEFT[new_row], rest_right + MONO_RIGHT[new_row])
+            vertical = max(rest_up + MONO_LEFT[new_col], rest_down + MONO_RIGHT[new_col])
+            out.append(rest + row_table[new_row] + LINE_SMOOTH[new_col] + (horizontal + vertical) * MONO_WEIGHT)
+    return twos, fours
+
+def _moved_lines(lines, slide, line_score, cross_score):
+    # One direction's move of the parent, seen as lines (rows for Left/Right,
+    # columns for Up/Down) slid by `slide` and the cross lines running
+    # through them: the slid lines, their terms and how many of them moved
+    moved = [slide[line] for line in lines]
+    t = bitboard.transpose(moved[0] | (moved[1] << 16) | (moved[2] << 32) | (moved[3] << 48))
+    cross = [t & 0xFFFF, (t >> 16) & 0xFFFF, (t >> 32) & 0xFFFF, t >> 48]
+    score = (line_score[0][moved[0]] + line_score[1][moved[1]] + line_score[2][moved[2]] + line_score[3][moved[3]]
+             + cross_score[0][cross[0]] + cross_score[1][cross[1]] + cross_score[2][cross[2]] + cross_score[3][cross[3]])
+    line_left = MONO_LEFT[moved[0]] + MONO_LEFT[moved[1]] + MONO_LEFT[moved[2]] + MONO_LEFT[moved[3]]
+    line_right = MONO_RIGHT[moved[0]] + MONO_RIGHT[moved[1]] + MONO_RIGHT[moved[2]] + MONO_RIGHT[moved[3]]
+    cross_left = MONO_LEFT[cross[0]] + MONO_LEFT[cross[1]] + MONO_LEFT[cross[2]] + MONO_LEFT[cross[3]]
+    cross_right = MONO_RIGHT[cross[0]] + MONO_RIGHT[cross[1]] + MONO_RIGHT[cross[2]] + MONO_RIGHT[cross[3]]
+    moving = (moved[0] != lines[0]) + (moved[1] != lines[1]) + (moved[2] != lines[2]) + (moved[3] != lines[3])
+    return (lines, slide, line_score, cross_score, moved, cross, moving,
+            score, line_left, line_right, cross_left, cross_right)
+
+def _moved_child_score(frame, k, p, tile):
+    # evaluate() of the parent's move in frame's direction with `tile` spawned
+    # at position p of line k first, or None if that move doesn't change the
+    # board. Only line k slides differently, so its terms are swapped and the
+    # cross lines it now differs on are rebuilt.
+    (lines, slide, line_score, cross_score, moved, cross, moving,
+     score, line_left, line_right, cross_left, cross_right) = frame
+    line = lines[k] | (tile << (4 * p))
+    new = slide[line]
+    old = moved[k]
+    if new == line and moving - (old != lines[k]) == 0:
+        return None
+    score += line_score[k][new] - line_score[k][old]
+    line_left += MONO_LEFT[new] - MONO_LEFT[old]
+    line_right += MONO_RIGHT[new] - MONO_RIGHT[old]
+    diff = new ^ old
+    shift = 4 * k
+    clear = ~(0xF << shift)
+    for j in range(4):
+        if (diff >> (4 * j)) & 0xF:
+            before = cross[j]
+            after = (before & clear) | (((new >> (4 * j)) & 0xF) << shift)
+            score += cross_score[j][after] - cross_score[j][before]
+            cross_left += MONO_LEFT[after] - MONO_LEFT[before]
+            cross_right += MONO_RIGHT[after] - MONO_RIGHT[before]
+    return score + (max(line_left, line_right) + max(cross_left, cross_right)) * MONO_WEIGHT
+
+_LINE_SMOOTH_4 = [LINE_SMOOTH] * 4
+
+def move_frames(board):
+    # The parent's four moves (Left, Right, Up, Down), worked out once for
+    # move_score. A spawn only changes how one row (Left, Right) or one
+    # column (Up, Down) slides.
+    rows = [board & 0xFFFF, (board >> 16) & 0xFFFF, (board >> 32) & 0xFFFF, board >> 48]
+    t = bitboard.transpose(board)
+    cols = [t & 0xFFFF, (t >> 16) & 0xFFFF, (t >> 32) & 0xFFFF, t >> 48]
+    return (_moved_lines(rows, bitboard.ROW_LEFT, ROW_SCORE, _LINE_SMOOTH_4),
+            _moved_lines(rows, bitboard.ROW_RIGHT, ROW_SCORE, _LINE_SMOOTH_4),
+            _moved_lines(cols, bitboard.ROW_LEFT, _LINE_SMOOTH_4, ROW_SCORE),
+            _moved_lines(cols, bitboard.ROW_RIGHT, _LINE_SMOOTH_4, ROW_SCORE))
+
+def move_score(board, frames, cell, tile):
+    # (best evaluate() over the moves of board | tile << 4 * cell, number of
+    # valid moves): a player node one ply above the leaves, scored from the
+    # parent's move_frames. evaluate of the child itself if it can't move.
+    # Integer sums, so exact.
+    r = cell >> 2
+    c = cell & 3
+    best = None
+    count = 0
+    for frame, k, p in ((frames[0], r, c), (frames[1], r, c), (frames[2], c, r), (frames[3], c, r)):
+        score = _moved_child_score(frame, k, p, tile)
+        if score is not None:
+            count += 1
+            if best is None or score > best:
+                best = score
+    if best is None:
+        best = evaluate(board | (tile << (4 * cell)))
+    return best, count
+
+def verify_spawn_scores(trials=20000, seed=0):
+    # spawn_scores must equal a full evaluate of every spawned child
+    rng = random.Random(seed)
+    checked = 0
+    for _ in range(trials):
+        top = rng.choice([3, 11, 15])
+        fill = rng.random()
+        board = 0
+        for i in range(16):
+            if rng.random() < fill:
+                board |= rng.randint(1, top) << (4 * i)
+        cells = bitboard.empty_positions(board)
+        twos, fours = spawn_scores(board, cells)
+        for cell, two, four in zip(cells, twos, fours):
+            for tile, got in ((1, two), (2, four)):
+                expected = evaluate(board | (tile << (4 * cell)))
+                if got != expected:
+                    raise AssertionError(f"spawn_scores mismatch for board {board:#018x}, "
+                                         f"cell {cell}, tile {2 << (tile - 1)}: got {got}, expected {expected}")
+                checked += 1
+    return checked
+
+def verify_move_scores(trials=5000, seed=0):
+    # move_score must equal the best full evaluate over every spawned
+    # child's moves, and count the same moves
+    rng = random.Random(seed)
+    checked = 0
+    for _ in range(trials):
+        top = rng.choice([3, 11, 15])
+        fill = rng.random()
+        board = 0
+        for i in range(16):
+            if rng.random() < fill:
+                board |= rng.randint(1, top) << (4 * i)
+        frames = move_frames(board)
+        for cell in bitboard.empty_positions(board):
+            for tile in (1, 2):
+                got, count = move_score(board, frames, cell, tile)
+                child = board | (tile << (4 * cell))
+                scores = [evaluate(after) for after, moved in
+                          (bitboard.simulate_move(child, m) for m in bitboard.MOVES) if moved]
+                expected = max(scores) if scores else evaluate(child)
+                if got != expected or count != len(scores):
+                    raise AssertionError(f"move_score mismatch for board {board:#018x}, cell {cell}, "
+                                         f"tile {2 << (tile - 1)}: got {got} ({count} moves), "
+                                         f"expected {expected} ({len(scores)} moves)")
+                checked += 1
+    return checked
+
+def verify_upper_bound(trials=20000, seed=0):
+    rng = random.Random(seed)
+    for _ in range(trials):
+        top = rng.choice([3, 11, 15])
+        fill = rng.random()
+        board = 0
+        for i in range(16):
+            if rng.random() < fill:
+                board |= rng.randint(1, top) << (4 * i)
+        bound = upper_bound(bitboard.tile_sum(board))
+        if evaluate(board) > bound:
+            raise AssertionError(f"upper_bound {bound} below evaluate {evaluate(board)} for board {board:#018x}")
+    return trials
+
+def verify_against(reference_evaluate, trials=20000, seed=0):
+    # Verification mode: the tables must reproduce evaluate(grid) exactly
+    rng = random.Random(seed)
+    for _ in range(trials):
+        top = rng.choice([3, 11, 15])
+        fill = rng.random()
+        grid = [[0] * 4 for _ in range(4)]
+        for r in range(4):
+            for c in range(4):
+                if rng.random() < fill:
+                    grid[r][c] = 2 ** rng.randint(1, top)
+        expected = reference_evaluate(grid)
+        got = evaluate(bitboard.from_grid(grid))
+        if got != expected:
+            raise AssertionError(f"evaluate mismatch for {grid}: got {got}, expected {expected}")
+    return trials
+
+if __name__ == "__main__":
+    from test_ai import Game2048Simulator
+
+    assert snake_weights(4) == SNAKE_WEIGHTS
+    checked = verify_against(Game2048Simulator().evaluate)
+    print(f"Table evaluator matches evaluate on {checked} random boards")
+    checked = verify_spawn_scores()
+    print(f"Incremental spawn scores match evaluate on {checked} random children")
+    checked = verify_move_scores()
+    print(f"Incremental move scores match evaluate on {checked} random children")
+    checked = verify_upper_bound()
+    print(f"upper_bound holds on {checked} random boards")
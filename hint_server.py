@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import nboard
+import search
+
+# Long-running local hint server. Clients talk newline-delimited JSON over
+# localhost TCP (or a Unix socket):
+#
+#   {"id": 1, "grid": [[...]], "deadline_ms": 100}   -> {"id": 1, "move": ..., "scores": ..., "depth": ...}
+#   {"id": 2, "grids": [[[...]], ...]}               -> {"id": 2, "results": [...]}
+#   {"cmd": "stats"}                                 -> throughput / latency counters
+#
+# All clients share one process pool. Each worker keeps its own
+# ExpectimaxSearch with keep_cache=True, so engine tables and the
+# transposition table stay warm from one request to the next. deadline_ms
+# covers the whole request, including time spent waiting for a worker.
+
+DEFAULT_PORT = 8048
+
+_worker_search = None
+
+def _init_worker(tt_entries, prob_threshold):
+    global _worker_search
+    _worker_search = search.ExpectimaxSearch(tt_entries=tt_entries, keep_cache=True,
+                                             prob_threshold=prob_threshold)
+
+def _solve(grid, deadline_at):
+    s = _worker_search
+    deadline_ms = None
+    if deadline_at is not None:
+        # Whatever is left after queueing; at least depth 1 always runs
+        deadline_ms = max(1, (deadline_at - time.time()) * 1000)
+    move = s.get_best_move(grid, deadline_ms)
+    return {
+        "move": move,
+        "scores": s.root_scores if move != "None" else {},
+        "depth": s.depth_reached,
+        "nodes": s.nodes,
+    }
+
+class HintServer:
+    def __init__(self, workers=None, tt_entries=200000, prob_threshold=None, default_deadline_ms=200,
+                 latency_window=1000):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                            initargs=(tt_entries, prob_threshold))
+        self.default_deadline_ms = default_deadline_ms
+
+        self.started = time.time()
+        self.requests = 0
+        self.boards = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.clients = 0
+        self.latencies = deque(maxlen=latency_window) # ms per request, most recent
+        self.server = None
+        self.handlers = set() # handle_client tasks still running
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT, unix_path=None):
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # Handlers idle in readline() never return on their own
+            handlers = list(self.handlers)
+            for task in handlers:
+                task.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    async def handle_client(self, reader, writer):
+        self.clients += 1
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.handle_request(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # Cancelled by close(); ending normally keeps asyncio's stream
+            # callback from logging the cancellation as an error
+            pass
+        finally:
+            self.clients -= 1
+            self.handlers.discard(task)
+            writer.close()
+
+    async def handle_request(self, line):
+        start = time.time()
+        request = None
+        try:
+            request = json.loads(line)
+            if request.get("cmd") == "stats":
+                return self.stats()
+
+            deadline_ms = request.get("deadline_ms", self.default_deadline_ms)
+            deadline_at = start + deadline_ms / 1000.0 if deadline_ms is not None else None
+
+            self.requests += 1
+            self.in_flight += 1
+            try:
+                if "grids" in request:
+                    results = await asyncio.gather(*[self.solve(g, deadline_at) for g in request["grids"]])
+                    response = {"results": list(results)}
+                else:
+                    response = await self.solve(request["grid"], deadline_at)
+            finally:
+                self.in_flight -= 1
+            if "id" in request:
+                response["id"] = request["id"]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.errors += 1
+            response = {"error": str(e)}
+            if isinstance(request, dict) and "id" in request:
+                response["id"] = request["id"]
+            return response
+
+        self.latencies.append((time.time() - start) * 1000)
+        return response
+
+    async def solve(self, grid, deadline_at):
+        n = len(grid)
+        if not nboard.MIN_SIZE <= n <= nboard.MAX_SIZE or any(len(row) != n for row in grid):
+            raise ValueError(f"grid must be square, {nboard.MIN_SIZE}x{nboard.MIN_SIZE} to {nboard.MAX_SIZE}x{nboard.MAX_SIZE}")
+        limit = 2 ** nboard.engine_for(n).MAX_EXPONENT
+        if any(v > limit for row in grid for v in row):
+            raise ValueError(f"tile above {limit} exceeds the packed engine's limit for {n}x{n} boards")
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.executor, _solve, grid, deadline_at)
+        self.boards += 1
+        return result
+
+    def stats(self):
+        uptime = time.time() - self.started
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            if not ordered: return 0.0
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+        return {
+            "uptime_s": round(uptime, 3),
+            "workers": self.workers,
+            "clients": self.clients,
+            "requests": self.requests,
+            "boards": self.boards,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "boards_per_sec": round(self.boards / uptime, 3) if uptime > 0 else 0.0,
+            "latency_p50_ms": round(pct(50), 3),
+            "latency_p95_ms": round(pct(95), 3),
+            "latency_p99_ms": round(pct(99), 3),
+        }
+
+class HintClient:
+    # Small blocking client; one request in flight per connection
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, unix_path=None, timeout=30):
+        if unix_path:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(unix_path)
+        else:
+            self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.file = self.sock.makefile("rwb")
+        self.next_id = 0
+
+    def request(self, payload):
+        self.file.write(json.dumps(payload).encode() + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        return json.loads(line)
+
+    def best_move(self, grid, deadline_ms=None):
+        self.next_id += 1
+        payload = {"id": self.next_id, "grid": grid}
+        if deadline_ms is not None: payload["deadline_ms"] = deadline_ms
+        return self.request(payload)
+
+    def best_moves(self, grids, deadline_ms=None):
+        self.next_id += 1
+        payload = {"id": self.next_id, "grids": grids}
+        if deadline_ms is not None: payload["deadline_ms"] = deadline_ms
+        return self.request(payload)["results"]
+
+    def stats(self):
+        return self.request({"cmd": "stats"})
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+async def self_test(workers=2, clients=3):
+    # Server on an ephemeral port plus a few concurrent blocking clients
+    server = HintServer(workers)
+    await server.start(port=0)
+    host, port = server.address()[:2]
+    grid = [[2, 4, 8, 16], [0, 0, 2, 0], [0, 2, 0, 0], [4, 0, 0, 0]]
+
+    def client_job():
+        client = HintClient(host, port)
+        try:
+            single = client.best_move(grid, deadline_ms=50)
+            batch = client.best_moves([grid, grid], deadline_ms=50)
+            bad = client.request({"grid": [[1]]})
+            return single, batch, bad
+        finally:
+            client.close()
+
+    try:
+        results = await asyncio.gather(*[asyncio.to_thread(client_job) for _ in range(clients)])
+        for single, batch, bad in results:
+            assert single["move"] in search.bitboard.MOVES, single
+            assert len(batch) == 2 and all(r["move"] in search.bitboard.MOVES for r in batch), batch
+            assert "error" in bad, bad
+        def stats_job():
+            client = HintClient(host, port)
+            try:
+                return client.stats()
+            finally:
+                client.close()
+
+        stats = await asyncio.to_thread(stats_job)
+        assert stats["boards"] == 3 * clients and stats["errors"] == clients, stats
+        return stats
+    finally:
+        await server.close()
+
+async def serve(args):
+    server = HintServer(args.workers, prob_threshold=args.threshold, default_deadline_ms=args.deadline_ms)
+    await server.start(args.host, args.port, args.unix)
+    print(f"Hint server listening on {args.unix or server.address()} with {server.workers} workers")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local 2048 hint server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--deadline-ms", type=int, default=200, help="default per-request budget")
+    parser.add_argument("--threshold", type=float, default=None, help="probability cutoff for the search")
+    parser.add_argument("--selftest", action="store_true", help="start, query and stop a local server")
+    args = parser.parse_args()
+
+    if args.selftest:
+        print(json.dumps(asyncio.run(self_test()), indent=2))
+    else:
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,281 @@
+import random
+import struct
+import sys
+from array import array
+
+import bitboard
+
+# Undo/redo history as packed boards. Every entry is one 64-bit bitboard plus
+# a 64-bit score held in flat arrays, so a long session costs 16 bytes a move
+# instead of a list-of-lists per move. With max_depth set the undo side is a
+# ring buffer that overwrites the oldest entry; max_depth=None keeps everything.
+#
+# Boards with a tile above 32768 don't fit a nibble; those few are kept as
+# grids in a side dict keyed by their position, with 0 in the array slot.
+# So are boards of other sizes (the GUI's 5x5 and 6x6 games), which live in
+# memory only: the file format holds 4x4 boards.
+
+MAGIC = b"2048HIST"
+VERSION = 1
+# magic, version, max_depth (-1 = none), undo entries, redo entries, wide undo, wide redo, has current
+_HEADER = struct.Struct("<8sIqqqqqq")
+_WIDE = struct.Struct("<q16Q") # slot, then the 16 tile values
+
+class History:
+    def __init__(self, max_depth=None):
+        if max_depth is not None and max_depth < 1:
+            raise ValueError("max_depth must be at least 1")
+        self.max_depth = max_depth
+        self.boards = array('Q')
+        self.scores = array('q')
+        self.start = 0 # Ring head; stays 0 when unbounded
+        self.size = 0 # Entries on the undo side
+        self.dropped = 0 # Entries the ring has overwritten, so slot ids stay stable
+        self.wide = {} # Undo slot id -> grid, for boards that don't pack
+
+        self.redo_boards = array('Q')
+        self.redo_scores = array('q')
+        self.redo_wide = {} # Redo stack index -> grid
+
+    def __len__(self):
+        return self.size
+
+    def redo_count(self):
+        return len(self.redo_boards)
+
+    def clear(self):
+        self.__init__(self.max_depth)
+
+    def nbytes(self):
+        arrays = (self.boards, self.scores, self.redo_boards, self.redo_scores)
+        return sum(a.itemsize * len(a) for a in arrays) + sys.getsizeof(self.wide) + sys.getsizeof(self.redo_wide)
+
+    def _index(self, i):
+        # Array position of the i-th oldest undo entry
+        if self.max_depth is None:
+            return i
+        return (self.start + i) % self.max_depth
+
+    def _push_undo(self, grid, score):
+        if self.max_depth is not None and self.size == self.max_depth:
+            # Full ring: the oldest entry makes room
+            self.wide.pop(self.dropped, None)
+            self.dropped += 1
+            self.start = (self.start + 1) % self.max_depth
+            self.size -= 1
+
+        slot = self.dropped + self.size
+        board = encode(grid)
+        self.wide.pop(slot, None)
+        if board is None:
+            self.wide[slot] = [row[:] for row in grid]
+            board = 0
+
+        i = self._index(self.size)
+        if i == len(self.boards):
+            self.boards.append(board)
+            self.scores.append(score)
+        else:
+            self.boards[i] = board
+            self.scores[i] = score
+        self.size += 1
+
+    def _pop_undo(self):
+        self.size -= 1
+        i = self._index(self.size)
+        grid = self.wide.pop(self.dropped + self.size, None)
+        if grid is None:
+            grid = bitboard.to_grid(self.boards[i])
+        score = self.scores[i]
+        if self.max_depth is None:
+            # Unbounded: shrink so undo-heavy sessions give memory back
+            del self.boards[i]
+            del self.scores[i]
+        return grid, score
+
+    def _push_redo(self, grid, score):
+        board = encode(grid)
+        if board is None:
+            self.redo_wide[len(self.redo_boards)] = [row[:] for row in grid]
+            board = 0
+        self.redo_boards.append(board)
+        self.redo_scores.append(score)
+
+    def _pop_redo(self):
+        board = self.redo_boards.pop()
+        score = self.redo_scores.pop()
+        grid = self.redo_wide.pop(len(self.redo_boards), None)
+        if grid is None:
+            grid = bitboard.to_grid(board)
+        return grid, score
+
+    def push(self, grid, score=0):
+        # A new state invalidates everything that could have been redone
+        self._push_undo(grid, score)
+        if self.redo_boards:
+            self.redo_boards = array('Q')
+            self.redo_scores = array('q')
+            self.redo_wide = {}
+
+    def pop(self):
+        # Drop the newest entry without touching redo; None when empty
+        if not self.size: return None
+        return self._pop_undo()
+
+    def undo(self, grid, score=0):
+        # Returns the previous (grid, score) and stores the current one for redo
+        if not self.size: return None
+        self._push_redo(grid, score)
+        return self._pop_undo()
+
+    def redo(self, grid, score=0):
+        if not self.redo_boards: return None
+        self._push_undo(grid, score)
+        return self._pop_redo()
+
+    def entries(self):
+        # Undo side, oldest first
+        for i in range(self.size):
+            grid = self.wide.get(self.dropped + i)
+            if grid is None:
+                grid = bitboard.to_grid(self.boards[self._index(i)])
+            yield grid, self.scores[self._index(i)]
+
+    def save(self, path, current=None):
+        # current=(grid, score) stores the on-screen state after the undo side,
+        # without making it undoable here
+        order = [self._index(i) for i in range(self.size)]
+        boards = array('Q', (self.boards[i] for i in order))
+        scores = array('q', (self.scores[i] for i in order))
+        wide = {slot - self.dropped: grid for slot, grid in self.wide.items()}
+        if current is not None:
+            grid, score = current
+            board = encode(grid)
+            if board is None:
+                wide[len(boards)] = grid
+                board = 0
+            boards.append(board)
+            scores.append(score)
+        if any(len(grid) != 4 for side in (wide, self.redo_wide) for grid in side.values()):
+            raise ValueError("history files only hold 4x4 boards")
+        max_depth = -1 if self.max_depth is None else self.max_depth
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, max_depth, len(boards), len(self.redo_boards),
+                                 len(wide), len(self.redo_wide), current is not None))
+            for a in (boards, scores, self.redo_boards, self.redo_scores):
+                if sys.byteorder != "little":
+                    a = array(a.typecode, a)
+                    a.byteswap()
+                a.tofile(f)
+            for side in (wide, self.redo_wide):
+                for slot, grid in sorted(side.items()):
+                    f.write(_WIDE.pack(slot, *(v for row in grid for v in row)))
+
+    @classmethod
+    def load(cls, path):
+        # Returns (history, current); current is None unless save was given one
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError(f"{path} is not a version {VERSION} history file")
+            magic, version, max_depth, n_undo, n_redo, n_wide, n_redo_wide, has_current = _HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} history file")
+            history = cls(None if max_depth < 0 else max_depth)
+            arrays = []
+            for typecode, count in (('Q', n_undo), ('q', n_undo), ('Q', n_redo), ('q', n_redo)):
+                a = array(typecode)
+                a.fromfile(f, count)
+                if sys.byteorder != "little":
+                    a.byteswap()
+                arrays.append(a)
+            wide = []
+            for count in (n_wide, n_redo_wide):
+                side = {}
+                for _ in range(count):
+                    slot, *values = _WIDE.unpack(f.read(_WIDE.size))
+                    side[slot] = [list(values[r * 4:r * 4 + 4]) for r in range(4)]
+                wide.append(side)
+
+        current = None
+        if has_current:
+            board, score = arrays[0].pop(), arrays[1].pop()
+            grid = wide[0].pop(len(arrays[0]), None)
+            current = (grid if grid is not None else bitboard.to_grid(board), score)
+
+        history.boards, history.scores, history.redo_boards, history.redo_scores = arrays
+        history.size = len(history.boards)
+        history.wide, history.redo_wide = wide
+        if history.max_depth is not None and history.size > history.max_depth:
+            raise ValueError(f"{path} holds {history.size} entries, more than its max_depth {history.max_depth}")
+        return history, current
+
+def encode(grid):
+    # Packed board, or None when a tile is too big for a nibble (or the
+    # board isn't 4x4)
+    if len(grid) != 4 or not bitboard.can_pack(grid):
+        return None
+    return bitboard.from_grid(grid)
+
+def verify(trials=20000, max_depth=64, seed=0, path=None):
+    # Mirror every operation on a plain list-of-lists history and compare,
+    # including oversized tiles, ring overwrites and a save/load round trip
+    rng = random.Random(seed)
+    for depth in (None, max_depth):
+        history = History(depth)
+        undo, redo = [], []
+        grid, score = [[0] * 4 for _ in range(4)], 0
+        for step in range(trials):
+            op = rng.random()
+            if op < 0.6:
+                grid = [[rng.choice((0, 0, 2, 4, 1024, 65536)) for _ in range(4)] for _ in range(4)]
+                history.push(grid, score)
+                undo.append(([row[:] for row in grid], score))
+                redo.clear()
+                if depth is not None and len(undo) > depth: undo.pop(0)
+                score += rng.randrange(100)
+            elif op < 0.8:
+                got = history.undo(grid, score)
+                if undo:
+                    redo.append(([row[:] for row in grid], score))
+                    expected = undo.pop()
+                    grid, score = expected
+                else:
+                    expected = None
+                assert got == expected, (step, got, expected)
+            else:
+                got = history.redo(grid, score)
+                if redo:
+                    undo.append(([row[:] for row in grid], score))
+                    if depth is not None and len(undo) > depth: undo.pop(0)
+                    expected = redo.pop()
+                    grid, score = expected
+                else:
+                    expected = None
+                assert got == expected, (step, got, expected)
+            assert len(history) == len(undo) and history.redo_count() == len(redo), step
+
+        if path is not None:
+            history.save(path, (grid, score))
+            loaded, current = History.load(path)
+            assert current == (grid, score)
+            assert list(loaded.entries()) == undo
+            assert [loaded.redo(grid, score) for _ in redo] == redo[::-1]
+    return trials
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checked = verify(path=os.path.join(tmp, "history.bin"))
+    print(f"History matches a list-based reference over {checked} random operations (bounded and unbounded)")
+
+    history = History()
+    rng = random.Random(1)
+    board = 0
+    for _ in range(50000):
+        board = rng.getrandbits(64)
+        history.push(bitboard.to_grid(board), rng.randrange(1 << 20))
+    print(f"50000 moves of unbounded history: {history.nbytes() / 1024:.0f} KiB "
+          f"({history.nbytes() / len(history):.1f} bytes/entry)")
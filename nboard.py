@@ -0,0 +1,289 @@
+import random
+import time
+
+import bitboard
+import heuristic
+
+# Packed boards of any size N (3 to 8), for the bigger 5x5 and 6x6 variants.
+# A board is one Python int of N * N cells, CELL_BITS bits each, with cell
+# (r, c) at index r * N + c, so row r is one N * CELL_BITS-bit field and the
+# int simply grows with N. Up to 4x4 a cell is a nibble as in bitboard; bigger
+# boards use 5 bits, room for tiles up to 2^31.
+#
+# bitboard's row tables cover every 16-bit row up front. That stops working
+# past 4 cells (a 6x6 row has 2^30 values), so each engine fills a per-size
+# row table lazily: the first time a row value turns up, its slides, merge
+# score and heuristic terms are worked out once and kept. A game only ever
+# meets a small fraction of the possible rows.
+#
+# engine_for(4) is the bitboard module itself, which has the same functions;
+# the evaluate here matches heuristic.evaluate on 4x4 boards exactly.
+
+MIN_SIZE = 3
+MAX_SIZE = 8
+
+# Fields of a row table entry
+LEFT, RIGHT, SCORE, SPREAD, SNAKE, TERMS, SMOOTH, MONO_LEFT, MONO_RIGHT, EMPTIES, TOTAL, TOP = range(12)
+
+class BoardEngine:
+    MOVES = bitboard.MOVES
+
+    def __init__(self, size, cell_bits=None):
+        if not MIN_SIZE <= size <= MAX_SIZE:
+            raise ValueError(f"board size must be {MIN_SIZE} to {MAX_SIZE}, got {size}")
+        self.SIZE = size
+        self.CELL_BITS = cell_bits if cell_bits is not None else (4 if size <= 4 else 5)
+        self.MAX_EXPONENT = (1 << self.CELL_BITS) - 1
+        self.cell_mask = self.MAX_EXPONENT
+        self.row_bits = size * self.CELL_BITS
+        self.row_mask = (1 << self.row_bits) - 1
+        self.snake = heuristic.snake_weights(size)
+        self.rows = {} # Row value -> table entry, filled on first use
+
+    def row_info(self, row):
+        info = self.rows.get(row)
+        if info is None:
+            info = self.rows[row] = self.build_row(row)
+        return info
+
+    def build_row(self, row):
+        n = self.SIZE
+        bits = self.CELL_BITS
+        exps = [(row >> (bits * i)) & self.cell_mask for i in range(n)]
+        vals = [1 << e if e else 0 for e in exps]
+
+        def pack(cells):
+            out = 0
+            for i, e in enumerate(cells):
+                out |= e << (bits * i)
+            return out
+
+        def slide(cells):
+            # Same rules as bitboard: each tile merges once, merges saturate
+            tiles = [e for e in cells if e]
+            result = []
+            score = 0
+            i = 0
+            while i < len(tiles):
+                if i + 1 < len(tiles) and tiles[i] == tiles[i + 1]:
+                    merged = min(tiles[i] + 1, self.MAX_EXPONENT)
+                    result.append(merged)
+                    score += 1 << merged
+                    i += 2
+                else:
+                    result.append(tiles[i])
+                    i += 1
+            return result + [0] * (n - len(result)), score
+
+        left, score = slide(exps)
+        right = slide(exps[::-1])[0][::-1]
+        # Cell c of this row as cell (c, 0) of the transposed board
+        spread = 0
+        for c, e in enumerate(exps):
+            spread |= e << (bits * c * n)
+
+        empty = exps.count(0)
+        smooth = 0
+        mono_left = 0
+        mono_right = 0
+        for c in range(n - 1):
+            if exps[c] and exps[c + 1]:
+                smooth -= abs(exps[c] - exps[c + 1])
+            if vals[c] > vals[c + 1]:
+                mono_left += vals[c + 1] - vals[c]
+            else:
+                mono_right += vals[c] - vals[c + 1]
+        smooth *= heuristic.SMOOTH_WEIGHT
+        snake = tuple(sum(v * w for v, w in zip(vals, self.snake[r])) for r in range(n))
+        return (pack(left), pack(right), score, spread, snake, empty * heuristic.EMPTY_WEIGHT + smooth, smooth,
+                mono_left, mono_right, tuple(c for c in range(n) if not exps[c]), sum(vals), max(exps))
+
+    def split(self, board):
+        bits = self.row_bits
+        mask = self.row_mask
+        return [(board >> (bits * r)) & mask for r in range(self.SIZE)]
+
+    def transpose(self, board):
+        rows = self.rows
+        out = 0
+        for r, row in enumerate(self.split(board)):
+            info = rows.get(row) or self.row_info(row)
+            out |= info[SPREAD] << (self.CELL_BITS * r)
+        return out
+
+    def slide(self, board, field):
+        rows = self.rows
+        bits = self.row_bits
+        out = 0
+        for r, row in enumerate(self.split(board)):
+            info = rows.get(row) or self.row_info(row)
+            out |= info[field] << (bits * r)
+        return out
+
+    def simulate_move(self, board, direction):
+        if direction == "Left":
+            new_board = self.slide(board, LEFT)
+        elif direction == "Right":
+            new_board = self.slide(board, RIGHT)
+        elif direction == "Up":
+            new_board = self.transpose(self.slide(self.transpose(board), LEFT))
+        else:
+            new_board = self.transpose(self.slide(self.transpose(board), RIGHT))
+        return new_board, new_board != board
+
+    def score_move(self, board, direction):
+        if direction in ("Up", "Down"):
+            board = self.transpose(board)
+        return sum(self.row_info(row)[SCORE] for row in self.split(board))
+
+    def evaluate(self, board):
+        # heuristic.evaluate for this size, from the row table
+        rows = self.rows
+        score = 0
+        left = right = 0
+        for r, row in enumerate(self.split(board)):
+            info = rows.get(row) or self.row_info(row)
+            score += info[SNAKE][r] + info[TERMS]
+            left += info[MONO_LEFT]
+            right += info[MONO_RIGHT]
+        up = down = 0
+        for col in self.split(self.transpose(board)):
+            info = rows.get(col) or self.row_info(col)
+            score += info[SMOOTH]
+            up += info[MONO_LEFT]
+            down += info[MONO_RIGHT]
+        return score + (max(left, right) + max(up, down)) * heuristic.MONO_WEIGHT
+
+    def empty_positions(self, board):
+        n = self.SIZE
+        rows = self.rows
+        out = []
+        for r, row in enumerate(self.split(board)):
+            info = rows.get(row) or self.row_info(row)
+            out.extend(r * n + c for c in info[EMPTIES])
+        return out
+
+    def count_empty(self, board):
+        return sum(len(self.row_info(row)[EMPTIES]) for row in self.split(board))
+
+    def tile_sum(self, board):
+        return sum(self.row_info(row)[TOTAL] for row in self.split(board))
+
+    def max_tile(self, board):
+        exp = max(self.row_info(row)[TOP] for row in self.split(board))
+        return 1 << exp if exp else 0
+
+    def can_pack(self, grid):
+        return (len(grid) == self.SIZE and all(len(row) == self.SIZE for row in grid)
+                and all(v <= 2 ** self.MAX_EXPONENT for row in grid for v in row))
+
+    def from_grid(self, grid):
+        if len(grid) != self.SIZE or any(len(row) != self.SIZE for row in grid):
+            raise ValueError(f"expected a {self.SIZE}x{self.SIZE} grid")
+        board = 0
+        for r, row in enumerate(grid):
+            for c, v in enumerate(row):
+                if v:
+                    exp = v.bit_length() - 1
+                    if exp > self.MAX_EXPONENT or v != 1 << exp:
+                        raise ValueError(f"Tile {v} can't be packed")
+                    board |= exp << (self.CELL_BITS * (r * self.SIZE + c))
+        return board
+
+    def to_grid(self, board):
+        n = self.SIZE
+        grid = [[0] * n for _ in range(n)]
+        for r in range(n):
+            for c in range(n):
+                exp = (board >> (self.CELL_BITS * (r * n + c))) & self.cell_mask
+                if exp:
+                    grid[r][c] = 1 << exp
+        return grid
+
+_engines = {}
+
+def engine_for(size):
+    # bitboard for 4x4, otherwise one shared BoardEngine per size
+    if size == 4:
+        return bitboard
+    if size not in _engines:
+        _engines[size] = BoardEngine(size)
+    return _engines[size]
+
+def random_grid(rng, size, fill=None, top=11):
+    fill = rng.random() if fill is None else fill
+    return [[2 ** rng.randint(1, top) if rng.random() < fill else 0 for _ in range(size)] for _ in range(size)]
+
+def verify(reference, trials=3000, seed=0):
+    # reference(size) -> object with list-based simulate_move(grid, move) and
+    # evaluate(grid) (test_ai.Game2048Simulator). Every size must match it,
+    # and the 4x4 engine must match bitboard and heuristic bit for bit.
+    rng = random.Random(seed)
+    checked = 0
+    for size in range(MIN_SIZE, 7):
+        engine = BoardEngine(size)
+        ref = reference(size)
+        for _ in range(trials):
+            # Below the saturating merge of the widest tile a cell holds
+            grid = random_grid(rng, size, top=rng.choice([3, 11, engine.MAX_EXPONENT - 1]))
+            board = engine.from_grid(grid)
+            if engine.to_grid(board) != grid:
+                raise AssertionError(f"pack/unpack mismatch for {grid}")
+            # The reference sums in floats, which huge snake terms outgrow
+            expected = ref.evaluate(grid)
+            if abs(engine.evaluate(board) - expected) > 1e-12 * max(1.0, abs(expected)):
+                raise AssertionError(f"evaluate mismatch for {grid}: {engine.evaluate(board)} vs {expected}")
+            for move in engine.MOVES:
+                expected, moved = ref.simulate_move([row[:] for row in grid], move)
+                new_board, new_moved = engine.simulate_move(board, move)
+                if engine.to_grid(new_board) != expected or new_moved != moved:
+                    raise AssertionError(f"{move} mismatch on {size}x{size} for {grid}")
+            if size == 4:
+                packed = bitboard.from_grid(grid)
+                assert board == packed and engine.evaluate(board) == heuristic.evaluate(packed)
+                for move in engine.MOVES:
+                    assert engine.simulate_move(board, move) == bitboard.simulate_move(packed, move)
+                    assert engine.score_move(board, move) == bitboard.score_move(packed, move)
+            checked += 1
+    return checked
+
+if __name__ == "__main__":
+    import argparse
+
+    import search
+    from test_ai import Game2048Simulator
+
+    parser = argparse.ArgumentParser(description="Check the N x N engine and time hints on bigger boards")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 5, 6])
+    parser.add_argument("--positions", type=int, default=10, help="positions per size for the latency check")
+    parser.add_argument("--stride", type=int, default=40, help="moves between timed positions")
+    parser.add_argument("--deadline-ms", type=int, default=300, help="hint budget, as in the GUI")
+    args = parser.parse_args()
+
+    checked = verify(lambda size: Game2048Simulator(size=size, seed=0))
+    print(f"N x N engine matches the list-based game on {checked} random boards (3x3 to 6x6)")
+
+    for size in args.sizes:
+        # Every stride-th position of a game the engine plays itself
+        sim = Game2048Simulator(size=size, seed=size)
+        positions = []
+        while len(positions) < args.positions:
+            if len(sim.move_log) % args.stride == 0:
+                positions.append([row[:] for row in sim.grid])
+            move = sim.get_best_move()
+            if move == "None": break
+            sim.grid, _ = sim.simulate_move(sim.grid, move)
+            sim.move_log.append(move)
+            sim.spawn_tile()
+        fixed = search.ExpectimaxSearch(size=size, rng=random.Random(0))
+        timed = search.ExpectimaxSearch(size=size, rng=random.Random(0))
+        for label, s, deadline in (("fixed depth", fixed, None), (f"{args.deadline_ms} ms hint", timed, args.deadline_ms)):
+            times, depths = [], []
+            for grid in positions:
+                start = time.perf_counter()
+                s.get_best_move(grid, deadline)
+                times.append((time.perf_counter() - start) * 1000)
+                depths.append(s.depth_reached)
+            times.sort()
+            print(f"{size}x{size} {label}: median {times[len(times) // 2]:.0f} ms, max {times[-1]:.0f} ms, "
+                  f"depth {min(depths)}-{max(depths)} over {len(positions)} positions")
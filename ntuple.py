@@ -0,0 +1,269 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+import bitboard
+
+# N-tuple network value function, a learned alternative to heuristic.evaluate.
+#
+# Each shape is 4 cells; the board is read through every one of the 8
+# symmetries of each shape and the weights of a shape are shared between its
+# orientations, so a pattern learned in one corner counts in all four. The
+# weights live in one flat float32 array (one 65536-entry block per shape,
+# indexed by the 4 cell exponents) saved as .npy.
+#
+# Training is TD(0) on afterstates (the board right after a move, before the
+# spawn): V(afterstate) learns the sum of merge points still to come.
+#
+# For search, NTupleEvaluator folds the 8 orientations of every shape into one
+# table per row, column and 2x2 square, so a leaf costs 17 lookups like the
+# heuristic tables. It also adds the score the board's tiles already stand
+# for, so leaves reached along different move sequences stay comparable even
+# though expectimax only sees the leaf value. Like the heuristic's, the folded
+# tables are Python lists: loading boxes every weight as a float object (tens
+# of MB for the default shapes), since a list lookup is several times faster
+# than indexing a NumPy array from Python.
+
+# Cell r * 4 + c, as in bitboard
+SHAPES = [
+    (0, 1, 2, 3),   # outer line
+    (4, 5, 6, 7),   # inner line
+    (0, 1, 4, 5),   # corner square
+    (1, 2, 5, 6),   # edge square
+    (5, 6, 9, 10),  # centre square
+]
+TABLE_SIZE = 16 ** 4
+
+def _symmetries():
+    # The 8 maps of (r, c) onto the board: 4 rotations, each optionally mirrored
+    maps = []
+    for mirror in (False, True):
+        for rot in range(4):
+            def f(r, c, rot=rot, mirror=mirror):
+                if mirror: c = 3 - c
+                for _ in range(rot): r, c = c, 3 - r
+                return r, c
+            maps.append(f)
+    return maps
+
+def _instances(shapes):
+    # (shape index, ordered cells) for every orientation of every shape
+    out = []
+    for s, cells in enumerate(shapes):
+        for f in _symmetries():
+            out.append((s, tuple(4 * r + c for r, c in (f(cell // 4, cell % 4) for cell in cells))))
+    return out
+
+INSTANCES = _instances(SHAPES)
+
+def _build_implied():
+    # Merge points already "spent" on a row's tiles: making 2^k takes (k - 1) * 2^k
+    implied = [0] * 65536
+    for row in range(65536):
+        for i in range(4):
+            e = (row >> (4 * i)) & 0xF
+            if e >= 2:
+                implied[row] += (e - 1) << e
+    return implied
+
+ROW_IMPLIED = _build_implied()
+
+def implied_score(board):
+    return (ROW_IMPLIED[board & 0xFFFF] + ROW_IMPLIED[(board >> 16) & 0xFFFF] +
+            ROW_IMPLIED[(board >> 32) & 0xFFFF] + ROW_IMPLIED[(board >> 48) & 0xFFFF])
+
+class NTupleNetwork:
+    # Training-side network: flat Python list of weights, features computed
+    # per instance. Slower to evaluate than NTupleEvaluator but cheap to update.
+    def __init__(self, weights=None):
+        size = len(SHAPES) * TABLE_SIZE
+        if weights is None:
+            self.weights = [0.0] * size
+        else:
+            if len(weights) != size:
+                raise ValueError(f"expected {size} weights for {len(SHAPES)} shapes, got {len(weights)}")
+            self.weights = [float(w) for w in weights]
+        self.instances = [(s * TABLE_SIZE, cells) for s, cells in INSTANCES]
+
+    def features(self, board):
+        # Flat weight index of every instance
+        n = [(board >> (4 * i)) & 0xF for i in range(16)]
+        return [base + n[a] + (n[b] << 4) + (n[c] << 8) + (n[d] << 12) for base, (a, b, c, d) in self.instances]
+
+    def value(self, board):
+        w = self.weights
+        return sum(w[i] for i in self.features(board))
+
+    def update(self, features, delta):
+        w = self.weights
+        for i in features:
+            w[i] += delta
+
+    def save(self, path):
+        np.save(path, np.asarray(self.weights, dtype=np.float32))
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
+
+class NTupleEvaluator:
+    # Search-side evaluator: evaluate(board) has the same contract as
+    # heuristic.evaluate and can be passed to ExpectimaxSearch(evaluator=...)
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64).reshape(len(SHAPES), TABLE_SIZE)
+        idx = np.arange(TABLE_SIZE)
+        nibbles = [(idx >> (4 * k)) & 0xF for k in range(4)]
+
+        # Every instance lands on one row, column or square; sum its weights
+        # there, read in the cell order that line or square is extracted in
+        groups = {}
+        for s, cells in INSTANCES:
+            order = sorted(cells)
+            table = groups.setdefault(tuple(order), np.zeros(TABLE_SIZE))
+            perm = sum(nibbles[order.index(cell)] << (4 * k) for k, cell in enumerate(cells))
+            table += weights[s][perm]
+
+        implied = np.array(ROW_IMPLIED, dtype=np.float64)
+        self.rows = [(groups.pop((4 * r, 4 * r + 1, 4 * r + 2, 4 * r + 3), np.zeros(TABLE_SIZE)) + implied).tolist()
+                     for r in range(4)]
+        self.cols = [groups.pop((c, c + 4, c + 8, c + 12), np.zeros(TABLE_SIZE)).tolist() for c in range(4)]
+        # Squares by top-left cell, row-major; a missing one reads as zeros
+        self.squares = [groups.pop((a, a + 1, a + 4, a + 5), np.zeros(TABLE_SIZE)).tolist()
+                        for a in (0, 1, 2, 4, 5, 6, 8, 9, 10)]
+        if groups:
+            raise ValueError("shapes must land on rows, columns or 2x2 squares")
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
+
+    def evaluate(self, board):
+        r0, r1, r2, r3 = self.rows
+        c0, c1, c2, c3 = self.cols
+        s0, s1, s2, s3, s4, s5, s6, s7, s8 = self.squares
+        t = bitboard.transpose(board)
+        a = board & 0xFFFF
+        b = (board >> 16) & 0xFFFF
+        c = (board >> 32) & 0xFFFF
+        d = board >> 48
+        # A square's index is a byte of one row under the same byte of the next
+        ab = (a & 0xFF) | ((b & 0xFF) << 8), ((a >> 4) & 0xFF) | (((b >> 4) & 0xFF) << 8), (a >> 8) | ((b >> 8) << 8)
+        bc = (b & 0xFF) | ((c & 0xFF) << 8), ((b >> 4) & 0xFF) | (((c >> 4) & 0xFF) << 8), (b >> 8) | ((c >> 8) << 8)
+        cd = (c & 0xFF) | ((d & 0xFF) << 8), ((c >> 4) & 0xFF) | (((d >> 4) & 0xFF) << 8), (c >> 8) | ((d >> 8) << 8)
+        return (r0[a] + r1[b] + r2[c] + r3[d] +
+                c0[t & 0xFFFF] + c1[(t >> 16) & 0xFFFF] + c2[(t >> 32) & 0xFFFF] + c3[t >> 48] +
+                s0[ab[0]] + s1[ab[1]] + s2[ab[2]] +
+                s3[bc[0]] + s4[bc[1]] + s5[bc[2]] +
+                s6[cd[0]] + s7[cd[1]] + s8[cd[2]])
+
+def _spawn(board, rng):
+    pos = rng.choice(bitboard.empty_positions(board))
+    return board | ((1 if rng.random() < 0.9 else 2) << (4 * pos))
+
+def greedy_move(value, board, add_reward=True):
+    # (move, afterstate, reward, value) of the best move, or None. The value
+    # is reward + value(afterstate); add_reward=False for board evaluators
+    # such as NTupleEvaluator.evaluate or heuristic.evaluate
+    best = None
+    for move in bitboard.MOVES:
+        after, moved = bitboard.simulate_move(board, move)
+        if not moved: continue
+        reward = bitboard.score_move(board, move)
+        v = value(after) + (reward if add_reward else 0)
+        if best is None or v > best[3]:
+            best = (move, after, reward, v)
+    return best
+
+def train(net, games, alpha=0.1, seed=0, report=None):
+    # TD(0) self-play on afterstates with the greedy 1-ply policy. alpha is
+    # split across the features so the step per board stays alpha-sized.
+    # report(game, score, max_tile) is called after every game.
+    rng = random.Random(seed)
+    step = alpha / len(net.instances)
+    for game in range(1, games + 1):
+        board = _spawn(_spawn(0, rng), rng)
+        score = 0
+        prev = None # Features of the previous afterstate
+        while True:
+            best = greedy_move(net.value, board)
+            if prev is not None:
+                target = best[3] if best is not None else 0.0
+                net.update(prev, step * (target - sum(net.weights[i] for i in prev)))
+            if best is None:
+                break
+            move, after, reward, _ = best
+            prev = net.features(after)
+            score += reward
+            board = _spawn(after, rng)
+        if report is not None:
+            report(game, score, bitboard.max_tile(board))
+    return net
+
+def play_greedy(evaluate, games, seed=0):
+    # Scores and max tiles of greedy 1-ply games, for judging a network
+    rng = random.Random(seed)
+    results = []
+    for _ in range(games):
+        board = _spawn(_spawn(0, rng), rng)
+        score = 0
+        while True:
+            best = greedy_move(evaluate, board, add_reward=False)
+            if best is None: break
+            score += best[2]
+            board = _spawn(best[1], rng)
+        results.append((score, bitboard.max_tile(board)))
+    return results
+
+def verify(trials=2000, seed=0):
+    # The folded tables must match the per-instance sum plus implied score
+    rng = np.random.default_rng(seed)
+    net = NTupleNetwork(rng.normal(size=len(SHAPES) * TABLE_SIZE).astype(np.float32))
+    evaluator = NTupleEvaluator(net.weights)
+    r = random.Random(seed)
+    for _ in range(trials):
+        board = 0
+        for i in range(16):
+            if r.random() < 0.7:
+                board |= r.randrange(1, 16) << (4 * i)
+        expected = net.value(board) + implied_score(board)
+        if abs(evaluator.evaluate(board) - expected) > 1e-6 * max(1.0, abs(expected)):
+            raise AssertionError(f"evaluate mismatch for board {board:#018x}")
+    return trials
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train an n-tuple network by TD self-play")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--alpha", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="ntuple_weights.npy", help="weights file to write")
+    parser.add_argument("--resume", default=None, help="continue from this weights file")
+    parser.add_argument("--eval-games", type=int, default=50, help="greedy games to score the result")
+    args = parser.parse_args()
+
+    print(f"Folded tables match the per-instance network on {verify()} random boards")
+
+    net = NTupleNetwork.load(args.resume) if args.resume else NTupleNetwork()
+    window = []
+    start = time.time()
+
+    def report(game, score, max_tile):
+        window.append((score, max_tile))
+        if game % 100 == 0 or game == args.games:
+            scores = [s for s, _ in window]
+            reached = sum(1 for _, t in window if t >= 2048)
+            print(f"Game {game}: avg score {sum(scores) / len(scores):.0f}, "
+                  f"2048 rate {reached / len(window):.0%}, {time.time() - start:.0f}s")
+            window.clear()
+
+    train(net, args.games, args.alpha, args.seed, report)
+    net.save(args.out)
+    print(f"Saved {args.out}")
+
+    if args.eval_games:
+        evaluator = NTupleEvaluator.load(args.out)
+        results = play_greedy(evaluator.evaluate, args.eval_games, seed=args.seed + 1)
+        tiles = [t for _, t in results]
+        print(f"Greedy 1-ply with the network: avg score {sum(s for s, _ in results) / len(results):.0f}, "
+              f"avg max tile {sum(tiles) / len(tiles):.0f}, best {max(tiles)}")
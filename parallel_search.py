@@ -0,0 +1,264 @@
+import argparse
+import multiprocessing
+import os
+import random
+import time
+
+import bitboard
+import search
+
+# Root-parallel expectimax. The valid root moves (and, in deterministic mode,
+# every spawn of the first chance layer) are scored in a process pool that is
+# created once and reused for every call.
+#
+# ParallelSearch is a 4x4-only variant of search.ExpectimaxSearch with the
+# same get_best_move(grid, deadline_ms) and nodes/depth_reached/root_scores
+# surface. With a deadline it deepens one ply at a time like
+# search_iterative: every task gets the deadline, and a missed deadline or
+# should_stop() sets a shared event the workers poll, so the pool is idle
+# again when the call returns. Legacy sampling draws from a per-task seed
+# taken from rng, so a seeded search replays whichever worker runs a task.
+#
+# With prob_threshold set and tt_entries=0 the scores are bit-for-bit the
+# serial ones, so the chosen move matches ExpectimaxSearch exactly. With a
+# table each worker only sees its own subtree, which can shift scores a little.
+
+# Seconds between should_stop() polls while waiting on the pool
+POLL_S = 0.005
+
+_worker_search = None
+_cancel = None
+
+def _init_worker(tt_entries, prob_threshold, cancel):
+    global _worker_search, _cancel
+    _cancel = cancel
+    _worker_search = search.ExpectimaxSearch(tt_entries=tt_entries, prob_threshold=prob_threshold,
+                                             rng=random.Random())
+    _worker_search.should_stop = cancel.is_set
+
+def _score_task(task):
+    # (score, nodes), or (None, nodes) if the task was cancelled or ran
+    # past deadline_at (a time.time() value, comparable across processes)
+    board, depth, is_player, prob, seed, deadline_at = task
+    s = _worker_search
+    s.nodes = 0
+    if _cancel.is_set():
+        return None, 0
+    if s.tt is not None and not s.keep_cache:
+        s.tt.clear()
+    s.rng.seed(seed)
+    if deadline_at is not None:
+        s.deadline = time.perf_counter() + (deadline_at - time.time())
+    try:
+        return s.expectimax(board, depth, is_player, prob), s.nodes
+    except search.SearchTimeout:
+        return None, s.nodes
+    finally:
+        s.deadline = None
+
+class ParallelSearch:
+    def __init__(self, workers=None, tt_entries=200000, prob_threshold=None, split_chance=True, rng=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.prob_threshold = prob_threshold
+        # Splitting the first chance layer needs the full-expansion mode;
+        # legacy sampling only parallelises the root moves
+        self.split_chance = split_chance and prob_threshold is not None
+        # Source of the per-task sampling seeds; pass a random.Random for reproducible runs
+        self.rng = rng if rng is not None else random
+        self.cancel = multiprocessing.Event()
+        self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                         initargs=(tt_entries, prob_threshold, self.cancel))
+
+        # Same reporting surface as ExpectimaxSearch
+        self.engine = bitboard
+        self.tt = None
+        self.nodes = 0
+        self.depth_reached = 0
+        self.root_scores = {}
+        self.should_stop = None
+        self.collect_stats = False
+        self.stats = None
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def get_best_move(self, grid, deadline_ms=None):
+        if len(grid) != 4 or any(len(row) != 4 for row in grid):
+            raise ValueError("ParallelSearch only supports 4x4 boards")
+        board = bitboard.from_grid(grid)
+        self.nodes = 0
+
+        roots = []
+        for move in bitboard.MOVES:
+            board_next, moved = bitboard.simulate_move(board, move)
+            if moved:
+                roots.append((move, board_next))
+        self.root_scores = {}
+        if not roots: return "None"
+
+        if deadline_ms is None:
+            depth = search.pick_depth(bitboard.count_empty(board), 4, self.prob_threshold is None)
+            best_move = self.search_root(roots, depth)
+            self.depth_reached = depth
+            return best_move
+
+        # Anytime search as in ExpectimaxSearch.search_iterative; depth 1
+        # always runs to completion so there is a move to return
+        deadline_at = time.time() + deadline_ms / 1000.0
+        best_move = self.search_root(roots, 1)
+        self.depth_reached = 1
+        try:
+            for depth in range(2, search.MAX_DEPTH + 1):
+                if time.time() >= deadline_at:
+                    break
+                scores = self.root_scores
+                try:
+                    best_move = self.search_root(roots, depth, deadline_at)
+                except search.SearchTimeout:
+                    self.root_scores = scores # Keep the last finished depth's
+                    raise
+                self.depth_reached = depth
+        except search.SearchTimeout:
+            pass
+        return best_move
+
+    def search_root(self, roots, depth, deadline_at=None):
+        if self.split_chance and depth > 1:
+            scores = self.score_chance_layer(roots, depth - 1, deadline_at)
+        else:
+            scores = self.run_tasks([(b, depth - 1, False, 1.0) for _, b in roots], deadline_at)
+
+        self.root_scores = {move: score for (move, _), score in zip(roots, scores)}
+        best_score = -float('inf')
+        best_move = "None"
+        for (move, _), score in zip(roots, scores):
+            if score > best_score:
+                best_score = score
+                best_move = move
+        return best_move
+
+    def run_tasks(self, tasks, deadline_at=None):
+        # Scores of (board, depth, is_player, prob) tasks, in order. Waits for
+        # every task, cancelled ones included, so nothing is left running;
+        # raises SearchTimeout if any was cut short.
+        self.cancel.clear()
+        results = self.pool.imap(_score_task, [task + (self.rng.getrandbits(64), deadline_at) for task in tasks])
+        scores = []
+        for _ in tasks:
+            while True:
+                try:
+                    score, nodes = results.next(POLL_S)
+                    break
+                except multiprocessing.TimeoutError:
+                    if not self.cancel.is_set() and (
+                            (deadline_at is not None and time.time() >= deadline_at)
+                            or (self.should_stop is not None and self.should_stop())):
+                        self.cancel.set()
+            self.nodes += nodes
+            scores.append(score)
+        if self.cancel.is_set() or None in scores:
+            raise search.SearchTimeout()
+        return scores
+
+    def score_chance_layer(self, roots, depth, deadline_at=None):
+        # One task per (root move, cell, tile); recombined exactly the way
+        # ExpectimaxSearch.chance_all_spawns sums them
+        tasks = []
+        layout = []
+        for _, board in roots:
+            empty_cells = bitboard.empty_positions(board)
+            if not empty_cells:
+                layout.append(None)
+                tasks.append((board, 0, False, 1.0)) # Scored by evaluate
+                continue
+            layout.append(len(empty_cells))
+            prob2 = 0.9 / len(empty_cells)
+            prob4 = 0.1 / len(empty_cells)
+            for pos in empty_cells:
+                shift = 4 * pos
+                tasks.append((board | (1 << shift), depth - 1, True, prob2))
+                tasks.append((board | (2 << shift), depth - 1, True, prob4))
+
+        results = self.run_tasks(tasks, deadline_at)
+        self.nodes += len(roots)
+
+        scores = []
+        i = 0
+        for count in layout:
+            if count is None:
+                scores.append(results[i])
+                i += 1
+                continue
+            total = 0
+            for _ in range(count):
+                total += 0.9 * results[i]
+                total += 0.1 * results[i + 1]
+                i += 2
+            scores.append(total / count)
+        return scores
+
+def fixed_positions(count=12, seed=0):
+    # Reproducible mid-game boards: seeded random play, snapshot every few moves
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = 0
+        for _ in range(2):
+            pos = rng.choice(bitboard.empty_positions(board))
+            board |= (1 if rng.random() < 0.9 else 2) << (4 * pos)
+        for step in range(200):
+            moves = [b for b, moved in (bitboard.simulate_move(board, m) for m in bitboard.MOVES) if moved]
+            if not moves: break
+            board = rng.choice(moves)
+            pos = rng.choice(bitboard.empty_positions(board))
+            board |= (1 if rng.random() < 0.9 else 2) << (4 * pos)
+            if step % 25 == 24 and len(positions) < count:
+                positions.append(bitboard.to_grid(board))
+    return positions
+
+def verify_parity(positions, workers=2, prob_threshold=1e-3):
+    serial = search.ExpectimaxSearch(tt_entries=0, prob_threshold=prob_threshold)
+    parallel = ParallelSearch(workers, tt_entries=0, prob_threshold=prob_threshold)
+    try:
+        for grid in positions:
+            expected = serial.get_best_move(grid)
+            got = parallel.get_best_move(grid)
+            if got != expected:
+                raise AssertionError(f"Parallel chose {got}, serial {expected} for {grid}")
+            if parallel.root_scores != serial.root_scores:
+                raise AssertionError(f"Parallel root scores {parallel.root_scores} differ from {serial.root_scores}")
+    finally:
+        parallel.close()
+    return len(positions)
+
+def speedup_report(positions, max_workers, prob_threshold=1e-3, tt_entries=200000):
+    rows = []
+    base = None
+    for workers in range(1, max_workers + 1):
+        parallel = ParallelSearch(workers, tt_entries=tt_entries, prob_threshold=prob_threshold)
+        try:
+            start = time.perf_counter()
+            for grid in positions:
+                parallel.get_best_move(grid)
+            elapsed = time.perf_counter() - start
+        finally:
+            parallel.close()
+        if base is None: base = elapsed
+        rows.append((workers, elapsed, base / elapsed))
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Root-parallel search parity check and speedup report")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--positions", type=int, default=12)
+    parser.add_argument("--threshold", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    positions = fixed_positions(args.positions)
+    checked = verify_parity(positions, max(2, args.workers), args.threshold)
+    print(f"Parallel and serial pick the same move on {checked} positions")
+
+    print(f"Speedup on {len(positions)} positions (cpu_count = {os.cpu_count()}):")
+    for workers, elapsed, speedup in speedup_report(positions, args.workers, args.threshold):
+        print(f"  {workers:2d} workers: {elapsed:7.2f}s  x{speedup:.2f}")
@@ -0,0 +1,775 @@
+import random
+import time
+from collections import OrderedDict
+
+import bitboard
+import heuristic
+import nboard
+
+# Shared expectimax search on packed boards, used by both Game2048Tool and
+# Game2048Simulator so caches and tuning live in one place.
+
+# Hard ceiling for iterative deepening; on a dead board every pass is cheap
+MAX_DEPTH = 20
+
+# Endgame-table lookups inside the tree start at this remaining depth
+ENDGAME_MIN_DEPTH = 3
+
+# Bounded mode tries moves at inner player nodes in this order: the snake
+# weights peak in the top-left corner, so Up and Left usually win and set
+# the bound the other moves have to beat
+ORDERED_MOVES = ["Up", "Left", "Right", "Down"]
+# Relative slack on every bounded cutoff, so float rounding can't cut a
+# line that was really worth more than the bound it was tested against
+CUTOFF_MARGIN = 1e-9
+
+class SearchTimeout(Exception):
+    pass
+
+# Fixed depths on boards other than 4x4 come from estimate_nodes instead of
+# pick_depth's table: the deepest search expected to stay within this many
+# nodes, about what the table spends on a 4x4 board with few cells left
+NODE_BUDGET = 20000
+FIXED_MAX_DEPTH = 7
+
+def pick_depth(empty_count, size=4, sampled=True):
+    if size != 4:
+        depth = 1
+        while depth < FIXED_MAX_DEPTH and estimate_nodes(depth + 1, empty_count, sampled) <= NODE_BUDGET:
+            depth += 1
+        return depth
+    # Optimized Dynamic Depth - go deep!
+    if empty_count >= 8: return 3
+    if empty_count >= 6: return 4
+    if empty_count >= 2: return 5
+    return 7 # Critical
+
+def estimate_nodes(depth, empty_count, sampled=True):
+    # Rough size of a fixed-depth tree from a player node with empty_count
+    # empty cells, taken to hold steady (merges make room about as fast as
+    # spawns fill it). Player nodes try 4 moves. A chance node expands up to
+    # 6 sampled cells, or every cell when not sampled (prob_threshold mode),
+    # and adds the 4 near the leaves, on crowded boards or always unsampled.
+    # The branching is what grows with the board: a 6x6 board has far more
+    # empty cells for the unsampled search to expand.
+    cells = max(1, min(empty_count, 6) if sampled else empty_count)
+    nodes = 1
+    for d in range(1, depth + 1):
+        if (depth - d) % 2 == 0:
+            branching = 4
+        elif not sampled or d <= 2 or empty_count <= 4:
+            branching = 2 * cells
+        else:
+            branching = cells
+        nodes = 1 + branching * nodes
+    return nodes
+
+class TranspositionTable:
+    # Key: packed board plus node type, and in prob_threshold mode the path
+    # probability too (a subtree reached along a less likely path is cut off
+    # sooner, so it's a different result). Each entry remembers the remaining
+    # depth it was searched to, and a lookup only hits if that depth is >= the
+    # one asked for. Bounded by max_entries with LRU eviction; a shallower
+    # result never replaces a deeper one for the same key.
+
+    # Rough CPython cost of one entry (OrderedDict slot + int key + tuple)
+    ENTRY_BYTES = 200
+
+    def __init__(self, max_entries=200000, by_sum=False, tile_sum=bitboard.tile_sum):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        # Tile sum -> keys stored with it, for rebase. Only filled when asked
+        # for; evictions leave their keys behind until a rebase sweeps them.
+        self.by_sum = {} if by_sum else None
+        self.tile_sum = tile_sum # Of the board size stored, see ExpectimaxSearch.set_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_memory(cls, max_bytes):
+        return cls(max(1, max_bytes // cls.ENTRY_BYTES))
+
+    def get(self, board, depth, is_player, prob=None):
+        key = (board << 1) | is_player
+        if prob is not None:
+            key = (key, prob)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] >= depth:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, board, depth, is_player, value, prob=None):
+        key = (board << 1) | is_player
+        if prob is not None:
+            key = (key, prob)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > depth:
+                return
+            self.entries.move_to_end(key)
+        else:
+            if len(self.entries) >= self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            if self.by_sum is not None:
+                self.by_sum.setdefault(self.tile_sum(board), []).append(key)
+        self.entries[key] = (depth, value)
+
+    def clear(self):
+        self.entries.clear()
+        if self.by_sum is not None:
+            self.by_sum.clear()
+
+    def rebase(self, board, afterstates):
+        # Keep only entries the game can still reach from root `board`.
+        # Moves keep the tile sum and spawns raise it, so a smaller sum is
+        # unreachable, and at the root's own sum only the root (a player
+        # node) and its afterstates (chance nodes) are, at any probability. Bigger sums can't be
+        # told apart this cheaply and stay for LRU to age out. Needs
+        # by_sum; returns how many entries were dropped. Dropping never
+        # changes a result, at worst (a saturating merge) it costs a re-search.
+        root_sum = self.tile_sum(board)
+        keep = {(board << 1) | 1}
+        keep.update(a << 1 for a in afterstates)
+        entries = self.entries
+        dropped = 0
+        for total in [t for t in self.by_sum if t < root_sum]:
+            for key in self.by_sum.pop(total):
+                if key in entries:
+                    del entries[key]
+                    dropped += 1
+        # by_sum may hold a key twice (evicted, then stored again); the
+        # second copy just finds it gone
+        kept = []
+        for key in self.by_sum.get(root_sum, ()):
+            if (key[0] if type(key) is tuple else key) in keep:
+                if key in entries and key not in kept:
+                    kept.append(key)
+            elif key in entries:
+                del entries[key]
+                dropped += 1
+        self.by_sum[root_sum] = kept
+        return dropped
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+class SearchStats:
+    # Opt-in counters for one get_best_move call (ExpectimaxSearch(collect_stats=True))
+    def __init__(self):
+        self.player_nodes = 0
+        self.chance_nodes = 0
+        self.leaf_nodes = 0
+        self.max_depth = 0 # Deepest ply actually visited
+        self.depth_reached = 0 # Deepest fully completed search
+        self.movegen_time = 0.0
+        self.eval_time = 0.0
+        self.total_time = 0.0
+        self.root_scores = {} # move -> score at depth_reached
+        self.tt_hits = 0
+        self.tt_misses = 0
+
+    def total_nodes(self):
+        return self.player_nodes + self.chance_nodes + self.leaf_nodes
+
+    def branching_factor(self):
+        # Effective branching factor b with b ** depth == total nodes
+        if self.depth_reached <= 0 or self.total_nodes() <= 1:
+            return 0.0
+        return self.total_nodes() ** (1.0 / self.depth_reached)
+
+    def as_dict(self):
+        return {
+            "player_nodes": self.player_nodes,
+            "chance_nodes": self.chance_nodes,
+            "leaf_nodes": self.leaf_nodes,
+            "branching_factor": round(self.branching_factor(), 3),
+            "max_depth": self.max_depth,
+            "depth_reached": self.depth_reached,
+            "movegen_ms": round(self.movegen_time * 1000, 3),
+            "eval_ms": round(self.eval_time * 1000, 3),
+            "other_ms": round((self.total_time - self.movegen_time - self.eval_time) * 1000, 3),
+            "total_ms": round(self.total_time * 1000, 3),
+            "root_scores": dict(self.root_scores),
+            "tt_hits": self.tt_hits,
+            "tt_misses": self.tt_misses,
+        }
+
+    def summary(self):
+        scores = ", ".join(f"{m}: {s:.0f}" for m, s in self.root_scores.items())
+        return (f"Nodes: {self.player_nodes} player / {self.chance_nodes} chance / {self.leaf_nodes} leaf\n"
+                f"Branching: {self.branching_factor():.2f}  Depth: {self.depth_reached} (max {self.max_depth})\n"
+                f"Time: {self.total_time * 1000:.0f} ms (movegen {self.movegen_time * 1000:.0f}, eval {self.eval_time * 1000:.0f})\n"
+                f"Scores: {scores}")
+
+def verify_bounded(boards, prob_threshold=1e-4):
+    # Bounded mode must pick the same move with the same score as the full
+    # search. Checked without a transposition table, whose entries from
+    # deeper searches make both modes depend on visiting order, and with the
+    # deterministic spawn expansion. Returns total nodes (full, bounded).
+    nodes = [0, 0]
+    for board in boards:
+        depth = pick_depth(bitboard.count_empty(board))
+        found = []
+        for bounded in (False, True):
+            s = ExpectimaxSearch(tt_entries=0, prob_threshold=prob_threshold, bounded=bounded)
+            s.use_bounds = bounded
+            move = s.search_root(board, depth)
+            found.append((move, s.root_scores.get(move)))
+            nodes[bounded] += s.nodes
+        if found[0] != found[1]:
+            raise AssertionError(f"bounded search changed the decision for board {board:#018x}: "
+                                 f"{found[1]} instead of {found[0]}")
+    return nodes[0], nodes[1]
+
+class ExpectimaxSearch:
+    def __init__(self, tt_entries=200000, keep_cache=False, prob_threshold=None, rng=None,
+                 collect_stats=False, evaluator=None, endgame=None, persistent=False, bounded=False, size=4):
+        # keep_cache=False clears the table on every get_best_move call;
+        # True keeps it and lets LRU age old entries out instead.
+        self.tt = TranspositionTable(tt_entries, by_sum=persistent) if tt_entries else None
+        self.keep_cache = keep_cache or persistent
+        # persistent=True: a search context that follows one game. The table
+        # carries over like keep_cache, rebased on each new root so branches
+        # the real move and spawn ruled out are dropped. The previous search
+        # already expanded this board two plies down, so its subtree answers
+        # the shallow iterations of a deadline search (and a whole fixed-depth
+        # search when the depth drops) straight from the table.
+        self.persistent = persistent
+        self.carried = 0 # Entries carried into the last search
+        self.pruned = 0 # Entries the last rebase dropped
+        # None: legacy mode, random 6-cell sampling at chance nodes.
+        # A float: expand every spawn (2 and 4, all cells) and cut the line off
+        # to evaluate once its cumulative probability drops below it.
+        # Deterministic, so the same board always gets the same move.
+        self.prob_threshold = prob_threshold
+        # Source of the legacy sampling; pass a random.Random for reproducible runs
+        self.rng = rng if rng is not None else random
+
+        self.nodes = 0
+        self.deadline = None
+        # Optional callable polled during search; returning True aborts it
+        # with SearchTimeout (used to cancel stale background searches)
+        self.should_stop = None
+        # Depth of the last completed search, for callers to report
+        self.depth_reached = 0
+        self.root_depth = 0
+        # move -> score from the last completed root search
+        self.root_scores = {}
+
+        # Optional endgame.EndgameTable: near-full boards it holds are looked
+        # up instead of searched, at the root and inside the tree
+        self.endgame = endgame
+        # Leaf evaluator, board -> score: heuristic.evaluate unless one is
+        # given (e.g. ntuple.NTupleEvaluator(...).evaluate)
+        self.evaluator = evaluator
+        # Board size and its packed engine (bitboard for 4x4, else an
+        # nboard.BoardEngine); get_best_move follows the size of the grid
+        self.size = None
+        self.set_size(size)
+        self.collect_stats = collect_stats
+        self.stats = None
+        # Chance nodes whose children are all leaves score them with
+        # heuristic.spawn_scores instead of one evaluate each, and chance
+        # nodes two plies above the leaves score their player children with
+        # heuristic.move_score, so odd root depths gain too. Same values and
+        # node counts; only used with the heuristic evaluator and stats off.
+        self.incremental = True
+        # bounded=True: Star1 cutoffs. heuristic.upper_bound caps every leaf
+        # below a chance node, so once the spawns searched so far plus that cap
+        # for the rest can't beat the best sibling move, the node stops. The
+        # root move comes out the same (verify_bounded checks it); root_scores
+        # of cut moves are then only upper bounds. Needs the heuristic
+        # evaluator and no endgame table.
+        self.bounded = bounded
+        self.use_bounds = False
+        self.bound_cache = {} # (tile sum, spawns left) -> leaf cap
+
+    def set_size(self, size):
+        # Switch to size x size boards. Endgame tables and custom evaluators
+        # are built for 4x4 packing, so they only go with size 4.
+        if size == self.size:
+            return
+        if size != 4 and (self.endgame is not None or self.evaluator is not None):
+            raise ValueError("endgame tables and custom evaluators only support 4x4 boards")
+        self.size = size
+        self.engine = nboard.engine_for(size)
+        self.cell_bits = self.engine.CELL_BITS
+        if self.evaluator is not None:
+            self.base_evaluate = self.evaluator
+        else:
+            self.base_evaluate = heuristic.evaluate if size == 4 else self.engine.evaluate
+        # Leaf evaluation and move generation go through these so stats mode
+        # can time them; the flag is applied at the start of each search
+        self.evaluate = self.base_evaluate
+        self.simulate_move = self.engine.simulate_move
+        if self.tt is not None:
+            self.tt.clear()
+            self.tt.tile_sum = self.engine.tile_sum
+
+    def get_best_move(self, grid, deadline_ms=None):
+        self.set_size(len(grid))
+        board = self.engine.from_grid(grid)
+
+        if self.tt is not None:
+            if not self.keep_cache:
+                self.tt.clear()
+            elif self.persistent:
+                self.rebase(board)
+        self.nodes = 0
+        self.start_stats()
+        self.use_bounds = self.bounded and self.base_evaluate is heuristic.evaluate and self.endgame is None
+        start = time.perf_counter()
+
+        try:
+            entry = self.endgame_lookup(board, 0)
+            if entry is not None:
+                best_move, value = entry
+                self.root_scores = {best_move: value}
+                if self.stats is not None:
+                    self.stats.root_scores = self.root_scores
+                self.depth_reached = self.endgame.depth
+            elif deadline_ms is None:
+                depth = pick_depth(self.engine.count_empty(board), self.size, self.prob_threshold is None)
+                best_move = self.search_root(board, depth)
+                self.depth_reached = depth
+            else:
+                best_move = self.search_iterative(board, deadline_ms)
+        finally:
+            if self.stats is not None:
+                self.stats.total_time = time.perf_counter() - start
+                self.stats.depth_reached = self.depth_reached
+        return best_move
+
+    def rebase(self, board):
+        afterstates = [after for after, moved in (self.engine.simulate_move(board, m) for m in bitboard.MOVES) if moved]
+        self.pruned = self.tt.rebase(board, afterstates)
+        self.carried = len(self.tt.entries)
+
+    def endgame_lookup(self, board, depth):
+        # Table entry for a critical board searched at least `depth` deep
+        endgame = self.endgame
+        if endgame is None or depth > endgame.depth:
+            return None
+        if bitboard.count_empty(board) >= endgame.critical_empty:
+            return None
+        return endgame.lookup(board)
+
+    def start_stats(self):
+        if not self.collect_stats:
+            self.stats = None
+            self.evaluate = self.base_evaluate
+            self.simulate_move = self.engine.simulate_move
+            return
+        self.stats = SearchStats()
+        self.evaluate = self.timed_evaluate
+        self.simulate_move = self.timed_simulate_move
+
+    def count_leaves(self, count):
+        # Node accounting for leaves scored in bulk, polling the deadline and
+        # should_stop as often as one expectimax call per leaf would
+        before = self.nodes
+        self.nodes += count
+        if before >> 8 != self.nodes >> 8:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+            if self.should_stop is not None and self.should_stop():
+                raise SearchTimeout()
+
+    def timed_evaluate(self, board):
+        start = time.perf_counter()
+        score = self.base_evaluate(board)
+        self.stats.eval_time += time.perf_counter() - start
+        self.stats.leaf_nodes += 1
+        return score
+
+    def timed_simulate_move(self, board, direction):
+        start = time.perf_counter()
+        result = self.engine.simulate_move(board, direction)
+        self.stats.movegen_time += time.perf_counter() - start
+        return result
+
+    def search_iterative(self, board, deadline_ms):
+        # Anytime search: deepen one ply at a time and keep the move of the
+        # last depth that finished. Depth 1 always runs to completion so
+        # there is a move to return even on a tiny budget.
+        deadline = time.perf_counter() + deadline_ms / 1000.0
+        started = time.perf_counter()
+        best_move = self.search_root(board, 1)
+        self.depth_reached = 1
+        if best_move == "None":
+            return best_move
+        # (seconds, nodes) of every finished iteration
+        history = [(time.perf_counter() - started, self.nodes)]
+        # Off 4x4 an iteration that can't finish is most of the budget thrown
+        # away, and a big board's branching makes each ply cost many times
+        # the last. So predict the next one before starting it: the previous
+        # iteration of the same parity (player and chance plies branch, and
+        # cost per node, very differently) grown by the last two-ply ratio.
+        predict = self.size != 4
+        self.deadline = deadline
+        try:
+            for depth in range(2, MAX_DEPTH + 1):
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if predict and len(history) >= 3:
+                    growth = history[-1][1] / max(1, history[-3][1])
+                    if now + history[-2][0] * max(1.0, growth) > deadline:
+                        break
+                before = self.nodes
+                best_move = self.search_root(board, depth)
+                self.depth_reached = depth
+                history.append((time.perf_counter() - now, self.nodes - before))
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        return best_move
+
+    def search_root(self, board, depth):
+        self.root_depth = depth
+        best_score = -float('inf')
+        best_move = "None"
+        scores = {}
+        # Root moves stay in MOVES order so ties go the same way either mode
+        for move in bitboard.MOVES:
+            board_next, moved = self.simulate_move(board, move)
+            if moved:
+                if self.use_bounds:
+                    score = self.expectimax_bounded(board_next, depth - 1, False, 1.0, best_score)
+                else:
+                    score = self.expectimax(board_next, depth - 1, False)
+                scores[move] = score
+                if score > best_score:
+                    best_score = score
+                    best_move = move
+        self.root_scores = scores
+        if self.stats is not None:
+            self.stats.root_scores = scores
+        return best_move
+
+    def expectimax(self, board, depth, is_player, prob=1.0):
+        self.nodes += 1
+        if not self.nodes & 255:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+            if self.should_stop is not None and self.should_stop():
+                raise SearchTimeout()
+
+        stats = self.stats
+        if stats is not None and self.root_depth - depth > stats.max_depth:
+            stats.max_depth = self.root_depth - depth
+
+        if depth == 0: return self.evaluate(board)
+        if self.prob_threshold is not None and prob < self.prob_threshold:
+            return self.evaluate(board)
+
+        tt = self.tt
+        # Cut-off results depend on the path probability, sampled ones don't
+        tt_prob = prob if self.prob_threshold is not None else None
+        if tt is not None:
+            cached = tt.get(board, depth, is_player, tt_prob)
+            if cached is not None:
+                if stats is not None: stats.tt_hits += 1
+                return cached
+            if stats is not None: stats.tt_misses += 1
+
+        if stats is not None:
+            if is_player: stats.player_nodes += 1
+            else: stats.chance_nodes += 1
+
+        if is_player:
+            # Shallow nodes are cheaper to search than to look up
+            if self.endgame is not None and depth >= ENDGAME_MIN_DEPTH:
+                entry = self.endgame_lookup(board, depth)
+                if entry is not None:
+                    return entry[1]
+            best_score = -float('inf')
+            can_move = False
+            for move in bitboard.MOVES:
+                board_next, moved = self.simulate_move(board, move)
+                if moved:
+                    can_move = True
+                    score = self.expectimax(board_next, depth - 1, False, prob)
+                    best_score = max(best_score, score)
+
+            if not can_move: best_score = self.evaluate(board)
+            result = best_score
+        else:
+            empty_cells = self.engine.empty_positions(board)
+            if not empty_cells: return self.evaluate(board)
+
+            leaves = self.incremental and self.evaluate is heuristic.evaluate
+            if self.prob_threshold is not None:
+                result = self.chance_all_spawns(board, depth, empty_cells, prob, leaves)
+                if tt is not None:
+                    tt.put(board, depth, is_player, result, tt_prob)
+                return result
+
+            # Robust Sampling
+            if len(empty_cells) > 6:
+                cells_to_check = self.rng.sample(empty_cells, 6)
+            else:
+                cells_to_check = empty_cells
+
+            if leaves and depth == 1:
+                # Children are leaves and both tiles count (depth <= 2)
+                twos, fours = heuristic.spawn_scores(board, cells_to_check)
+                self.count_leaves(2 * len(cells_to_check))
+                avg_score = 0
+                for score2, score4 in zip(twos, fours):
+                    avg_score += 0.9 * score2 + 0.1 * score4
+                result = avg_score / len(cells_to_check)
+                if tt is not None:
+                    tt.put(board, depth, is_player, result, tt_prob)
+                return result
+
+            if leaves and depth == 2:
+                # Children are player nodes right above the leaves
+                twos, fours = self.move_leaves(board, cells_to_check)
+                avg_score = 0
+                for score2, score4 in zip(twos, fours):
+                    avg_score += 0.9 * score2 + 0.1 * score4
+                result = avg_score / len(cells_to_check)
+                if tt is not None:
+                    tt.put(board, depth, is_player, result, tt_prob)
+                return result
+
+            avg_score = 0
+            for pos in cells_to_check:
+                shift = self.cell_bits * pos
+                # 2 case
+                score2 = self.expectimax(board | (1 << shift), depth - 1, True)
+
+                # 4 case
+                score4 = score2
+                if depth <= 2 or len(empty_cells) <= 4:
+                    score4 = self.expectimax(board | (2 << shift), depth - 1, True)
+
+                avg_score += 0.9 * score2 + 0.1 * score4
+
+            result = avg_score / len(cells_to_check)
+
+        if tt is not None:
+            tt.put(board, depth, is_player, result, tt_prob)
+        return result
+
+    def chance_all_spawns(self, board, depth, empty_cells, prob, leaves=False):
+        # Every cell, both tiles, weighted by their real spawn odds
+        prob2 = prob * 0.9 / len(empty_cells)
+        prob4 = prob * 0.1 / len(empty_cells)
+        total = 0
+        if leaves and (depth == 1 or prob2 < self.prob_threshold):
+            # Every child is cut off (a 4 is never likelier than a 2)
+            twos, fours = heuristic.spawn_scores(board, empty_cells)
+            self.count_leaves(2 * len(empty_cells))
+            for score2, score4 in zip(twos, fours):
+                total += 0.9 * score2
+                total += 0.1 * score4
+            return total / len(empty_cells)
+        if leaves and depth == 2:
+            # Children are player nodes right above the leaves; 4s may be cut off
+            twos, fours = self.move_leaves(board, empty_cells, prob4 < self.prob_threshold, (prob2, prob4))
+            for score2, score4 in zip(twos, fours):
+                total += 0.9 * score2
+                total += 0.1 * score4
+            return total / len(empty_cells)
+        for pos in empty_cells:
+            shift = self.cell_bits * pos
+            total += 0.9 * self.expectimax(board | (1 << shift), depth - 1, True, prob2)
+            total += 0.1 * self.expectimax(board | (2 << shift), depth - 1, True, prob4)
+        return total / len(empty_cells)
+
+    def move_leaves(self, board, cells, cut_fours=False, probs=(None, None)):
+        # Values of the depth-1 player nodes board plus a 2 (and a 4) on each
+        # of cells, as expectimax would return them, with the same table
+        # lookups and stores in the same order and the same node count. A
+        # miss is scored by heuristic.move_score from the parent's moves,
+        # worked out on the first miss. cut_fours: the 4s fall under
+        # prob_threshold and are leaves themselves. probs: the children's path
+        # probabilities for the table key in prob_threshold mode.
+        twos = []
+        fours = heuristic.spawn_scores(board, cells)[1] if cut_fours else []
+        tt = self.tt
+        frames = None
+        nodes = 0
+        for pos in cells:
+            for tile, values, prob in ((1, twos, probs[0]), (2, fours, probs[1])):
+                nodes += 1
+                if tile == 2 and cut_fours:
+                    continue
+                child = board | (tile << (4 * pos))
+                if tt is not None:
+                    cached = tt.get(child, 1, True, prob)
+                    if cached is not None:
+                        values.append(cached)
+                        continue
+                if frames is None:
+                    frames = heuristic.move_frames(board)
+                value, moves = heuristic.move_score(board, frames, pos, tile)
+                nodes += moves
+                if tt is not None:
+                    tt.put(child, 1, True, value, prob)
+                values.append(value)
+        self.count_leaves(nodes)
+        return twos, fours
+
+    def leaf_cap(self, board, depth):
+        # Highest evaluate() of any leaf below a chance node `depth` plies up:
+        # at most (depth + 1) // 2 more spawns of 2 or 4, and the cutoff may
+        # stop after any number of them
+        total = bitboard.tile_sum(board)
+        spawns = (depth + 1) // 2
+        key = (total, spawns)
+        cap = self.bound_cache.get(key)
+        if cap is None:
+            cap = max(heuristic.upper_bound(total + extra) for extra in range(0, 4 * spawns + 1, 2))
+            self.bound_cache[key] = cap
+        return cap
+
+    def expectimax_bounded(self, board, depth, is_player, prob, alpha):
+        # expectimax with Star1 cutoffs against alpha, the value this node
+        # has to beat to matter. A result above alpha is exact; one at or
+        # below it only caps the true value, and isn't cached.
+        self.nodes += 1
+        if not self.nodes & 255:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+            if self.should_stop is not None and self.should_stop():
+                raise SearchTimeout()
+
+        stats = self.stats
+        if stats is not None and self.root_depth - depth > stats.max_depth:
+            stats.max_depth = self.root_depth - depth
+
+        if depth == 0: return self.evaluate(board)
+        if self.prob_threshold is not None and prob < self.prob_threshold:
+            return self.evaluate(board)
+
+        tt = self.tt
+        # Cut-off results depend on the path probability, sampled ones don't
+        tt_prob = prob if self.prob_threshold is not None else None
+        if tt is not None:
+            cached = tt.get(board, depth, is_player, tt_prob)
+            if cached is not None:
+                if stats is not None: stats.tt_hits += 1
+                return cached
+            if stats is not None: stats.tt_misses += 1
+
+        if stats is not None:
+            if is_player: stats.player_nodes += 1
+            else: stats.chance_nodes += 1
+
+        if is_player:
+            # Move order can't change a max, only how soon the rest get cut
+            best_score = -float('inf')
+            can_move = False
+            for move in ORDERED_MOVES:
+                board_next, moved = self.simulate_move(board, move)
+                if moved:
+                    can_move = True
+                    score = self.expectimax_bounded(board_next, depth - 1, False, prob,
+                                                    alpha if alpha > best_score else best_score)
+                    if score > best_score:
+                        best_score = score
+
+            if not can_move: best_score = self.evaluate(board)
+            if best_score <= alpha:
+                return best_score
+            result = best_score
+        else:
+            empty_cells = bitboard.empty_positions(board)
+            if not empty_cells: return self.evaluate(board)
+            leaves = self.incremental and self.evaluate is heuristic.evaluate
+
+            if self.prob_threshold is not None:
+                n = len(empty_cells)
+                prob2 = prob * 0.9 / n
+                prob4 = prob * 0.1 / n
+                if leaves and (depth == 1 or prob2 < self.prob_threshold):
+                    result = self.chance_all_spawns(board, depth, empty_cells, prob, leaves)
+                else:
+                    # Most of the weight first: every 2, then every 4
+                    children = [(pos, 1, 0.9, prob2) for pos in empty_cells]
+                    children += [(pos, 2, 0.1, prob4) for pos in empty_cells]
+                    values = self.chance_bounded(board, depth, children, n, alpha)
+                    if not isinstance(values, list):
+                        return values
+                    # Summed in chance_all_spawns' order, so the value is bit-identical
+                    total = 0
+                    for i in range(n):
+                        total += 0.9 * values[i]
+                        total += 0.1 * values[n + i]
+                    result = total / n
+            else:
+                if len(empty_cells) > 6:
+                    cells_to_check = self.rng.sample(empty_cells, 6)
+                else:
+                    cells_to_check = empty_cells
+                n = len(cells_to_check)
+
+                if leaves and depth == 1:
+                    twos, fours = heuristic.spawn_scores(board, cells_to_check)
+                    self.count_leaves(2 * n)
+                    avg_score = 0
+                    for score2, score4 in zip(twos, fours):
+                        avg_score += 0.9 * score2 + 0.1 * score4
+                    result = avg_score / n
+                else:
+                    with_fours = depth <= 2 or len(empty_cells) <= 4
+                    # Without the 4 case the 2 stands in for both
+                    children = [(pos, 1, 0.9 if with_fours else 1.0, 1.0) for pos in cells_to_check]
+                    if with_fours:
+                        children += [(pos, 2, 0.1, 1.0) for pos in cells_to_check]
+                    values = self.chance_bounded(board, depth, children, n, alpha)
+                    if not isinstance(values, list):
+                        return values
+                    avg_score = 0
+                    for i in range(n):
+                        score2 = values[i]
+                        score4 = values[n + i] if with_fours else score2
+                        avg_score += 0.9 * score2 + 0.1 * score4
+                    result = avg_score / n
+
+        if tt is not None:
+            tt.put(board, depth, is_player, result, tt_prob)
+        return result
+
+    def chance_bounded(self, board, depth, children, n, alpha):
+        # Searches children, (cell, tile, weight, prob) with weights adding
+        # up to n, and returns their exact values in order. If the node
+        # can't beat alpha it returns a float cap (<= alpha) instead.
+        cap = self.leaf_cap(board, depth)
+        target = n * alpha
+        target -= CUTOFF_MARGIN * (abs(target) + 1.0)
+        seen = 0.0 # Weighted sum of the children searched so far
+        rest = float(n) # Weight not searched yet
+        values = []
+        for pos, tile, weight, child_prob in children:
+            rest -= weight
+            if seen + (rest + weight) * cap <= target:
+                return min((seen + (rest + weight) * cap) / n, alpha)
+            # The child has to beat this for the node to beat alpha
+            child_alpha = (target - seen - rest * cap) / weight
+            value = self.expectimax_bounded(board | (tile << (4 * pos)), depth - 1, True, child_prob, child_alpha)
+            if value <= child_alpha:
+                return min((seen + weight * value + rest * cap) / n, alpha)
+            seen += weight * value
+            values.append(value)
+        return values
@@ -0,0 +1,91 @@
+import argparse
+import json
+import random
+import sys
+
+import nboard
+import search
+
+# Headless solver: JSON Lines boards in, best moves out. Imports only the
+# search engine (no tkinter) and handles one line at a time, so memory stays
+# flat however large the input is.
+#
+# Input lines are either a bare grid, [[0, 2, ...], ...], or an object with a
+# "grid" key and any other fields, e.g. {"id": 17, "grid": [[...]]}. Extra
+# fields are echoed back. Each output line carries "move", "scores" (per
+# valid root move) and "depth"; a board that can't be solved gets "error"
+# and "line" instead, still with the extra fields if the line parsed.
+
+def parse_line(line):
+    data = json.loads(line)
+    if isinstance(data, list):
+        return {}, data
+    extra = {k: v for k, v in data.items() if k != "grid"}
+    return extra, data.get("grid")
+
+def check_grid(grid):
+    if grid is None:
+        raise ValueError('missing "grid"')
+    n = len(grid)
+    if not nboard.MIN_SIZE <= n <= nboard.MAX_SIZE or any(len(row) != n for row in grid):
+        raise ValueError(f"grid must be square, {nboard.MIN_SIZE}x{nboard.MIN_SIZE} to {nboard.MAX_SIZE}x{nboard.MAX_SIZE}")
+    limit = 2 ** nboard.engine_for(n).MAX_EXPONENT
+    if any(v > limit for row in grid for v in row):
+        raise ValueError(f"tile above {limit} exceeds the packed engine's limit for {n}x{n} boards")
+
+def solve_stream(lines, out, solver, deadline_ms=None, flush_every=1):
+    count = 0
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        extra = {}
+        try:
+            extra, grid = parse_line(line)
+            check_grid(grid)
+            move = solver.get_best_move(grid, deadline_ms)
+            result = dict(extra)
+            result.update({
+                "move": move,
+                "scores": solver.root_scores if move != "None" else {},
+                "depth": solver.depth_reached,
+            })
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # Echo the fields of a line that parsed, so errors match their requests
+            result = dict(extra)
+            result.update({"line": line_no, "error": str(e)})
+        out.write(json.dumps(result) + "\n")
+        count += 1
+        if count % flush_every == 0:
+            out.flush()
+    out.flush()
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream 2048 boards (JSON Lines) in, best moves out")
+    parser.add_argument("input", nargs="?", default="-", help="input file, '-' for stdin (default)")
+    parser.add_argument("--output", default="-", help="output file, '-' for stdout (default)")
+    parser.add_argument("--deadline-ms", type=int, default=None, help="per-board time budget")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="probability cutoff; makes results deterministic")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the legacy chance sampling")
+    parser.add_argument("--flush-every", type=int, default=1, help="flush output every N boards")
+    parser.add_argument("--weights", default=None, help="n-tuple weights (ntuple.py) to use instead of the heuristic")
+    args = parser.parse_args(argv)
+
+    evaluator = None
+    if args.weights:
+        import ntuple # Needs NumPy, so only when asked for
+        evaluator = ntuple.NTupleEvaluator.load(args.weights).evaluate
+    solver = search.ExpectimaxSearch(prob_threshold=args.threshold, rng=random.Random(args.seed), evaluator=evaluator)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        solve_stream(source, out, solver, args.deadline_ms, args.flush_every)
+    finally:
+        if source is not sys.stdin: source.close()
+        if out is not sys.stdout: out.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,67 @@
+import argparse
+import json
+import multiprocessing
 import random
 import math
+import sys
 import time
 
+import game_record
+import heuristic
+import parallel_search
+import search
+
 class Game2048Simulator:
-    def __init__(self):
-        self.grid_size = 4
+    def __init__(self, deadline_ms=None, seed=None, collect_stats=False, evaluator=None, persistent=False, size=4,
+                 search_workers=1):
+        self.grid_size = size
+        self.deadline_ms = deadline_ms
+        # Separate streams for spawns and search sampling, so a seed replays
+        # the same game even if the search consumes randomness differently
+        self.seed = seed
+        self.rng = random.Random(seed)
         self.grid = [[0] * self.grid_size for _ in range(self.grid_size)]
+        # persistent: one search context for the whole game, so each move
+        # starts from what the previous search left in the table.
+        # search_workers > 1 scores the root moves in a process pool
+        # (parallel_search.ParallelSearch, 4x4 heuristic search only); call
+        # close() when done to shut it down.
+        search_rng = random.Random(f"search-{seed}") if seed is not None else random.Random()
+        if search_workers > 1:
+            if size != 4 or collect_stats or evaluator is not None or persistent:
+                raise ValueError("parallel search only supports plain 4x4 games")
+            self.search = parallel_search.ParallelSearch(search_workers, rng=search_rng)
+        else:
+            self.search = search.ExpectimaxSearch(rng=search_rng, collect_stats=collect_stats,
+                                                  evaluator=evaluator, persistent=persistent, size=size)
+        self.engine = self.search.engine
+        self.score = 0
+        self.nodes = 0
+        self.move_records = [] # Per-move search stats when collect_stats is on
+        # Trajectory for game_record: chosen moves and (cell, exponent) spawns
+        self.move_log = []
+        self.spawn_log = []
         self.spawn_tile()
         self.spawn_tile()
         
     def spawn_tile(self):
-        empty_cells = [(i, j) for i in range(4) for j in range(4) if self.grid[i][j] == 0]
+        n = self.grid_size
+        empty_cells = [(i, j) for i in range(n) for j in range(n) if self.grid[i][j] == 0]
         if empty_cells:
-            r, c = random.choice(empty_cells)
-            self.grid[r][c] = 2 if random.random() < 0.9 else 4
+            r, c = self.rng.choice(empty_cells)
+            self.grid[r][c] = 2 if self.rng.random() < 0.9 else 4
+            self.spawn_log.append((r * n + c, self.grid[r][c] // 2))
 
     def simulate_move(self, grid, direction):
-        new_grid = [[0]*4 for _ in range(4)]
-        merged = [[False]*4 for _ in range(4)]
+        n = len(grid)
+        new_grid = [[0]*n for _ in range(n)]
+        merged = [[False]*n for _ in range(n)]
         moved = False
         
         if direction == "Left":
-            for r in range(4):
+            for r in range(n):
                 target_c = 0
-                for c in range(4):
+                for c in range(n):
                     if grid[r][c] != 0:
                         if target_c > 0 and new_grid[r][target_c-1] == grid[r][c] and not merged[r][target_c-1]:
                             new_grid[r][target_c-1] *= 2
@@ -34,11 +72,11 @@ class Game2048Simulator:
                             if c != target_c: moved = True
                             target_c += 1
         elif direction == "Right":
-            for r in range(4):
-                target_c = 3
-                for c in range(3, -1, -1):
+            for r in range(n):
+                target_c = n - 1
+                for c in range(n - 1, -1, -1):
                     if grid[r][c] != 0:
-                        if target_c < 3 and new_grid[r][target_c+1] == grid[r][c] and not merged[r][target_c+1]:
+                        if target_c < n - 1 and new_grid[r][target_c+1] == grid[r][c] and not merged[r][target_c+1]:
                             new_grid[r][target_c+1] *= 2
                             merged[r][target_c+1] = True
                             moved = True
@@ -47,9 +85,9 @@ class Game2048Simulator:
                             if c != target_c: moved = True
                             target_c -= 1
         elif direction == "Up":
-            for c in range(4):
+            for c in range(n):
                 target_r = 0
-                for r in range(4):
+                for r in range(n):
                     if grid[r][c] != 0:
                         if target_r > 0 and new_grid[target_r-1][c] == grid[r][c] and not merged[target_r-1][c]:
                             new_grid[target_r-1][c] *= 2
@@ -60,11 +98,11 @@ class Game2048Simulator:
                             if r != target_r: moved = True
                             target_r += 1
         elif direction == "Down":
-            for c in range(4):
-                target_r = 3
-                for r in range(3, -1, -1):
+            for c in range(n):
+                target_r = n - 1
+                for r in range(n - 1, -1, -1):
                     if grid[r][c] != 0:
-                        if target_r < 3 and new_grid[target_r+1][c] == grid[r][c] and not merged[target_r+1][c]:
+                        if target_r < n - 1 and new_grid[target_r+1][c] == grid[r][c] and not merged[target_r+1][c]:
                             new_grid[target_r+1][c] *= 2
                             merged[target_r+1][c] = True
                             moved = True
@@ -75,15 +113,16 @@ class Game2048Simulator:
                             
         return new_grid, moved
 
-    def get_best_move(self):
-        # Optimized Dynamic Depth
-        empty_count = sum(row.count(0) for row in self.grid)
+    def get_best_move(self, deadline_ms=None):
+        # Packed engine unless a hand-edited tile is too big for a cell
+        if self.engine.can_pack(self.grid):
+            return self.search.get_best_move(self.grid, deadline_ms)
+        # The fallback keeps no counts; don't report the last packed search's again
+        self.search.nodes = 0
+        self.search.stats = None
         
-        # Base depth - go deep!
-        if empty_count >= 8: depth = 3
-        elif empty_count >= 6: depth = 4
-        elif empty_count >= 2: depth = 5
-        else: depth = 7 # Critical
+        empty_count = sum(row.count(0) for row in self.grid)
+        depth = search.pick_depth(empty_count, self.grid_size)
             
         best_score = -float('inf')
         best_move = "None"
@@ -123,12 +162,13 @@ class Game2048Simulator:
             if not can_move: return self.evaluate(grid)
             return best_score
         else:
-            empty_cells = [(i, j) for i in range(4) for j in range(4) if grid[i][j] == 0]
+            n = len(grid)
+            empty_cells = [(i, j) for i in range(n) for j in range(n) if grid[i][j] == 0]
             if not empty_cells: return self.evaluate(grid)
             
             # Robust Sampling
             if len(empty_cells) > 6:
-                cells_to_check = random.sample(empty_cells, 6)
+                cells_to_check = self.search.rng.sample(empty_cells, 6)
             else:
                 cells_to_check = empty_cells
             
@@ -150,25 +190,26 @@ class Game2048Simulator:
             return avg_score / len(cells_to_check)
 
     def evaluate(self, grid):
+        n = len(grid)
         empty_cells = sum(row.count(0) for row in grid)
         
         # Smoothness
         smoothness = 0
-        for r in range(4):
-            for c in range(4):
+        for r in range(n):
+            for c in range(n):
                 if grid[r][c] != 0:
                     val = math.log2(grid[r][c])
-                    if c < 3 and grid[r][c+1] != 0:
+                    if c < n - 1 and grid[r][c+1] != 0:
                         val_right = math.log2(grid[r][c+1])
                         smoothness -= abs(val - val_right)
-                    if r < 3 and grid[r+1][c] != 0:
+                    if r < n - 1 and grid[r+1][c] != 0:
                         val_down = math.log2(grid[r+1][c])
                         smoothness -= abs(val - val_down)
         
         # Monotonicity
         mono_left = 0; mono_right = 0; mono_up = 0; mono_down = 0
-        for r in range(4):
-            for c in range(3):
+        for r in range(n):
+            for c in range(n - 1):
                 current = grid[r][c]
                 next_val = grid[r][c+1]
                 if current > next_val: 
@@ -176,8 +217,8 @@ class Game2048Simulator:
                 else: 
                     mono_right += current - next_val
         
-        for c in range(4):
-            for r in range(3):
+        for c in range(n):
+            for r in range(n - 1):
                 current = grid[r][c]
                 next_val = grid[r+1][c]
                 if current > next_val: 
@@ -188,32 +229,42 @@ class Game2048Simulator:
         monotonicity = max(mono_left, mono_right) + max(mono_up, mono_down)
         
         # Snake Pattern Heuristic
-        snake_weights = [
-            [2**15, 2**14, 2**13, 2**12],
-            [2**8,  2**9,  2**10, 2**11],
-            [2**7,  2**6,  2**5,  2**4],
-            [2**0,  2**1,  2**2,  2**3]
-        ]
+        snake_weights = heuristic.snake_weights(n)
         
         snake_score = 0
-        for r in range(4):
-            for c in range(4):
+        for r in range(n):
+            for c in range(n):
                 if grid[r][c] != 0:
                     snake_score += grid[r][c] * snake_weights[r][c]
 
         return snake_score + (empty_cells * 10000) + (monotonicity * 100) + (smoothness * 10)
 
+    def encode_record(self):
+        # The finished game in game_record's binary format (4x4 only)
+        if self.grid_size != 4:
+            raise ValueError("game records hold 4x4 games")
+        max_val = max(max(row) for row in self.grid)
+        return game_record.encode_game(self.seed, self.score, max_val, self.move_log, self.spawn_log)
+
     def run(self):
         moves = 0
         while True:
-            best_move = self.get_best_move()
+            best_move = self.get_best_move(self.deadline_ms)
+            self.nodes += self.search.nodes
             if best_move == "None":
                 break
+            if self.search.stats is not None:
+                record = {"move_no": moves + 1, "move": best_move}
+                record.update(self.search.stats.as_dict())
+                self.move_records.append(record)
                 
+            if self.engine.can_pack(self.grid):
+                self.score += self.engine.score_move(self.engine.from_grid(self.grid), best_move)
             self.grid, moved = self.simulate_move(self.grid, best_move)
             if not moved:
                 break
                 
+            self.move_log.append(best_move)
             self.spawn_tile()
             moves += 1
             
@@ -225,22 +276,142 @@ class Game2048Simulator:
         max_val = max(max(row) for row in self.grid)
         return max_val, moves
 
-if __name__ == "__main__":
-    print("Starting simulation (20 runs)...")
-    results = []
-    start_time = time.time()
-    
-    for i in range(20):
-        sim = Game2048Simulator()
+    def close(self):
+        if isinstance(self.search, parallel_search.ParallelSearch):
+            self.search.close()
+
+# Weights file -> NTupleEvaluator, loaded once per process
+_evaluators = {}
+
+def load_evaluator(weights):
+    if weights is None:
+        return None
+    if weights not in _evaluators:
+        import ntuple # Needs NumPy, so only when asked for
+        _evaluators[weights] = ntuple.NTupleEvaluator.load(weights).evaluate
+    return _evaluators[weights]
+
+def play_game(task):
+    # One seeded game; module-level so the process pool can pickle it
+    game, seed, deadline_ms, collect_stats, keep_trajectory, weights, persistent, size, search_workers = task
+    start = time.time()
+    sim = Game2048Simulator(deadline_ms=deadline_ms, seed=seed, collect_stats=collect_stats,
+                            evaluator=load_evaluator(weights), persistent=persistent, size=size,
+                            search_workers=search_workers)
+    try:
         max_val, moves = sim.run()
-        results.append(max_val)
-        print(f"Run {i+1}: Max Tile = {max_val}, Moves = {moves}")
-        
-    print("-" * 30)
-    print(f"Summary:")
-    print(f"Runs: {len(results)}")
-    print(f"Success Rate (>= 2048): {len([r for r in results if r >= 2048]) / len(results) * 100}%")
-    avg_score = sum(results) / len(results)
-    print(f"Average Max Tile: {avg_score}")
-    print(f"Best Run: {max(results)}")
-    print(f"Time Taken: {time.time() - start_time:.2f}s")
+    finally:
+        sim.close()
+    move_records = [dict(type="move", game=game, **r) for r in sim.move_records]
+    trajectory = sim.encode_record() if keep_trajectory else None
+    return move_records, trajectory, {
+        "type": "game",
+        "game": game,
+        "seed": seed,
+        "max_tile": max_val,
+        "moves": moves,
+        "score": sim.score,
+        "wall_time": round(time.time() - start, 3),
+        "nodes": sim.nodes,
+    }
+
+def summarize(records, wall_time):
+    tiles = [r["max_tile"] for r in records]
+    if not records:
+        return {"type": "summary", "games": 0, "success_rate": 0.0, "avg_max_tile": 0, "best_max_tile": 0,
+                "avg_score": 0, "avg_moves": 0, "nodes": 0, "wall_time": round(wall_time, 3)}
+    return {
+        "type": "summary",
+        "games": len(records),
+        "success_rate": len([t for t in tiles if t >= 2048]) / len(tiles),
+        "avg_max_tile": sum(tiles) / len(tiles),
+        "best_max_tile": max(tiles),
+        "avg_score": sum(r["score"] for r in records) / len(records),
+        "avg_moves": sum(r["moves"] for r in records) / len(records),
+        "nodes": sum(r["nodes"] for r in records),
+        "wall_time": round(wall_time, 3),
+    }
+
+def run_batch(games, workers, seed, deadline_ms=None, out=None, collect_stats=False, recorder=None, weights=None,
+              persistent=False, size=4, search_workers=1):
+    # Game i is seeded with seed + i, so '--games 1 --seed <that seed>'
+    # replays any single game of a batch. With a game_record.RecordWriter,
+    # every game's moves and spawns are written to it in game order.
+    # weights: an ntuple weights file to search with instead of the heuristic.
+    # persistent=True carries each game's search table from move to move.
+    # size plays size x size games; records and weights are 4x4 only.
+    # search_workers > 1 parallelises each move's search instead of the
+    # games, so it needs workers=1 (pool workers can't start pools).
+    tasks = [(i + 1, seed + i, deadline_ms, collect_stats, recorder is not None, weights, persistent, size,
+              search_workers) for i in range(games)]
+    records = []
+    start_time = time.time()
+
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        results = pool.imap(play_game, tasks) if pool else map(play_game, tasks)
+        for move_records, trajectory, record in results:
+            records.append(record)
+            if recorder is not None:
+                recorder.write(trajectory)
+            print(f"Run {record['game']}: Max Tile = {record['max_tile']}, Moves = {record['moves']}", file=sys.stderr)
+            if out:
+                for move_record in move_records:
+                    out.write(json.dumps(move_record) + "\n")
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    summary = summarize(records, time.time() - start_time)
+    if out:
+        out.write(json.dumps(summary) + "\n")
+    return records, summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch-run the AI and report results as JSON Lines")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None, help="base seed (random if omitted)")
+    parser.add_argument("--deadline-ms", type=int, default=None,
+                        help="per-move search budget (timing-dependent, so not reproducible)")
+    parser.add_argument("--out", default=None, help="JSON Lines output file (default: stdout)")
+    parser.add_argument("--stats", action="store_true", help="also write a search-stats record per move")
+    parser.add_argument("--record", default=None, help="also write every game's moves and spawns to this binary file")
+    parser.add_argument("--weights", default=None, help="n-tuple weights (ntuple.py) to use instead of the heuristic")
+    parser.add_argument("--persistent-search", action="store_true",
+                        help="carry the search table from one move to the next")
+    parser.add_argument("--size", type=int, default=4, help="board size (3 to 8)")
+    parser.add_argument("--search-workers", type=int, default=1,
+                        help="processes to split each move's search over (4x4 heuristic search, one game at a time)")
+    args = parser.parse_args()
+    if args.size != 4 and (args.record or args.weights):
+        parser.error("--record and --weights only support 4x4 games")
+    if args.search_workers > 1 and (args.workers > 1 or args.size != 4 or args.stats or args.weights
+                                    or args.persistent_search):
+        parser.error("--search-workers needs --workers 1 and a 4x4 game without --stats, --weights "
+                     "or --persistent-search")
+
+    seed = args.seed if args.seed is not None else random.randrange(2**31)
+    print(f"Starting simulation ({args.games} runs, {args.workers} workers, seed {seed})...", file=sys.stderr)
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    recorder = game_record.RecordWriter(args.record) if args.record else None
+    try:
+        records, summary = run_batch(args.games, args.workers, seed, args.deadline_ms, out, args.stats, recorder,
+                                     args.weights, args.persistent_search, args.size, args.search_workers)
+    finally:
+        if args.out:
+            out.close()
+        if recorder:
+            recorder.close()
+
+    print("-" * 30, file=sys.stderr)
+    print(f"Summary:", file=sys.stderr)
+    print(f"Runs: {summary['games']}", file=sys.stderr)
+    print(f"Success Rate (>= 2048): {summary['success_rate'] * 100}%", file=sys.stderr)
+    print(f"Average Max Tile: {summary['avg_max_tile']}", file=sys.stderr)
+    print(f"Best Run: {summary['best_max_tile']}", file=sys.stderr)
+    print(f"Time Taken: {summary['wall_time']:.2f}s", file=sys.stderr)
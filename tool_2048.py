@@ -2,72 +2,433 @@ import tkinter as tk
 import random
 import copy
 import math
+import queue
+import threading
+import time
+from collections import deque
+from tkinter import filedialog, messagebox, simpledialog
+
+import bitboard
+import game_record
+import heuristic
+import history
+import nboard
+import search
+
+# Animation timing (ms). Frames are scheduled every FRAME_MS but drawn from
+# the clock, so a busy Tk drops frames rather than slowing the game down.
+SLIDE_MS = 100
+EFFECT_MS = 80
+FRAME_MS = 10
+MAX_QUEUED_MOVES = 8
+
+# Auto-play redraws the newest board at most this many times a second
+AUTOPLAY_FPS = 30
+
+# Board sizes on offer; tiles shrink past 4x4 so the board keeps its footprint
+BOARD_SIZES = (3, 4, 5, 6)
+BOARD_PX = 320
+MAX_TILE_PX = 80
 
 class Tile:
-    def __init__(self, master, value, row, col, size=80, padding=5):
-        self.master = master
+    COLORS = {
+        0: ("#cdc1b4", "#776e65"),
+        1: ("#eee4da", "#776e65"),
+        2: ("#eee4da", "#776e65"),
+        4: ("#ede0c8", "#776e65"),
+        8: ("#f2b179", "#f9f6f2"),
+        16: ("#f59563", "#f9f6f2"),
+        32: ("#f67c5f", "#f9f6f2"),
+        64: ("#f65e3b", "#f9f6f2"),
+        128: ("#edcf72", "#f9f6f2"),
+        256: ("#edcc61", "#f9f6f2"),
+        512: ("#edc850", "#f9f6f2"),
+        1024: ("#edc53f", "#f9f6f2"),
+        2048: ("#edc22e", "#f9f6f2"),
+    }
+    # (value, size) -> (bg, fg, font, text), shared by every tile
+    style_cache = {}
+
+    def __init__(self, canvas, value, row, col, size=80, padding=5):
+        # A tile is two items (rectangle + text) on the board canvas
+        self.canvas = canvas
         self.value = value
         self.row = row
         self.col = col
         self.size = size
         self.padding = padding
-        self.colors = {
-            0: ("#cdc1b4", "#776e65"),
-            1: ("#eee4da", "#776e65"),
-            2: ("#eee4da", "#776e65"),
-            4: ("#ede0c8", "#776e65"),
-            8: ("#f2b179", "#f9f6f2"),
-            16: ("#f59563", "#f9f6f2"),
-            32: ("#f67c5f", "#f9f6f2"),
-            64: ("#f65e3b", "#f9f6f2"),
-            128: ("#edcf72", "#f9f6f2"),
-            256: ("#edcc61", "#f9f6f2"),
-            512: ("#edc850", "#f9f6f2"),
-            1024: ("#edc53f", "#f9f6f2"),
-            2048: ("#edc22e", "#f9f6f2"),
-        }
-        
-        self.frame = tk.Frame(master, width=size, height=size, bg=self.get_color()[0])
-        self.label = tk.Label(self.frame, text=str(value) if value > 0 else "", 
-                              font=("Arial", self.get_font_size(), "bold"), 
-                              bg=self.get_color()[0], fg=self.get_color()[1])
-        self.label.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
-        
-        self.place_at(row, col)
+        
+        bg, fg, font, text = self.style_for(value, size)
+        x, y = self.get_coords(row, col)
+        self.rect = canvas.create_rectangle(x, y, x + size, y + size, fill=bg, width=0)
+        self.text = canvas.create_text(x + size / 2, y + size / 2, text=text, font=font, fill=fg)
+        self.visible = True
+
+    @classmethod
+    def style_for(cls, value, size=80):
+        style = cls.style_cache.get((value, size))
+        if style is None:
+            bg, fg = cls.COLORS.get(value, ("#3c3a32", "#f9f6f2"))
+            font_size = max(8, cls.font_size_for(value) * size // 80)
+            style = (bg, fg, ("Arial", font_size, "bold"), str(value) if value > 0 else "")
+            cls.style_cache[(value, size)] = style
+        return style
+
+    @staticmethod
+    def font_size_for(value):
+        if value > 10000: return 12
+        if value > 1000: return 16
+        if value > 100: return 20
+        return 24
 
     def get_color(self):
-        return self.colors.get(self.value, ("#3c3a32", "#f9f6f2"))
+        return self.COLORS.get(self.value, ("#3c3a32", "#f9f6f2"))
 
     def get_font_size(self):
-        if self.value > 10000: return 12
-        if self.value > 1000: return 16
-        if self.value > 100: return 20
-        return 24
+        return self.font_size_for(self.value)
 
     def update_visuals(self):
-        bg, fg = self.get_color()
-        self.frame.config(bg=bg)
-        self.label.config(text=str(self.value) if self.value > 0 else "", bg=bg, fg=fg, font=("Arial", self.get_font_size(), "bold"))
+        bg, fg, font, text = self.style_for(self.value, self.size)
+        self.canvas.itemconfig(self.rect, fill=bg)
+        self.canvas.itemconfig(self.text, text=text, fill=fg, font=font)
+
+    def set_value(self, value):
+        # Reconfigure only on change; returns whether anything was touched
+        if value == self.value:
+            return False
+        self.value = value
+        self.update_visuals()
+        return True
 
     def get_coords(self, row, col):
         x = col * (self.size + self.padding * 2) + self.padding
         y = row * (self.size + self.padding * 2) + self.padding
         return x, y
 
-    def place_at(self, row, col):
+    def move_to(self, x, y, scale=1.0):
+        # (x, y) is the unscaled top-left corner; scale grows/shrinks around the centre
+        s = self.size * scale
+        off = (self.size - s) / 2
+        self.canvas.coords(self.rect, x + off, y + off, x + off + s, y + off + s)
+        self.canvas.coords(self.text, x + self.size / 2, y + self.size / 2)
+
+    def place_at(self, row, col, scale=1.0):
         x, y = self.get_coords(row, col)
-        self.frame.place(x=x, y=y)
+        self.move_to(x, y, scale)
+
+    def lift(self):
+        self.canvas.tag_raise(self.rect)
+        self.canvas.tag_raise(self.text)
+
+    def show(self):
+        self.place_at(self.row, self.col)
+        if not self.visible:
+            self.canvas.itemconfig(self.rect, state=tk.NORMAL)
+            self.canvas.itemconfig(self.text, state=tk.NORMAL)
+            self.visible = True
+
+    def hide(self):
+        if self.visible:
+            self.canvas.itemconfig(self.rect, state=tk.HIDDEN)
+            self.canvas.itemconfig(self.text, state=tk.HIDDEN)
+            self.visible = False
 
     def destroy(self):
-        self.frame.destroy()
+        self.canvas.delete(self.rect, self.text)
+
+class HintWorker:
+    # Runs the AI search on a background thread so Tk never blocks.
+    # Every request bumps a generation counter: a running search notices the
+    # change and aborts, and results from older generations are dropped.
+    # Requests are debounced by coalesce_ms so a burst of edits costs one search.
+    # Results come back to the Tk thread through a root.after poll.
+    #
+    # Pondering: ponder(afterstate) queues speculative searches for the board
+    # right after a move and for every spawn on it (2s before 4s). They run
+    # only while no real request is waiting; a request for a board already
+    # pondered is answered at once, otherwise the search starts with the
+    # ponder work still in the transposition table.
+    def __init__(self, root, search_obj, solve, on_result, coalesce_ms=60, poll_ms=20):
+        self.root = root
+        self.search = search_obj
+        self.solve = solve # solve(grid, deadline_ms) -> move, run on the worker
+        self.on_result = on_result # on_result(grid, move, depth, stats), run on Tk
+        self.coalesce_ms = coalesce_ms
+        self.poll_ms = poll_ms
+
+        self.generation = 0
+        self.delivered = 0
+        self.running_generation = 0
+        self.pending = None
+        self.submit_id = None
+        self.poll_id = None
+        self.results = queue.Queue()
+        self.cond = threading.Condition()
+
+        self.ponder_jobs = deque() # grids still to ponder, most likely first
+        self.ponder_set = set() # keys of every board in the current ponder set
+        self.ponder_results = {} # key -> (move, depth, stats)
+        self.ponder_gen = 0
+        self.pondering = None # ponder_gen of the running speculative search, else None
+        # Requests while a ponder set was live, and how many found their result ready
+        self.ponder_requests = 0
+        self.ponder_hits = 0
+
+        self.search.should_stop = self.should_stop
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def should_stop(self):
+        if self.pondering is not None:
+            return self.pending is not None or self.pondering != self.ponder_gen
+        return self.running_generation != self.generation
+
+    def busy(self):
+        return self.delivered != self.generation
+
+    def ponder_rate(self):
+        return self.ponder_hits / self.ponder_requests if self.ponder_requests else 0.0
+
+    def ponder(self, grid, deadline_ms=None):
+        snapshot = [row[:] for row in grid]
+        boards = [snapshot]
+        for tile in (2, 4):
+            for r in range(len(snapshot)):
+                for c in range(len(snapshot)):
+                    if snapshot[r][c] == 0:
+                        spawned = [row[:] for row in snapshot]
+                        spawned[r][c] = tile
+                        boards.append(spawned)
+        with self.cond:
+            self.ponder_gen += 1
+            self.ponder_jobs = deque((b, deadline_ms) for b in boards)
+            self.ponder_set = {grid_key(b) for b in boards}
+            self.ponder_results = {}
+            self.cond.notify()
+
+    def stop_pondering(self):
+        with self.cond:
+            self.ponder_gen += 1
+            self.ponder_jobs.clear()
+            self.ponder_set = set()
+            self.ponder_results = {}
+
+    def request(self, grid, deadline_ms=None):
+        self.generation += 1
+        gen = self.generation
+        snapshot = [row[:] for row in grid]
+        if self.submit_id is not None:
+            self.root.after_cancel(self.submit_id)
+            self.submit_id = None
+        if self.poll_id is None:
+            self.poll_id = self.root.after(self.poll_ms, self.poll)
+
+        key = grid_key(snapshot)
+        with self.cond:
+            if self.ponder_set:
+                self.ponder_requests += 1
+                if key not in self.ponder_set:
+                    # The board went somewhere unforeseen; the rest is wasted work
+                    self.ponder_gen += 1
+                    self.ponder_jobs.clear()
+                    self.ponder_set = set()
+                    self.ponder_results = {}
+            ready = self.ponder_results.get(key)
+        if ready is not None:
+            self.ponder_hits += 1
+            self.results.put((gen, snapshot) + ready)
+            return
+        self.submit_id = self.root.after(self.coalesce_ms, lambda: self.submit(gen, snapshot, deadline_ms))
+
+    def cancel(self):
+        self.generation += 1
+        self.delivered = self.generation
+        if self.submit_id is not None:
+            self.root.after_cancel(self.submit_id)
+            self.submit_id = None
+
+    def submit(self, gen, grid, deadline_ms):
+        self.submit_id = None
+        with self.cond:
+            self.pending = (gen, grid, deadline_ms)
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.ponder_jobs:
+                    self.cond.wait()
+                if self.pending is not None:
+                    gen, grid, deadline_ms = self.pending
+                    self.pending = None
+                    ready = self.ponder_results.get(grid_key(grid))
+                    if ready is not None:
+                        self.ponder_hits += 1
+                else:
+                    grid, deadline_ms = self.ponder_jobs.popleft()
+                    self.pondering = self.ponder_gen
+                    gen = None
+
+            if gen is None:
+                self.run_ponder(grid, deadline_ms)
+                continue
+            if gen != self.generation:
+                continue
+            if ready is not None:
+                # Pondered while the request sat in its debounce window
+                self.results.put((gen, grid) + ready)
+                continue
+
+            self.running_generation = gen
+            try:
+                move = self.solve(grid, deadline_ms)
+            except search.SearchTimeout:
+                continue # Superseded by a newer request
+            self.results.put((gen, grid, move, self.search.depth_reached, self.search.stats))
+
+    def run_ponder(self, grid, deadline_ms):
+        ponder_gen = self.pondering
+        try:
+            move = self.solve(grid, deadline_ms)
+            # The anytime search returns its last finished depth when it is
+            # stopped, so a cut-off ponder looks like a normal return
+            interrupted = self.should_stop()
+        except search.SearchTimeout:
+            interrupted = True
+        finally:
+            self.pondering = None
+        if interrupted:
+            # A real request came first; drop the partial result and retry
+            # this board afterwards
+            with self.cond:
+                if ponder_gen == self.ponder_gen:
+                    self.ponder_jobs.appendleft((grid, deadline_ms))
+            return
+        with self.cond:
+            if ponder_gen == self.ponder_gen:
+                self.ponder_results[grid_key(grid)] = (move, self.search.depth_reached, self.search.stats)
+
+    def poll(self):
+        self.poll_id = None
+        latest = None
+        while True:
+            try:
+                item = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if item[0] == self.generation:
+                latest = item
+
+        if latest is not None:
+            self.delivered = latest[0]
+            self.on_result(*latest[1:])
+        if self.busy():
+            self.poll_id = self.root.after(self.poll_ms, self.poll)
+
+def grid_key(grid):
+    return tuple(map(tuple, grid))
+
+class AutoPlayer:
+    # Hint-mode auto-play. A background thread plays the game out on a packed
+    # board (search, move, spawn) and only publishes its newest state; Tk
+    # picks that up at most fps times a second, so however fast the AI moves
+    # the board is redrawn at a capped rate and skipped positions cost nothing.
+    def __init__(self, root, search_obj, on_frame, on_finish, fps=AUTOPLAY_FPS):
+        self.root = root
+        self.search = search_obj
+        self.on_frame = on_frame # on_frame(grid, score, moves, moves_per_sec), run on Tk
+        self.on_finish = on_finish # on_finish(), run on Tk once the game ends or is stopped
+        self.poll_ms = max(1, 1000 // fps)
+        self.think_ms = 50 # Search budget per move; the speed control
+
+        self.engine = nboard.engine_for(4) # Packing of the game being played, set by start
+        self.lock = threading.Lock()
+        self.latest = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.started = 0.0
+        self.stop_reason = None # Why the last game stopped early, for the info line
+
+        self.search.should_stop = self.stop_event.is_set
+
+    def running(self):
+        return self.thread is not None
+
+    @staticmethod
+    def unsupported(grid):
+        # Why the packed engine can't play this board, else None. Its merges
+        # saturate at the top exponent, so a pair of top tiles would merge
+        # into a wrong board and score.
+        engine = nboard.engine_for(len(grid))
+        top = 2 ** engine.MAX_EXPONENT
+        if not engine.can_pack(grid):
+            return f"tiles above {top} don't fit the packed board"
+        if sum(row.count(top) for row in grid) >= 2:
+            return f"two {top} tiles would merge past the packed board's limit"
+        return None
+
+    def start(self, grid, score):
+        self.stop_event.clear()
+        self.stop_reason = None
+        self.latest = None
+        self.started = time.perf_counter()
+        self.engine = nboard.engine_for(len(grid))
+        self.thread = threading.Thread(target=self.run, args=(self.engine.from_grid(grid), score), daemon=True)
+        self.thread.start()
+        self.root.after(self.poll_ms, self.poll)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self, board, score):
+        rng = random.Random()
+        engine = self.engine
+        moves = 0
+        top = 2 ** engine.MAX_EXPONENT
+        while not self.stop_event.is_set():
+            if engine.max_tile(board) == top:
+                self.stop_reason = self.unsupported(engine.to_grid(board))
+                if self.stop_reason is not None:
+                    break
+            try:
+                move = self.search.get_best_move(engine.to_grid(board), self.think_ms)
+            except search.SearchTimeout:
+                break # Stopped mid-search
+            # The anytime search returns a move even when Stop cut it short;
+            # don't play it
+            if move == "None" or self.stop_event.is_set():
+                break
+            score += engine.score_move(board, move)
+            board, _ = engine.simulate_move(board, move)
+            pos = rng.choice(engine.empty_positions(board))
+            board |= (1 if rng.random() < 0.9 else 2) << (engine.CELL_BITS * pos)
+            moves += 1
+            with self.lock:
+                self.latest = (board, score, moves)
+
+    def poll(self):
+        # Check liveness before taking the state so the final board is never missed
+        alive = self.thread.is_alive()
+        with self.lock:
+            latest, self.latest = self.latest, None
+        if latest is not None:
+            board, score, moves = latest
+            elapsed = time.perf_counter() - self.started
+            self.on_frame(self.engine.to_grid(board), score, moves, moves / elapsed if elapsed > 0 else 0.0)
+        if alive:
+            self.root.after(self.poll_ms, self.poll)
+        else:
+            self.thread = None
+            self.on_finish()
 
 class Game2048Tool:
-    def __init__(self, root):
+    def __init__(self, root, size=4):
         self.root = root
         self.root.title("2048 Visualization Tool")
-        self.grid_size = 4
-        self.tile_size = 80
+        self.grid_size = size
+        self.tile_size = self.tile_size_for(size)
         self.padding = 5
+        # Packed engine for this board size (bitboard for 4x4)
+        self.engine = nboard.engine_for(size)
         
         # Mode: "Normal" or "Hint"
         self.mode = tk.StringVar(value="Normal") 
@@ -83,10 +444,38 @@ class Game2048Tool:
         # Actually, let's keep it simple: Map (r,c) to Tile object. 
         # When moving, we update the map.
         self.visual_grid = [[None] * self.grid_size for _ in range(self.grid_size)]
+        self.displaced = set() # Cells whose tile an animation moved off its home
+        # Tiles created, destroyed and reconfigured by the last sync_visuals,
+        # and totals; shown under "Show stats"
+        self.render_counts = {"created": 0, "destroyed": 0, "updated": 0}
+        self.render_totals = {"created": 0, "destroyed": 0, "updated": 0}
+        self.dropped = 0 # Tiles deleted with the old board, reported by the next sync
         
-        self.history = []
+        # Packed undo/redo history; None keeps every move of the session
+        self.history_depth = None
+        self.history = history.History(self.history_depth)
         self.score = 0
+        # keep_cache: pondered searches leave their transposition table entries
+        # for the real one. Searches take their board size from the grid
+        # they're given.
+        self.search = search.ExpectimaxSearch(keep_cache=True, size=size)
+        # Per-hint time budget for the anytime search (None = fixed depth table)
+        self.hint_deadline_ms = 300
+        # Background search; self.search belongs to the worker thread from here on
+        self.hint_worker = HintWorker(self.root, self.search,
+                                      lambda grid, deadline_ms: self.get_best_move(deadline_ms, grid),
+                                      self.on_hint_ready)
+        self.hint = None # (grid, move) of the most recent finished search
+        self.step_pending = False
         self.animating = False
+        self.animations_on = tk.BooleanVar(value=True)
+        self.ponder_on = tk.BooleanVar(value=True) # Search ahead while animating / waiting for the spawn
+        self.move_queue = deque() # Moves pressed while an animation runs
+        self.effects = [] # (tile, kind) for the running merge/spawn effect
+        self.effect_job = None
+        # Auto-play searches with its own engine so it never contends with hints
+        self.autoplay = AutoPlayer(self.root, search.ExpectimaxSearch(size=size),
+                                   self.on_autoplay_frame, self.on_autoplay_finish)
         
         # UI Setup
         self.setup_ui()
@@ -107,6 +496,10 @@ class Game2048Tool:
         
         tk.Radiobutton(top_frame, text="Normal Mode", variable=self.mode, value="Normal", bg="#faf8ef", command=self.on_mode_change).pack(side=tk.LEFT, padx=10)
         tk.Radiobutton(top_frame, text="Hint Mode", variable=self.mode, value="Hint", bg="#faf8ef", command=self.on_mode_change).pack(side=tk.LEFT, padx=10)
+        # Board size: picking another one starts a new game
+        self.size_var = tk.IntVar(value=self.grid_size)
+        tk.OptionMenu(top_frame, self.size_var, *BOARD_SIZES, command=self.on_size_change).pack(side=tk.RIGHT, padx=10)
+        tk.Label(top_frame, text="Board:", bg="#faf8ef").pack(side=tk.RIGHT)
         
         self.info_label = tk.Label(main_frame, text="", font=("Arial", 14), bg="#faf8ef")
         self.info_label.pack(pady=5)
@@ -115,24 +508,18 @@ class Game2048Tool:
         game_area = tk.Frame(main_frame, bg="#faf8ef")
         game_area.pack()
         
-        # Grid Frame (Container for tiles)
-        # Size = 4 * 80 + 8 * 5 = 320 + 40 = 360 approx
-        grid_width = self.grid_size * (self.tile_size + 2 * self.padding)
-        self.grid_frame = tk.Frame(game_area, bg="#bbada0", width=grid_width, height=grid_width)
-        self.grid_frame.pack(side=tk.LEFT, padx=10)
-        self.grid_frame.pack_propagate(False) # Prevent shrinking
+        # Board: one Canvas, tiles are canvas items on top of the empty cells
+        self.canvas = tk.Canvas(game_area, bg="#bbada0", highlightthickness=0, bd=0)
+        self.canvas.pack(side=tk.LEFT, padx=10)
+        self.draw_board()
         
-        # Create background empty cells
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                x = j * (self.tile_size + 2 * self.padding) + self.padding
-                y = i * (self.tile_size + 2 * self.padding) + self.padding
-                f = tk.Frame(self.grid_frame, width=self.tile_size, height=self.tile_size, bg="#cdc1b4")
-                f.place(x=x, y=y)
-                
-                # Bind clicks to background cells too
-                f.bind("<Button-1>", lambda e, r=i, c=j: self.on_click(r, c, 1))
-                f.bind("<Button-3>", lambda e, r=i, c=j: self.on_click(r, c, -1))
+        # One binding for the whole board, tiles included
+        self.canvas.bind("<Button-1>", lambda e: self.on_canvas_click(e, 1))
+        self.canvas.bind("<Button-3>", lambda e: self.on_canvas_click(e, -1))
+        
+        # Arrow keys (Normal mode)
+        for key in ("Up", "Down", "Left", "Right"):
+            self.root.bind(f"<{key}>", lambda e, d=key: self.on_key(d))
 
         # Controls Frame (Right side)
         controls_frame = tk.Frame(game_area, bg="#faf8ef")
@@ -151,8 +538,34 @@ class Game2048Tool:
         self.next_btn_frame = tk.Frame(controls_frame, bg="#faf8ef")
         tk.Button(self.next_btn_frame, text="Next Step", font=("Arial", 14, "bold"), command=self.next_step, width=12, height=2, bg="#8f7a66", fg="white").pack(pady=20)
         
-        # Undo Button
-        tk.Button(controls_frame, text="Undo", font=("Arial", 12), command=self.undo, width=10).pack(side=tk.BOTTOM, pady=20)
+        # Auto-play: the AI plays on (with spawns) until stopped or stuck
+        self.autoplay_btn = tk.Button(self.next_btn_frame, text="Auto Play", font=("Arial", 12), command=self.toggle_autoplay, width=12)
+        self.autoplay_btn.pack()
+        self.think_ms = tk.IntVar(value=self.autoplay.think_ms)
+        tk.Scale(self.next_btn_frame, label="Think ms/move", from_=5, to=300, orient=tk.HORIZONTAL, variable=self.think_ms,
+                 bg="#faf8ef", highlightthickness=0, command=self.on_speed_change).pack(pady=5)
+        
+        tk.Checkbutton(self.next_btn_frame, text="Ponder", variable=self.ponder_on, bg="#faf8ef", command=self.on_ponder_toggle).pack()
+        
+        # Optional stats panel: search stats (Hint mode) and redraw counts
+        self.show_stats = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.next_btn_frame, text="Show stats", variable=self.show_stats, bg="#faf8ef", command=self.on_stats_toggle).pack()
+        self.stats_label = tk.Label(self.next_btn_frame, text="", font=("Courier", 9), bg="#faf8ef", justify=tk.LEFT)
+        self.stats_label.pack(pady=5)
+        self.render_label = tk.Label(self.next_btn_frame, text="", font=("Courier", 9), bg="#faf8ef", justify=tk.LEFT)
+        self.render_label.pack()
+        
+        # History Buttons
+        history_frame = tk.Frame(controls_frame, bg="#faf8ef")
+        history_frame.pack(side=tk.BOTTOM, pady=20)
+        tk.Button(history_frame, text="Undo", font=("Arial", 12), command=self.undo, width=5).grid(row=0, column=0, padx=2)
+        tk.Button(history_frame, text="Redo", font=("Arial", 12), command=self.redo, width=5).grid(row=0, column=1, padx=2)
+        tk.Button(history_frame, text="Save", font=("Arial", 10), command=self.save_history, width=5).grid(row=1, column=0, padx=2, pady=2)
+        tk.Button(history_frame, text="Load", font=("Arial", 10), command=self.load_history, width=5).grid(row=1, column=1, padx=2, pady=2)
+        tk.Button(history_frame, text="Replay Record", font=("Arial", 10), command=self.load_record).grid(row=2, column=0, columnspan=2, sticky=tk.EW, padx=2)
+        self.root.bind("<Control-z>", lambda e: self.undo())
+        self.root.bind("<Control-y>", lambda e: self.redo())
+        tk.Checkbutton(controls_frame, text="Animations", variable=self.animations_on, bg="#faf8ef").pack(side=tk.BOTTOM)
         
         self.instr_label = tk.Label(controls_frame, text="", bg="#faf8ef", justify=tk.LEFT)
         self.instr_label.pack(side=tk.BOTTOM, pady=10)
@@ -160,8 +573,63 @@ class Game2048Tool:
         # Initial Mode Setup
         self.on_mode_change()
 
+    @staticmethod
+    def tile_size_for(size):
+        return min(MAX_TILE_PX, BOARD_PX // size)
+
+    def draw_board(self):
+        # Size = 4 * 80 + 8 * 5 = 320 + 40 = 360 approx
+        grid_width = self.grid_size * (self.tile_size + 2 * self.padding)
+        self.canvas.delete("all")
+        self.canvas.config(width=grid_width, height=grid_width)
+        
+        # Create background empty cells
+        for i in range(self.grid_size):
+            for j in range(self.grid_size):
+                x = j * (self.tile_size + 2 * self.padding) + self.padding
+                y = i * (self.tile_size + 2 * self.padding) + self.padding
+                self.canvas.create_rectangle(x, y, x + self.tile_size, y + self.tile_size, fill="#cdc1b4", width=0)
+
+    def on_size_change(self, value):
+        if int(value) == self.grid_size:
+            return
+        if self.history_locked():
+            self.size_var.set(self.grid_size) # Finish the running move or auto-play first
+            return
+        self.new_game(int(value))
+
+    def resize_board(self, size):
+        # Empty size x size board with a fresh history; tiles and pending
+        # hints belong to the old board and go with it
+        self.finish_effects()
+        self.move_queue.clear()
+        self.step_pending = False
+        self.hint = None
+        self.hint_worker.cancel()
+        self.hint_worker.stop_pondering()
+        self.grid_size = size
+        self.size_var.set(size)
+        self.tile_size = self.tile_size_for(size)
+        self.engine = nboard.engine_for(size)
+        self.grid = [[0] * size for _ in range(size)]
+        # draw_board deletes every canvas item, so each pooled tile goes too
+        self.dropped += sum(tile is not None for row in self.visual_grid for tile in row)
+        self.visual_grid = [[None] * size for _ in range(size)]
+        self.displaced.clear()
+        self.history = history.History(self.history_depth)
+        self.score = 0
+        self.draw_board()
+
+    def new_game(self, size):
+        self.resize_board(size)
+        self.spawn_tile()
+        self.spawn_tile()
+        self.sync_visuals()
+        self.update_ai_hint()
+
     def on_mode_change(self):
         # Reset or update UI state
+        self.autoplay.stop()
         if self.mode.get() == "Normal":
             self.next_btn_frame.pack_forget()
             self.dir_frame.pack(side=tk.TOP, pady=20)
@@ -173,8 +641,18 @@ class Game2048Tool:
             
         self.update_ai_hint()
 
+    def on_canvas_click(self, event, direction):
+        cell = self.tile_size + 2 * self.padding
+        r, c = event.y // cell, event.x // cell
+        if 0 <= r < self.grid_size and 0 <= c < self.grid_size:
+            self.on_click(r, c, direction)
+
+    def on_key(self, direction):
+        if self.mode.get() == "Normal":
+            self.move(direction)
+
     def on_click(self, r, c, direction):
-        if self.mode.get() != "Hint":
+        if self.mode.get() != "Hint" or self.autoplay.running():
             return # Only allow editing in Hint mode
             
         self.save_state()
@@ -192,85 +670,238 @@ class Game2048Tool:
         self.update_ai_hint()
         
     def next_step(self):
-        if self.mode.get() != "Hint": return
+        if self.mode.get() != "Hint" or self.autoplay.running(): return
+        if self.animating:
+            # The hint for the post-move board will carry it out
+            self.step_pending = True
+            return
         
-        best_move = self.get_best_move()
+        # Use the finished hint for this board, otherwise move when it lands
+        if self.hint is not None and self.hint[0] == self.grid:
+            self.execute_step(self.hint[1])
+        else:
+            self.step_pending = True
+            if not self.hint_worker.busy():
+                self.update_ai_hint()
+
+    def toggle_autoplay(self):
+        if self.autoplay.running():
+            self.autoplay.stop()
+            return
+        if self.animating:
+            return
+        problem = self.autoplay.unsupported(self.grid)
+        if problem is not None:
+            self.info_label.config(text=f"Auto-play unavailable: {problem}")
+            return
+        self.finish_effects()
+        self.save_state()
+        self.step_pending = False
+        self.hint = None
+        self.hint_worker.cancel()
+        self.hint_worker.stop_pondering()
+        self.autoplay.think_ms = self.think_ms.get()
+        self.autoplay.start(self.grid, self.score)
+        self.autoplay_btn.config(text="Stop")
+
+    def on_speed_change(self, value):
+        self.autoplay.think_ms = int(value)
+
+    def on_autoplay_frame(self, grid, score, moves, moves_per_sec):
+        # Straight to the final board: no slide, no effects
+        self.grid = grid
+        self.score = score
+        self.sync_visuals()
+        max_tile = max(max(row) for row in grid)
+        self.info_label.config(text=f"Auto: {moves} moves, {moves_per_sec:.1f} moves/s, max tile {max_tile}")
+
+    def on_autoplay_finish(self):
+        self.autoplay_btn.config(text="Auto Play")
+        if self.autoplay.stop_reason is not None:
+            # Leave the reason up; Next Step still asks for a hint
+            self.info_label.config(text=f"Auto-play stopped: {self.autoplay.stop_reason}")
+            return
+        self.update_ai_hint()
+
+    def execute_step(self, best_move):
         if best_move != "None":
             self.move(best_move)
             self.info_label.config(text=f"Executed: {best_move}")
 
     def save_state(self):
-        self.history.append([row[:] for row in self.grid])
-        if len(self.history) > 50: self.history.pop(0)
+        self.history.push(self.grid, self.score)
+
+    def history_locked(self):
+        return self.animating or self.autoplay.running()
 
     def undo(self):
-        if self.history and not self.animating:
-            self.grid = self.history.pop()
-            self.sync_visuals()
-            self.update_ai_hint()
+        if self.history_locked(): return
+        state = self.history.undo(self.grid, self.score)
+        if state is not None:
+            self.restore(*state)
+
+    def redo(self):
+        if self.history_locked(): return
+        state = self.history.redo(self.grid, self.score)
+        if state is not None:
+            self.restore(*state)
+
+    def restore(self, grid, score):
+        self.finish_effects()
+        self.grid = grid
+        self.score = score
+        self.sync_visuals()
+        self.update_ai_hint()
+
+    def save_history(self):
+        if self.history_locked(): return
+        path = filedialog.asksaveasfilename(defaultextension=".2048h", filetypes=[("2048 history", "*.2048h")])
+        if not path: return
+        try:
+            self.history.save(path, (self.grid, self.score))
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Save failed", str(e))
+
+    def load_history(self):
+        if self.history_locked(): return
+        path = filedialog.askopenfilename(filetypes=[("2048 history", "*.2048h"), ("All files", "*")])
+        if not path: return
+        try:
+            loaded, current = history.History.load(path)
+        except (OSError, ValueError, EOFError) as e:
+            messagebox.showerror("Load failed", str(e))
+            return
+        if self.grid_size != 4:
+            self.resize_board(4) # History files hold 4x4 games
+        self.history = loaded
+        if current is not None:
+            self.restore(*current)
+
+    def load_record(self):
+        # Opens one game of a test_ai.py --record file at its first position;
+        # Redo then steps through it move by move (and Undo back)
+        if self.history_locked(): return
+        path = filedialog.askopenfilename(filetypes=[("Game records", "*.rec"), ("All files", "*")])
+        if not path: return
+        try:
+            with game_record.RecordReader(path) as reader:
+                if not len(reader): return
+                number = simpledialog.askinteger("Replay", f"Game number (1-{len(reader)}):", parent=self.root,
+                                                 minvalue=1, maxvalue=len(reader))
+                if number is None: return
+                game = reader[number - 1]
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Replay failed", str(e))
+            return
+
+        replay = history.History(self.history_depth)
+        for board, move, score in game.positions():
+            replay.push(bitboard.to_grid(board), score)
+        board, score = game.final_board()
+        state = (bitboard.to_grid(board), score)
+        while len(replay):
+            state = replay.undo(*state)
+        if self.grid_size != 4:
+            self.resize_board(4) # Records hold 4x4 games
+        self.history = replay
+        self.restore(*state)
+        self.info_label.config(text=f"Replay: game {number} (seed {game.seed}), {game.turns} moves - Redo to step")
 
     def spawn_tile(self):
-        empty_cells = [(i, j) for i in range(4) for j in range(4) if self.grid[i][j] == 0]
+        n = self.grid_size
+        empty_cells = [(i, j) for i in range(n) for j in range(n) if self.grid[i][j] == 0]
         if empty_cells:
             r, c = random.choice(empty_cells)
             self.grid[r][c] = 2 if random.random() < 0.9 else 4
+            return r, c
+        return None
 
     def sync_visuals(self):
-        # Recreate all tiles based on grid
-        # This is a brute-force sync, useful for undo/init/spawn
-        # For moves, we use animation instead.
-        for i in range(4):
-            for j in range(4):
-                if self.visual_grid[i][j]:
-                    self.visual_grid[i][j].destroy()
-                    self.visual_grid[i][j] = None
+        # Diff-based sync: every cell owns one pooled Tile, created the first
+        # time the cell is filled, hidden when it empties and reconfigured only
+        # when its value changes. Tiles slid away by an animation are put back.
+        counts = {"created": 0, "destroyed": self.dropped, "updated": 0}
+        self.dropped = 0
+        for i in range(self.grid_size):
+            for j in range(self.grid_size):
+                value = self.grid[i][j]
+                tile = self.visual_grid[i][j]
+                
+                if value == 0:
+                    if tile is not None:
+                        tile.hide()
+                    continue
+                
+                if tile is None:
+                    self.visual_grid[i][j] = self.create_tile(i, j, value)
+                    counts["created"] += 1
+                    continue
                 
-                if self.grid[i][j] != 0:
-                    t = Tile(self.grid_frame, self.grid[i][j], i, j, self.tile_size, self.padding)
-                    self.visual_grid[i][j] = t
-                    # Bind clicks to tiles
-                    t.label.bind("<Button-1>", lambda e, r=i, c=j: self.on_click(r, c, 1))
-                    t.label.bind("<Button-3>", lambda e, r=i, c=j: self.on_click(r, c, -1))
-                    t.frame.bind("<Button-1>", lambda e, r=i, c=j: self.on_click(r, c, 1))
-                    t.frame.bind("<Button-3>", lambda e, r=i, c=j: self.on_click(r, c, -1))
+                if tile.set_value(value):
+                    counts["updated"] += 1
+                if not tile.visible or (i, j) in self.displaced:
+                    tile.show()
+        
+        self.displaced.clear()
+        self.render_counts = counts
+        for key, n in counts.items():
+            self.render_totals[key] += n
+        if self.show_stats.get():
+            self.render_label.config(text=self.render_summary())
+
+    def render_summary(self):
+        last, total = self.render_counts, self.render_totals
+        return (f"Redraw (tiles): +{last['created']} ~{last['updated']} -{last['destroyed']}\n"
+                f"Session: +{total['created']} ~{total['updated']} -{total['destroyed']}")
+
+    def create_tile(self, i, j, value):
+        return Tile(self.canvas, value, i, j, self.tile_size, self.padding)
 
     def move(self, direction):
-        if self.animating: return
+        if self.autoplay.running():
+            return
+        if self.animating:
+            # Queue rather than drop input that arrives mid-animation
+            if len(self.move_queue) < MAX_QUEUED_MOVES:
+                self.move_queue.append(direction)
+            return
         
-        self.save_state()
+        self.finish_effects()
         
         # Calculate moves
         moves, new_grid, score_gain = self.calc_moves(self.grid, direction)
         
         if not moves and self.grid == new_grid:
-            self.history.pop() # No change
-            return
+            return # No change
+        self.save_state()
 
         self.animating = True
+        # Whatever was being searched is for the old board
+        self.hint = None
+        self.hint_worker.cancel()
+        if self.mode.get() == "Hint" and self.ponder_on.get() and self.engine.can_pack(new_grid):
+            # Start on the result board (and each spawn the user may enter) now,
+            # rather than after the animation
+            self.hint_worker.ponder(new_grid, self.hint_deadline_ms)
+        merged = [m['to'] for m in moves if m['merge']]
         
-        # Animation
-        steps = 10
-        delay = 10 # ms
+        if not self.animations_on.get():
+            self.finish_move(new_grid, merged)
+            return
         
-        # Helper to animate
-        def animate_step(step):
-            if step >= steps:
-                # End animation
-                self.grid = new_grid
-                self.sync_visuals()
-                
-                # Post-move logic
-                if self.mode.get() == "Normal":
-                    self.spawn_tile()
-                    self.sync_visuals() # Sync again for new tile
-                    self.info_label.config(text="") # No hint in normal mode
-                else:
-                    self.update_ai_hint()
-                
-                self.animating = False
-                return
-
-            progress = (step + 1) / steps
+        for m in moves:
+            r1, c1 = m['from']
+            tile = self.visual_grid[r1][c1]
+            if tile:
+                tile.lift()
+                self.displaced.add((r1, c1))
+        
+        # Clock-driven: each frame draws wherever the slide should be by now,
+        # so late frames skip ahead instead of stretching the animation
+        start = time.perf_counter()
+        
+        def animate_frame():
+            progress = min(1.0, (time.perf_counter() - start) * 1000 / SLIDE_MS)
             for m in moves:
                 # m = {from: (r,c), to: (r,c), merge: bool}
                 r1, c1 = m['from']
@@ -281,39 +912,95 @@ class Game2048Tool:
                     # Interpolate
                     x1, y1 = tile.get_coords(r1, c1)
                     x2, y2 = tile.get_coords(r2, c2)
-                    cur_x = x1 + (x2 - x1) * progress
-                    cur_y = y1 + (y2 - y1) * progress
-                    tile.frame.place(x=cur_x, y=cur_y)
+                    tile.move_to(x1 + (x2 - x1) * progress, y1 + (y2 - y1) * progress)
             
-            self.root.after(delay, lambda: animate_step(step + 1))
+            if progress >= 1.0:
+                self.finish_move(new_grid, merged)
+            else:
+                self.root.after(FRAME_MS, animate_frame)
+
+        animate_frame()
+
+    def finish_move(self, new_grid, merged):
+        self.grid = new_grid
+        
+        # Post-move logic
+        spawned = None
+        if self.mode.get() == "Normal":
+            spawned = self.spawn_tile()
+            self.info_label.config(text="") # No hint in normal mode
+        self.sync_visuals()
+        if self.mode.get() != "Normal":
+            self.update_ai_hint()
+        
+        self.animating = False
+        if self.animations_on.get():
+            self.start_effects(merged, spawned)
+        
+        while self.move_queue and not self.animating:
+            self.move(self.move_queue.popleft())
 
-        animate_step(0)
+    def start_effects(self, merged, spawned):
+        # Merged tiles pop, the new tile grows in; purely cosmetic, so a new
+        # move just snaps them to their final size
+        self.effects = [(self.visual_grid[r][c], "merge") for r, c in merged]
+        if spawned is not None:
+            self.effects.append((self.visual_grid[spawned[0]][spawned[1]], "spawn"))
+        self.effects = [(tile, kind) for tile, kind in self.effects if tile is not None]
+        if not self.effects:
+            return
+        start = time.perf_counter()
+        
+        def effect_frame():
+            progress = min(1.0, (time.perf_counter() - start) * 1000 / EFFECT_MS)
+            for tile, kind in self.effects:
+                if kind == "merge":
+                    scale = 1.0 + 0.2 * math.sin(math.pi * progress)
+                else:
+                    scale = 0.1 + 0.9 * progress
+                tile.place_at(tile.row, tile.col, scale)
+            if progress >= 1.0:
+                self.effect_job = None
+                self.effects = []
+            else:
+                self.effect_job = self.root.after(FRAME_MS, effect_frame)
+        
+        effect_frame()
+
+    def finish_effects(self):
+        if self.effect_job is not None:
+            self.root.after_cancel(self.effect_job)
+            self.effect_job = None
+        for tile, kind in self.effects:
+            tile.place_at(tile.row, tile.col)
+        self.effects = []
 
     def calc_moves(self, grid, direction):
         # Returns: list of moves, new_grid, score
         # Move format: {'from': (r,c), 'to': (r,c), 'merge': bool}
+        n = len(grid)
         moves = []
-        new_grid = [[0]*4 for _ in range(4)]
+        new_grid = [[0]*n for _ in range(n)]
         score = 0
-        merged = [[False]*4 for _ in range(4)]
+        merged = [[False]*n for _ in range(n)]
         
         # Define traversal order based on direction
         # We always iterate from the side we are moving TOWARDS
         if direction == "Up":
-            rows = range(4)
-            cols = range(4)
+            rows = range(n)
+            cols = range(n)
             dr, dc = -1, 0
         elif direction == "Down":
-            rows = range(3, -1, -1)
-            cols = range(4)
+            rows = range(n - 1, -1, -1)
+            cols = range(n)
             dr, dc = 1, 0
         elif direction == "Left":
-            rows = range(4)
-            cols = range(4)
+            rows = range(n)
+            cols = range(n)
             dr, dc = 0, -1
         elif direction == "Right":
-            rows = range(4)
-            cols = range(3, -1, -1)
+            rows = range(n)
+            cols = range(n - 1, -1, -1)
             dr, dc = 0, 1
             
         # Copy grid to temp working grid to track positions
@@ -323,15 +1010,15 @@ class Game2048Tool:
         # State tracking: where did each cell come from?
         # Let's do a simulation per column/row
         
-        source_grid = [[(r,c) for c in range(4)] for r in range(4)]
-        res_grid = [[0]*4 for _ in range(4)]
+        source_grid = [[(r,c) for c in range(n)] for r in range(n)]
+        res_grid = [[0]*n for _ in range(n)]
         
         # Generic logic using vectors
         # For each line (row or col depending on direction)
-        for i in range(4):
+        for i in range(n):
             # Extract line
             if direction in ["Left", "Right"]:
-                line = [(r, i) for r in range(4)] # Just placeholders, we need values
+                line = [(r, i) for r in range(n)] # Just placeholders, we need values
                 # Wait, this is getting complex. Let's stick to per-direction logic.
                 pass
         
@@ -339,9 +1026,9 @@ class Game2048Tool:
         # to ensure we capture "moves".
         
         if direction == "Left":
-            for r in range(4):
+            for r in range(n):
                 target_c = 0
-                for c in range(4):
+                for c in range(n):
                     if grid[r][c] != 0:
                         if target_c > 0 and res_grid[r][target_c-1] == grid[r][c] and not merged[r][target_c-1]:
                             # Merge
@@ -356,11 +1043,11 @@ class Game2048Tool:
                             target_c += 1
                             
         elif direction == "Right":
-            for r in range(4):
-                target_c = 3
-                for c in range(3, -1, -1):
+            for r in range(n):
+                target_c = n - 1
+                for c in range(n - 1, -1, -1):
                     if grid[r][c] != 0:
-                        if target_c < 3 and res_grid[r][target_c+1] == grid[r][c] and not merged[r][target_c+1]:
+                        if target_c < n - 1 and res_grid[r][target_c+1] == grid[r][c] and not merged[r][target_c+1]:
                             res_grid[r][target_c+1] *= 2
                             merged[r][target_c+1] = True
                             moves.append({'from': (r,c), 'to': (r, target_c+1), 'merge': True})
@@ -371,9 +1058,9 @@ class Game2048Tool:
                             target_c -= 1
 
         elif direction == "Up":
-            for c in range(4):
+            for c in range(n):
                 target_r = 0
-                for r in range(4):
+                for r in range(n):
                     if grid[r][c] != 0:
                         if target_r > 0 and res_grid[target_r-1][c] == grid[r][c] and not merged[target_r-1][c]:
                             res_grid[target_r-1][c] *= 2
@@ -386,11 +1073,11 @@ class Game2048Tool:
                             target_r += 1
 
         elif direction == "Down":
-            for c in range(4):
-                target_r = 3
-                for r in range(3, -1, -1):
+            for c in range(n):
+                target_r = n - 1
+                for r in range(n - 1, -1, -1):
                     if grid[r][c] != 0:
-                        if target_r < 3 and res_grid[target_r+1][c] == grid[r][c] and not merged[target_r+1][c]:
+                        if target_r < n - 1 and res_grid[target_r+1][c] == grid[r][c] and not merged[target_r+1][c]:
                             res_grid[target_r+1][c] *= 2
                             merged[target_r+1][c] = True
                             moves.append({'from': (r,c), 'to': (target_r+1, c), 'merge': True})
@@ -403,25 +1090,54 @@ class Game2048Tool:
         return moves, res_grid, score
 
     def update_ai_hint(self):
+        self.hint = None
         if self.mode.get() == "Normal":
+            self.hint_worker.cancel()
+            self.hint_worker.stop_pondering()
+            self.step_pending = False
             self.info_label.config(text="")
             return
             
         self.info_label.config(text="Calculating...")
-        self.root.update_idletasks() # Force UI update
-        best_move = self.get_best_move()
-        self.info_label.config(text=f"Best Move: {best_move}")
+        self.hint_worker.request(self.grid, self.hint_deadline_ms)
+
+    def on_ponder_toggle(self):
+        if not self.ponder_on.get():
+            self.hint_worker.stop_pondering()
+
+    def on_stats_toggle(self):
+        # Picked up by the worker at the start of its next search
+        self.search.collect_stats = self.show_stats.get()
+        if not self.show_stats.get():
+            self.stats_label.config(text="")
+        self.render_label.config(text=self.render_summary() if self.show_stats.get() else "")
+        self.update_ai_hint()
+
+    def on_hint_ready(self, grid, best_move, depth, stats):
+        if grid != self.grid or self.mode.get() != "Hint":
+            return
+        self.hint = (grid, best_move)
+        text = f"Best Move: {best_move} (depth {depth})"
+        if self.hint_worker.ponder_requests:
+            text += f"  ponder ready {self.hint_worker.ponder_rate():.0%}"
+        self.info_label.config(text=text)
+        if stats is not None and self.show_stats.get():
+            self.stats_label.config(text=stats.summary())
+        if self.step_pending:
+            self.step_pending = False
+            self.execute_step(best_move)
 
     # --- AI Logic (Reused) ---
-    def get_best_move(self):
-        # Optimized Dynamic Depth
-        empty_count = sum(row.count(0) for row in self.grid)
-        
-        # Base depth - go deep!
-        if empty_count >= 8: depth = 3
-        elif empty_count >= 6: depth = 4
-        elif empty_count >= 2: depth = 5
-        else: depth = 7 # Critical
+    def get_best_move(self, deadline_ms=None, grid=None):
+        if grid is None: grid = self.grid
+        
+        # Packed engine unless a hand-edited tile is too big for a cell
+        if nboard.engine_for(len(grid)).can_pack(grid):
+            return self.search.get_best_move(grid, deadline_ms)
+        
+        empty_count = sum(row.count(0) for row in grid)
+        depth = search.pick_depth(empty_count, len(grid))
+        self.search.depth_reached = depth
             
         best_score = -float('inf')
         best_move = "None"
@@ -430,7 +1146,7 @@ class Game2048Tool:
         # Pre-filter moves
         valid_moves = []
         for move in moves:
-            grid_copy = [row[:] for row in self.grid]
+            grid_copy = [row[:] for row in grid]
             grid_next, moved = self.simulate_move(grid_copy, move)
             if moved:
                 valid_moves.append((move, grid_next))
@@ -447,14 +1163,15 @@ class Game2048Tool:
 
     def simulate_move(self, grid, direction):
         # Simplified move logic just for AI
-        new_grid = [[0]*4 for _ in range(4)]
-        merged = [[False]*4 for _ in range(4)]
+        n = len(grid)
+        new_grid = [[0]*n for _ in range(n)]
+        merged = [[False]*n for _ in range(n)]
         moved = False
         
         if direction == "Left":
-            for r in range(4):
+            for r in range(n):
                 target_c = 0
-                for c in range(4):
+                for c in range(n):
                     if grid[r][c] != 0:
                         if target_c > 0 and new_grid[r][target_c-1] == grid[r][c] and not merged[r][target_c-1]:
                             new_grid[r][target_c-1] *= 2
@@ -465,11 +1182,11 @@ class Game2048Tool:
                             if c != target_c: moved = True
                             target_c += 1
         elif direction == "Right":
-            for r in range(4):
-                target_c = 3
-                for c in range(3, -1, -1):
+            for r in range(n):
+                target_c = n - 1
+                for c in range(n - 1, -1, -1):
                     if grid[r][c] != 0:
-                        if target_c < 3 and new_grid[r][target_c+1] == grid[r][c] and not merged[r][target_c+1]:
+                        if target_c < n - 1 and new_grid[r][target_c+1] == grid[r][c] and not merged[r][target_c+1]:
                             new_grid[r][target_c+1] *= 2
                             merged[r][target_c+1] = True
                             moved = True
@@ -478,9 +1195,9 @@ class Game2048Tool:
                             if c != target_c: moved = True
                             target_c -= 1
         elif direction == "Up":
-            for c in range(4):
+            for c in range(n):
                 target_r = 0
-                for r in range(4):
+                for r in range(n):
                     if grid[r][c] != 0:
                         if target_r > 0 and new_grid[target_r-1][c] == grid[r][c] and not merged[target_r-1][c]:
                             new_grid[target_r-1][c] *= 2
@@ -491,11 +1208,11 @@ class Game2048Tool:
                             if r != target_r: moved = True
                             target_r += 1
         elif direction == "Down":
-            for c in range(4):
-                target_r = 3
-                for r in range(3, -1, -1):
+            for c in range(n):
+                target_r = n - 1
+                for r in range(n - 1, -1, -1):
                     if grid[r][c] != 0:
-                        if target_r < 3 and new_grid[target_r+1][c] == grid[r][c] and not merged[target_r+1][c]:
+                        if target_r < n - 1 and new_grid[target_r+1][c] == grid[r][c] and not merged[target_r+1][c]:
                             new_grid[target_r+1][c] *= 2
                             merged[target_r+1][c] = True
                             moved = True
@@ -522,7 +1239,8 @@ class Game2048Tool:
             if not can_move: return self.evaluate(grid)
             return best_score
         else:
-            empty_cells = [(i, j) for i in range(4) for j in range(4) if grid[i][j] == 0]
+            n = len(grid)
+            empty_cells = [(i, j) for i in range(n) for j in range(n) if grid[i][j] == 0]
             if not empty_cells: return self.evaluate(grid)
             
             # Robust Sampling
@@ -549,25 +1267,26 @@ class Game2048Tool:
             return avg_score / len(cells_to_check)
 
     def evaluate(self, grid):
+        n = len(grid)
         empty_cells = sum(row.count(0) for row in grid)
         
         # Smoothness
         smoothness = 0
-        for r in range(4):
-            for c in range(4):
+        for r in range(n):
+            for c in range(n):
                 if grid[r][c] != 0:
                     val = math.log2(grid[r][c])
-                    if c < 3 and grid[r][c+1] != 0:
+                    if c < n - 1 and grid[r][c+1] != 0:
                         val_right = math.log2(grid[r][c+1])
                         smoothness -= abs(val - val_right)
-                    if r < 3 and grid[r+1][c] != 0:
+                    if r < n - 1 and grid[r+1][c] != 0:
                         val_down = math.log2(grid[r+1][c])
                         smoothness -= abs(val - val_down)
         
         # Monotonicity
         mono_left = 0; mono_right = 0; mono_up = 0; mono_down = 0
-        for r in range(4):
-            for c in range(3):
+        for r in range(n):
+            for c in range(n - 1):
                 current = grid[r][c]
                 next_val = grid[r][c+1]
                 if current > next_val: 
@@ -575,8 +1294,8 @@ class Game2048Tool:
                 else: 
                     mono_right += current - next_val
         
-        for c in range(4):
-            for r in range(3):
+        for c in range(n):
+            for r in range(n - 1):
                 current = grid[r][c]
                 next_val = grid[r+1][c]
                 if current > next_val: 
@@ -587,16 +1306,11 @@ class Game2048Tool:
         monotonicity = max(mono_left, mono_right) + max(mono_up, mono_down)
         
         # Snake Pattern Heuristic
-        snake_weights = [
-            [2**15, 2**14, 2**13, 2**12],
-            [2**8,  2**9,  2**10, 2**11],
-            [2**7,  2**6,  2**5,  2**4],
-            [2**0,  2**1,  2**2,  2**3]
-        ]
+        snake_weights = heuristic.snake_weights(n)
         
         snake_score = 0
-        for r in range(4):
-            for c in range(4):
+        for r in range(n):
+            for c in range(n):
                 if grid[r][c] != 0:
                     snake_score += grid[r][c] * snake_weights[r][c]
 